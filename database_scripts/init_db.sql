@@ -53,6 +53,8 @@ CREATE TABLE Compras (
     FOREIGN KEY (item_id) REFERENCES Items(item_id)
 );
 
+CREATE INDEX idx_compras_user ON Compras(user_id, compra_id);
+
 
 -- Tabla de Matriz de Similitud (Item-Item)
 CREATE TABLE MatrizSimilitud (
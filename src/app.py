@@ -6,6 +6,9 @@ from fastapi import FastAPI
 from src.routes import router
 from contextlib import asynccontextmanager
 from src.services.recommender import RecommenderService
+from src.database import async_engine
+from src.metrics import ServerTimingMiddleware, http_timings
+from src.config import SERVER_TIMING
 
 # Configuración de logging
 def configure_logging():
@@ -38,13 +41,17 @@ API REST desarrollada por el grupo 1 para el Trabajo Práctico Integrador de Cie
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("--- INICIANDO SISTEMA RECOMENDADOR DE ÁLBUMES ---") 
+    # El entrenamiento corre en segundo plano: la API atiende mientras tanto con el modelo persistido
+    svc = RecommenderService()
     try:
-        svc = RecommenderService()
-        svc.train_model()
+        svc.start_training()
     except Exception as e:
         logger.error(f"Error en entrenamiento inicial: {e}") 
     yield
     logger.info("--- APAGANDO SISTEMA ---")
+    svc.stop_training()
+    # Las conexiones asyncpg pertenecen a este event loop: se cierran junto con él
+    await async_engine.dispose()
 
 app = FastAPI(
     title="Sistema Recomendador de Álbumes",
@@ -56,5 +63,8 @@ app = FastAPI(
 
 app.include_router(router)
 
+# Duración por etapa de cada request (header Server-Timing) y por endpoint (ver /metrics)
+app.add_middleware(ServerTimingMiddleware, registry=http_timings, header=SERVER_TIMING)
+
 if __name__ == "__main__":
     uvicorn.run("src.app:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+from dotenv import load_dotenv
+
+# Parámetros del sistema configurables por variables de entorno
+load_dotenv()
+
+# Cada cuántas compras actualizadas incrementalmente se fuerza un re-entrenamiento completo (0 = nunca)
+FULL_RETRAIN_EVERY = int(os.getenv("FULL_RETRAIN_EVERY", "500"))
+
+# Poda del modelo Item-Item: vecinos más similares que se guardan por ítem (0 = todos)
+SIMILARITY_TOP_K = int(os.getenv("SIMILARITY_TOP_K", "0"))
+
+# Score mínimo para guardar una relación de similitud (0 = cualquier score positivo)
+SIMILARITY_MIN_SCORE = float(os.getenv("SIMILARITY_MIN_SCORE", "0"))
+
+# Segundos entre verificaciones de cambios en el catálogo para la matriz de características
+ITEM_FEATURES_TTL = int(os.getenv("ITEM_FEATURES_TTL", "300"))
+
+# Caché de recomendaciones: cantidad máxima de usuarios (0 = desactivada) y vigencia en segundos
+RECS_CACHE_SIZE = int(os.getenv("RECS_CACHE_SIZE", "10000"))
+RECS_CACHE_TTL = int(os.getenv("RECS_CACHE_TTL", "300"))
+
+# Máximo de ítems por pedido de recomendaciones (n o tamaño de página; los pedidos mayores se recortan,
+# 0 = sin límite) y largo del ranking completo que se calcula una vez y se recorre por páginas
+# en /user/{userId}/recommend/page
+RECS_MAX_N = int(os.getenv("RECS_MAX_N", "100"))
+RECS_PAGE_DEPTH = int(os.getenv("RECS_PAGE_DEPTH", "500"))
+
+# Rankings completos guardados para la paginación: cantidad máxima de usuarios (0 = se recalcula en cada página)
+RECS_PAGE_CACHE_SIZE = int(os.getenv("RECS_PAGE_CACHE_SIZE", "1000"))
+
+# Pool de conexiones a la BD (cada motor, síncrono y asíncrono, tiene el suyo)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))         # conexiones que se mantienen abiertas
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))  # conexiones extra permitidas bajo carga
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # segundos de espera por una conexión libre
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # segundos de vida de una conexión (-1 = sin límite)
+
+# Re-entrenamiento completo en segundo plano: como mucho uno cada N segundos (las compras se agrupan)
+TRAIN_MIN_INTERVAL = int(os.getenv("TRAIN_MIN_INTERVAL", "60"))
+
+# Cada cuántos segundos el proceso que entrena busca en Compras las compras registradas por otros workers
+TRAIN_POLL_INTERVAL = int(os.getenv("TRAIN_POLL_INTERVAL", "2"))
+
+# Snapshots del modelo en disco para arrancar sin re-entrenar: directorio y cantidad de versiones a conservar
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_KEEP = int(os.getenv("SNAPSHOT_KEEP", "3"))
+
+# Modelo Item-Item mapeado en memoria desde el snapshot: tipo de los scores (float32 o float16)
+# y cada cuántos segundos se busca un snapshot más nuevo (ej: escrito por otro worker)
+SIMILARITY_SCORE_DTYPE = os.getenv("SIMILARITY_SCORE_DTYPE", "float32")
+SNAPSHOT_POLL_INTERVAL = int(os.getenv("SNAPSHOT_POLL_INTERVAL", "10"))
+
+# Backend del Filtrado Colaborativo: 'item_item' (similitud Item-Item) o 'als' (factorización de matrices)
+CF_BACKEND = os.getenv("CF_BACKEND", "item_item")
+
+# Parámetros del backend 'als': factores latentes, iteraciones, regularización y peso de cada compra
+# en la confianza (c = 1 + alpha * compras)
+ALS_FACTORS = int(os.getenv("ALS_FACTORS", "32"))
+ALS_ITERATIONS = int(os.getenv("ALS_ITERATIONS", "15"))
+ALS_REGULARIZATION = float(os.getenv("ALS_REGULARIZATION", "0.1"))
+ALS_ALPHA = float(os.getenv("ALS_ALPHA", "10"))
+
+# Backend del Content-Based: 'genres' (coseno del perfil de géneros contra todo el catálogo) o
+# 'attributes' (vecinos precalculados por género, artista, década, país e idioma)
+CBF_BACKEND = os.getenv("CBF_BACKEND", "genres")
+
+# Índice de contenido del backend 'attributes': vecinos guardados por ítem (0 = todos) y peso de cada
+# atributo en la similitud ("atributo=peso" separados por coma; un peso 0 deja el atributo afuera)
+CONTENT_NEIGHBORS = int(os.getenv("CONTENT_NEIGHBORS", "50"))
+CONTENT_WEIGHTS = {
+    name.strip(): float(weight)
+    for name, weight in (
+        pair.split("=") for pair in os.getenv(
+            "CONTENT_WEIGHTS", "genero=1,artista=1,decada=0.5,pais=0.25,idioma=0.25"
+        ).split(",") if pair.strip()
+    )
+}
+
+# Header Server-Timing con la duración de cada etapa en las respuestas (1 = activado, 0 = desactivado)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+# Cargas en lote (POST /transactions/bulk y /users/bulk): máximo de registros por request (0 = sin límite)
+BULK_MAX_ROWS = int(os.getenv("BULK_MAX_ROWS", "1000000"))
@@ -1,9 +1,18 @@
 import os
+import re
+import time
+import functools
 import logging
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine, text
+from contextlib import contextmanager, asynccontextmanager
+from sqlalchemy import create_engine, text, event
+from sqlalchemy.exc import DisconnectionError
+from sqlalchemy.ext.asyncio import create_async_engine
 from dotenv import load_dotenv
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Sequence, Tuple
+from src.config import DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+from src.metrics import db_timings
 
 # Configuración de Logs
 logger = logging.getLogger(__name__)
@@ -22,14 +31,125 @@ if not all([DB_USER, DB_HOST, DB_NAME]): # validar que las variables críticas e
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+POOL_OPTIONS = {
+    "pool_pre_ping": True,
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+}
+
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
+
+# Motor asíncrono (asyncpg) para los endpoints 'async def': no ocupa un hilo mientras espera a la BD.
+#  - En autocommit: todo lo que pasa por él es una única sentencia (atómica por sí sola en PostgreSQL),
+#    así que no hace falta BEGIN/ROLLBACK alrededor de cada consulta.
+#  - Sin pre-ping: asyncpg marca la conexión como cerrada en cuanto el event loop ve el cierre del
+#    socket, así que se verifica al sacarla del pool sin ir a la BD (ver _check_async_connection).
+#  - Sin overflow: abrir una conexión asyncpg cuesta varias consultas de introspección, y bajo carga
+#    las conexiones extra se abrían y cerraban sin parar. Se mantiene abierta la capacidad completa.
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL, isolation_level="AUTOCOMMIT",
+    **{**POOL_OPTIONS, "pool_pre_ping": False, "pool_size": DB_POOL_SIZE + DB_MAX_OVERFLOW, "max_overflow": 0},
+)
+
+@event.listens_for(async_engine.sync_engine, "checkout")
+def _check_async_connection(dbapi_connection, connection_record, connection_proxy):
+    # Conexión cerrada por el servidor (reinicio, idle timeout): el pool la descarta y toma otra
+    if dbapi_connection.driver_connection.is_closed():
+        raise DisconnectionError("Conexión asyncpg cerrada")
+
+# =========================================================================
+#                  INSTRUMENTACIÓN (pool y duración de consultas)
+# =========================================================================
+
+_QUERY_KINDS = {"select", "insert", "update", "delete", "with", "copy"}
+
+# Primera tabla que toca la sentencia (después de FROM / INTO / UPDATE / JOIN, o la del COPY)
+_QUERY_TABLE = re.compile(r"\b(?:from|into|update|join)\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+_COPY_TABLE = re.compile(r"^\s*copy\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+
+@functools.lru_cache(maxsize=1024)
+def _query_name(statement: str):
+    """
+    Nombre de la serie de tiempos de una sentencia: 'query.<tipo>.<tabla>' (ej: 'query.select.compras').
+    Las sentencias se repiten (mismo texto, otros parámetros), así que el resultado se cachea.
+    """
+    words = statement.split(None, 1)
+    kind = words[0].lower() if words else ""
+    kind = kind if kind in _QUERY_KINDS else "other"
+    if kind == "copy":
+        matches = list(_COPY_TABLE.finditer(statement))
+    else:
+        # Preferimos la tabla del nivel principal a la de una subconsulta (ej: ARRAY(SELECT ... FROM ...))
+        matches = sorted(
+            _QUERY_TABLE.finditer(statement),
+            key=lambda m: statement.count("(", 0, m.start()) - statement.count(")", 0, m.start()),
+        )
+    return f"query.{kind}.{matches[0].group(1).lower()}" if matches else f"query.{kind}"
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["query_start"] = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info.pop("query_start", None)
+    if start is not None:
+        db_timings.observe(_query_name(statement), time.perf_counter() - start)
+
+# El motor asíncrono ejecuta sobre un motor síncrono interno: los mismos eventos cubren ambos
+for _engine in (engine, async_engine.sync_engine):
+    event.listen(_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(_engine, "after_cursor_execute", _after_cursor_execute)
+
+@contextmanager
+def _connect():
+    """
+    engine.connect() midiendo cuánto se esperó por una conexión del pool.
+    """
+    start = time.perf_counter()
+    with engine.connect() as connection:
+        db_timings.observe("pool_checkout", time.perf_counter() - start)
+        yield connection
+
+@asynccontextmanager
+async def _connect_async():
+    start = time.perf_counter()
+    async with async_engine.connect() as connection:
+        db_timings.observe("pool_checkout_async", time.perf_counter() - start)
+        yield connection
+
+def _pool_status(pool):
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
+def get_db_stats() -> Dict[str, Any]:
+    """
+    Configuración y estado actual de ambos pools, más los tiempos de checkout y de consultas.
+    """
+    return {
+        "pool_config": {
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+            "pool_recycle": DB_POOL_RECYCLE,
+        },
+        "pool": _pool_status(engine.pool),
+        "pool_async": _pool_status(async_engine.pool),
+        "timings": db_timings.snapshot(),
+    }
 
 def get_data_as_dataframe(query_str: str, params: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
     """
     Ejecuta una consulta SELECT y devuelve los resultados en un DataFrame de Pandas.
     """
     try:
-        with engine.connect() as connection:
+        with _connect() as connection:
             df = pd.read_sql(text(query_str), connection, params=params)
             return df
     except Exception as e:
@@ -42,7 +162,7 @@ def execute_non_query(query_str: str, params: Optional[Dict[str, Any]] = None) -
     Maneja transacciones automáticamente. Retorna la cantidad de filas afectadas.
     """
     try:
-        with engine.connect() as connection:
+        with _connect() as connection:
             trans = connection.begin()
             try:
                 result = connection.execute(text(query_str), params or {})
@@ -55,4 +175,169 @@ def execute_non_query(query_str: str, params: Optional[Dict[str, Any]] = None) -
                 raise e # Re-lanzamos el error para que la API se entere que falló
     except Exception as e:
         logger.error(f"Error de conexión durante escritura: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+def execute_returning(query_str: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Sequence]]:
+    """
+    Escritura con RETURNING (ej: INSERT ... RETURNING id) en una transacción.
+    Devuelve las filas retornadas, o None si falló (se hizo rollback).
+    """
+    try:
+        with _connect() as connection:
+            with connection.begin():
+                rows = connection.execute(text(query_str), params or {}).fetchall()
+        logger.info("Operación de escritura exitosa.")
+        return rows
+    except Exception as e:
+        logger.error(f"Error en escritura, se hizo rollback: {e}")
+        return None
+
+def copy_in_transaction(copy_sql: str, buffer, before: Optional[List[str]] = None, after: Optional[List[str]] = None) -> int:
+    """
+    Ejecuta en UNA sola transacción: sentencias previas, un COPY ... FROM STDIN leyendo
+    desde un buffer en memoria, y sentencias posteriores.
+    Si algo falla se hace rollback de todo. Retorna la cantidad de filas copiadas.
+    """
+    start = time.perf_counter()
+    connection = engine.raw_connection()
+    db_timings.observe("pool_checkout", time.perf_counter() - start)
+    try:
+        cursor = connection.cursor()
+        try:
+            for statement in before or []:
+                cursor.execute(statement)
+
+            buffer.seek(0)
+            with db_timings.timer(_query_name(copy_sql)):
+                cursor.copy_expert(copy_sql, buffer)
+            copied = cursor.rowcount
+
+            for statement in after or []:
+                cursor.execute(statement)
+
+            connection.commit()
+            logger.info(f"COPY exitoso: {copied} filas.")
+            return copied
+        except Exception as e:
+            connection.rollback()
+            logger.error(f"Error en COPY, se hizo rollback: {e}")
+            raise e
+        finally:
+            cursor.close()
+    finally:
+        connection.close()
+
+# =========================================================================
+#            LECTURAS LIVIANAS (tuplas / arrays, sin armar un DataFrame)
+# =========================================================================
+
+def fetch_rows(query_str: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Sequence]]:
+    """
+    Ejecuta una consulta SELECT y devuelve las filas como tuplas (None si hubo error).
+    Para las consultas chicas del camino caliente, donde armar un DataFrame cuesta más que la consulta.
+    """
+    try:
+        with _connect() as connection:
+            return connection.execute(text(query_str), params or {}).fetchall()
+    except Exception as e:
+        logger.error(f"Error ejecutando consulta de lectura: {e}")
+        return None
+
+def fetch_scalar(query_str: str, params: Optional[Dict[str, Any]] = None, default: Any = None) -> Any:
+    """
+    Primera columna de la primera fila (ej: un COUNT o un MAX). 'default' si no hay filas o hubo error.
+    """
+    rows = fetch_rows(query_str, params)
+    if not rows or rows[0][0] is None:
+        return default
+    return rows[0][0]
+
+def fetch_arrays(query_str: str, params: Optional[Dict[str, Any]] = None,
+                 dtypes: Optional[Sequence] = None) -> Optional[Tuple[np.ndarray, ...]]:
+    """
+    Ejecuta una consulta SELECT y devuelve un array de NumPy por columna (None si hubo error).
+    'dtypes' fija el tipo de cada columna (recomendado: con 0 filas no hay de dónde inferirlo).
+    """
+    try:
+        with _connect() as connection:
+            result = connection.execute(text(query_str), params or {})
+            return _rows_to_arrays(result.fetchall(), len(result.keys()), dtypes)
+    except Exception as e:
+        logger.error(f"Error ejecutando consulta de lectura: {e}")
+        return None
+
+def _rows_to_arrays(rows, n_columns: int, dtypes: Optional[Sequence]):
+    columns = list(zip(*rows)) if rows else [()] * n_columns
+    dtypes = dtypes or [None] * n_columns
+    return tuple(np.array(column, dtype=dtype) for column, dtype in zip(columns, dtypes))
+
+# =========================================================================
+#                  ACCESO ASÍNCRONO (SQLAlchemy async + asyncpg)
+# =========================================================================
+
+async def get_data_as_dataframe_async(query_str: str, params: Optional[Dict[str, Any]] = None) -> Optional[pd.DataFrame]:
+    """
+    Igual que get_data_as_dataframe, pero sin bloquear el event loop mientras espera a la BD.
+    Varias consultas independientes se pueden lanzar a la vez con asyncio.gather.
+    """
+    try:
+        async with _connect_async() as connection:
+            result = await connection.execute(text(query_str), params or {})
+            return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    except Exception as e:
+        logger.error(f"Error ejecutando consulta de lectura (async): {e}")
+        return None
+
+async def execute_non_query_async(query_str: str, params: Optional[Dict[str, Any]] = None) -> int:
+    """
+    Igual que execute_non_query (INSERT, UPDATE, DELETE) sobre el motor asíncrono.
+    Una única sentencia: en autocommit se confirma completa o, si falla, no se aplica nada.
+    Retorna la cantidad de filas afectadas.
+    """
+    try:
+        async with _connect_async() as connection:
+            result = await connection.execute(text(query_str), params or {})
+        logger.info("Operación de escritura exitosa.")
+        return result.rowcount
+    except Exception as e:
+        logger.error(f"Error en escritura (async), no se aplicó: {e}")
+        return 0
+
+async def execute_returning_async(query_str: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Sequence]]:
+    """
+    Versión asíncrona de execute_returning (una única sentencia, atómica por sí sola).
+    """
+    try:
+        async with _connect_async() as connection:
+            result = await connection.execute(text(query_str), params or {})
+            rows = result.fetchall()
+        logger.info("Operación de escritura exitosa.")
+        return rows
+    except Exception as e:
+        logger.error(f"Error en escritura (async), no se aplicó: {e}")
+        return None
+
+async def fetch_rows_async(query_str: str, params: Optional[Dict[str, Any]] = None) -> Optional[List[Sequence]]:
+    """
+    Versión asíncrona de fetch_rows.
+    """
+    try:
+        async with _connect_async() as connection:
+            result = await connection.execute(text(query_str), params or {})
+            return result.fetchall()
+    except Exception as e:
+        logger.error(f"Error ejecutando consulta de lectura (async): {e}")
+        return None
+
+async def fetch_arrays_async(query_str: str, params: Optional[Dict[str, Any]] = None,
+                             dtypes: Optional[Sequence] = None) -> Optional[Tuple[np.ndarray, ...]]:
+    """
+    Versión asíncrona de fetch_arrays.
+    """
+    try:
+        async with _connect_async() as connection:
+            result = await connection.execute(text(query_str), params or {})
+            return _rows_to_arrays(result.fetchall(), len(result.keys()), dtypes)
+    except Exception as e:
+        logger.error(f"Error ejecutando consulta de lectura (async): {e}")
+        return None
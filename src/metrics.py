@@ -0,0 +1,233 @@
+import time
+import bisect
+import asyncio
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+# Tiempos de la request en curso (para el header Server-Timing); None fuera de una request HTTP
+_current_trace = contextvars.ContextVar("request_trace", default=None)
+
+class DurationHistogram:
+    """
+    Histograma de duraciones con buckets fijos (en milisegundos).
+    Guarda cantidad, suma y máximo; los percentiles se estiman con el límite superior del bucket.
+    """
+
+    BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(self.BUCKETS_MS) + 1)  # el último es "+Inf"
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.bucket_counts[bisect.bisect_left(self.BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q: float):
+        if self.count == 0:
+            return 0.0
+        target = q * self.count
+        accumulated = 0
+        for idx, bucket_count in enumerate(self.bucket_counts):
+            accumulated += bucket_count
+            if accumulated >= target:
+                return min(self.BUCKETS_MS[idx], self.max_ms) if idx < len(self.BUCKETS_MS) else self.max_ms
+        return self.max_ms
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "avg_ms": self.total_ms / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max_ms,
+        }
+
+class DurationRegistry:
+    """
+    Conjunto de histogramas de duración identificados por nombre (ej: 'pool_checkout', 'query.select.compras').
+    Seguro para usar desde varios hilos. Cada observación también se suma a la request en curso, si hay una.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}  # { nombre: DurationHistogram }
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            histogram = self._series.get(name)
+            if histogram is None:
+                histogram = self._series[name] = DurationHistogram()
+            histogram.observe(seconds)
+
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, seconds)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        """
+        Decorador: registra la duración de cada llamada (funciones normales o 'async def').
+        """
+        def decorator(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await fn(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def histograms(self):
+        """
+        Copia de los histogramas: [(nombre, cantidades por bucket, cantidad, suma en ms)].
+        """
+        with self._lock:
+            return [
+                (name, list(h.bucket_counts), h.count, h.total_ms)
+                for name, h in sorted(self._series.items())
+            ]
+
+    def snapshot(self):
+        with self._lock:
+            return {name: histogram.snapshot() for name, histogram in sorted(self._series.items())}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+class RequestTrace:
+    """
+    Duraciones acumuladas por etapa durante una request (se repite una etapa = se suma).
+    """
+
+    def __init__(self):
+        self.stages = {}  # { nombre: [segundos, veces] }
+
+    def add(self, name: str, seconds: float):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+    def server_timing(self, total_seconds: float):
+        """
+        Valor del header Server-Timing: 'cf;dur=0.153, query.select.compras;dur=2.1;desc="x3", total;dur=4.2'.
+        """
+        parts = []
+        for name, (seconds, times) in self.stages.items():
+            part = f"{name};dur={seconds * 1000:.3f}"
+            parts.append(part + f';desc="x{times}"' if times > 1 else part)
+        parts.append(f"total;dur={total_seconds * 1000:.3f}")
+        return ", ".join(parts)
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI: junta las duraciones de las etapas de cada request, las devuelve en el header
+    Server-Timing y registra la duración total por endpoint (método + ruta) en 'registry'.
+    """
+
+    def __init__(self, app, registry, header: bool = True):
+        self.app = app
+        self.registry = registry
+        self.header = header
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if self.header and message["type"] == "http.response.start":
+                value = trace.server_timing(time.perf_counter() - start)
+                message = {**message, "headers": [*message.get("headers", []), (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.registry.observe(f"{scope['method']} {route}", time.perf_counter() - start)
+
+def render_prometheus(families: list):
+    """
+    Histogramas en el formato de texto de Prometheus. Cada familia es
+    (métrica, descripción, registro, nombres de labels): el nombre de cada serie del registro
+    se parte por espacios en los valores de esos labels.
+    """
+    lines = []
+    for metric, description, registry, label_names in families:
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for name, bucket_counts, count, total_ms in registry.histograms():
+            values = name.split(" ", len(label_names) - 1)
+            labels = ",".join(f'{label}="{_escape_label(value)}"' for label, value in zip(label_names, values))
+            accumulated = 0
+            for bound_ms, bucket_count in zip(DurationHistogram.BUCKETS_MS, bucket_counts):
+                accumulated += bucket_count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound_ms / 1000:g}"}} {accumulated}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"{metric}_sum{{{labels}}} {total_ms / 1000:.9g}")
+            lines.append(f"{metric}_count{{{labels}}} {count}")
+    return "\n".join(lines) + "\n"
+
+def _escape_label(value: str):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# Tiempos de acceso a la BD: espera por una conexión del pool y duración de cada consulta
+db_timings = DurationRegistry()
+
+# Tiempos de cada etapa del recomendador (contexto, CF, CBF, combinación, enriquecimiento, ...)
+stage_timings = DurationRegistry()
+
+# Duración total de las requests HTTP por endpoint ('GET /user/{userId}/recommend')
+http_timings = DurationRegistry()
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def render_metrics():
+    """
+    Todas las métricas del proceso para el endpoint /metrics.
+    """
+    return render_prometheus([
+        ("recommender_http_request_duration_seconds", "Duración de las requests HTTP por endpoint.",
+         http_timings, ("method", "route")),
+        ("recommender_stage_duration_seconds", "Duración de cada etapa del recomendador.",
+         stage_timings, ("stage",)),
+        ("recommender_db_duration_seconds", "Espera por conexiones del pool y duración de consultas por tipo y tabla.",
+         db_timings, ("operation",)),
+    ])
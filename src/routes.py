@@ -1,7 +1,15 @@
-from fastapi import APIRouter, HTTPException, Query, Path
+import json
+import base64
+import asyncio
+import binascii
+from fastapi import APIRouter, HTTPException, Query, Path, Request
+from fastapi.responses import Response
 from typing import List, Optional, Dict, Any
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from src.services.recommender import RecommenderService
+from src.services.ingestion import TransactionParser, UserParser, BulkParseError, TooManyRowsError, content_format
+from src.metrics import PROMETHEUS_CONTENT_TYPE
+from src.config import BULK_MAX_ROWS, RECS_MAX_N
 
 router = APIRouter(tags=["Sistema recomendador"])
 
@@ -46,6 +54,34 @@ class Item(BaseModel):
 class ItemArray(BaseModel):
     items: List[Item]
 
+class ItemPage(BaseModel):
+    items: List[Item]
+    next_cursor: Optional[str] = None  # None en la última página
+    restarted: bool = False  # el ranking cambió desde la página anterior: ésta es de nuevo la primera
+
+class BatchRequest(BaseModel):
+    user_ids: List[int]
+    n: int = Field(..., ge=1)  # se recorta a RECS_MAX_N
+
+    model_config = {
+        "json_schema_extra": {
+            "examples": [
+                {
+                    "user_ids": [1, 6, 30],
+                    "n": 5
+                }
+            ]
+        }
+    }
+
+class UserRecommendations(BaseModel):
+    user_id: int
+    items: List[Item]
+
+class BatchResponse(BaseModel):
+    results: List[UserRecommendations]
+    not_found: List[int]
+
 class Error(BaseModel):
     code: str
     message: str
@@ -62,13 +98,13 @@ def health_check():
     return {"status": "ok", "message": "API de Recomendaciones - ACTIVA"}
 
 @router.post("/user", status_code=200, summary="Crear usuario", tags=["Sistema recomendador"])
-def create_user(user: UserInput):
+async def create_user(user: UserInput):
     """
     Crea un nuevo usuario.
     En 'attributes' ingresar los IDs de los géneros preferidos (mínimo 3, máximo 5)
     """
     try:
-        new_id = service.create_user(user.username, user.attributes)
+        new_id = await service.create_user_async(user.username, user.attributes)
         
         return User(
             id=new_id,
@@ -78,12 +114,33 @@ def create_user(user: UserInput):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/users/bulk", tags=["Sistema recomendador"], summary="Importar usuarios en lote")
+async def import_users_bulk(request: Request):
+    """
+    Crea muchos usuarios con sus géneros favoritos en una sola transacción (ej: migración de cuentas).
+    El body puede ser un array JSON o NDJSON con el formato de POST /user (más 'fecha_creacion'
+    opcional en 'attributes'), o CSV con columnas username,generos_id,fecha_creacion (géneros separados por ';').
+    Devuelve los ids asignados en el mismo orden que los usuarios recibidos.
+    """
+    batch = await _read_bulk_body(request, UserParser)
+
+    try:
+        summary = await asyncio.to_thread(service.import_users_bulk, batch)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudieron importar los usuarios: {str(e)}")
+
+    if summary["unknown_genre_ids"]:
+        raise HTTPException(status_code=422, detail={"message": "Hay géneros inexistentes; no se creó ningún usuario.", **summary})
+
+    return summary
+
+
 @router.get("/user/{userId}", response_model=User, summary="Obtener usuario")
-def get_user(userId: int = Path(..., description="ID del usuario")):
+async def get_user(userId: int = Path(..., description="ID del usuario")):
     """
     Obtener los datos del usuario, incluyendo sus géneros favoritos.
     """
-    user_data = service.get_user_data(userId)
+    user_data = await service.get_user_data_async(userId)
     
     if not user_data:
         raise HTTPException(status_code=404, detail="User not found")
@@ -103,37 +160,209 @@ def get_user(userId: int = Path(..., description="ID del usuario")):
     )
 
 @router.get("/user/{userId}/recommend", response_model=ItemArray, summary="Recomendar")
-def get_recommendations(
+async def get_recommendations(
     userId: int = Path(..., description="ID del usuario"),
-    n: int = Query(..., description="Numero de items a recomendar")
+    n: int = Query(..., ge=1, description="Numero de items a recomendar (como mucho RECS_MAX_N)")
 ):
     """
     Obtener n recomendaciones para un usuario determinado.
     """
-    # Verificamos si existe el usuario primero
-    user_data = service.get_user_data(userId)
-    if not user_data:
+    n = _limit_n(n)
+
+    # Si ya se calcularon para este usuario, versión del modelo y historial de compras, se sirven desde la caché
+    cached = await service.get_cached_recommendations_async(userId, n)
+    if cached is not None:
+        return ItemArray(items=cached)
+
+    # El contexto del usuario y los candidatos CF se consultan en paralelo (None si el usuario no existe)
+    try:
+        recommendations = await service.get_recommendations_async(userId, top_k=n)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+    if recommendations is None:
         raise HTTPException(status_code=412, detail="User not found")
 
+    return ItemArray(items=recommendations)
+
+
+@router.get("/user/{userId}/recommend/page", response_model=ItemPage, summary="Recomendar por páginas")
+async def get_recommendation_page(
+    userId: int = Path(..., description="ID del usuario"),
+    size: int = Query(20, ge=1, description="Items por página (como mucho RECS_MAX_N)"),
+    cursor: Optional[str] = Query(None, description="'next_cursor' de la página anterior (vacío = primera página)")
+):
+    """
+    Recomendaciones paginadas para scroll infinito: el ranking completo se calcula una vez y las
+    páginas siguientes (con el 'next_cursor' recibido) se sirven recortándolo.
+    Si el ranking cambió desde la página anterior, se devuelve de nuevo la primera con 'restarted'.
+    """
+    size = _limit_n(size)
+    offset, ranking_id = _decode_cursor(cursor, userId) if cursor else (0, None)
+
     try:
-        recommendations = service.get_recommendations(userId, top_k=n)
-        return ItemArray(items=recommendations)
-        
+        page = await service.get_recommendation_page_async(userId, offset, size, ranking_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
 
+    if page is None:
+        raise HTTPException(status_code=412, detail="User not found")
+
+    next_cursor = _encode_cursor(userId, page.offset + size, page.ranking_id) if page.has_more else None
+    return ItemPage(items=page.items, next_cursor=next_cursor, restarted=page.restarted)
+
+
+@router.post("/recommend/batch", response_model=BatchResponse, summary="Recomendar en lote")
+def get_batch_recommendations(batch: BatchRequest):
+    """
+    Obtener n recomendaciones para cada uno de los usuarios indicados en una sola llamada.
+    Los usuarios inexistentes se informan en 'not_found'.
+    """
+    try:
+        results, missing = service.get_batch_recommendations(batch.user_ids, top_k=_limit_n(batch.n))
+        return BatchResponse(
+            results=[UserRecommendations(user_id=uid, items=items) for uid, items in results.items()],
+            not_found=missing
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+@router.get("/stats/cache", summary="Estadísticas de la caché de recomendaciones")
+def get_cache_stats():
+    """
+    Aciertos, fallos, desalojos e invalidaciones de la caché de recomendaciones.
+    """
+    return service.get_cache_stats()
+
+
+@router.get("/stats/db", summary="Estadísticas del pool de conexiones y de las consultas")
+def get_db_stats():
+    """
+    Configuración y ocupación de los pools de conexiones, tiempos de espera por una conexión
+    y duración de las consultas (por tipo de sentencia).
+    """
+    return service.get_db_stats()
+
+
+@router.get("/stats/training", summary="Estado del entrenamiento en segundo plano")
+def get_training_stats():
+    """
+    Compras pendientes de aplicar al modelo, re-entrenamientos realizados y tiempo desde el último.
+    """
+    return service.get_training_stats()
+
+
+@router.get("/metrics", summary="Métricas en formato Prometheus")
+def get_metrics():
+    """
+    Histogramas de duración por endpoint, por etapa del recomendador y por consulta a la BD,
+    en el formato de texto de Prometheus (para que lo lea directamente un scraper).
+    """
+    return Response(content=service.get_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 
 @router.post("/user/{userId}/transaction", tags=["Sistema recomendador"], summary="Registrar compra")
-def register_purchase(
+async def register_purchase(
     userId: int = Path(..., description="ID del usuario que compra"), 
     item_id: int = Query(..., description="ID del ítem comprado")
 ):
     """
-    Registra una compra para actualizar el historial y re-entrenar el modelo incrementalmente.
+    Registra una compra para actualizar el historial. El modelo se actualiza incrementalmente en segundo plano.
     """
-    success = service.add_transaction(userId, item_id)
+    success = await service.add_transaction_async(userId, item_id)
     
     if success:
         return {"message": "Compra registrada exitosamente"}
     else:
-        raise HTTPException(status_code=500, detail="No se pudo registrar la transacción.")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="No se pudo registrar la transacción.")
+
+
+@router.post("/transactions/bulk", tags=["Sistema recomendador"], summary="Registrar compras en lote")
+async def register_purchases_bulk(
+    request: Request,
+    on_invalid: str = Query("reject", pattern="^(reject|skip)$",
+                            description="'reject': si hay ids inexistentes no se registra nada; 'skip': se descartan esas filas")
+):
+    """
+    Registra muchas compras (user_id, item_id, timestamp opcional) en una sola transacción.
+    El body puede ser un array JSON (application/json), un objeto JSON por línea (application/x-ndjson)
+    o CSV (text/csv, columnas user_id,item_id,timestamp); NDJSON y CSV se leen a medida que llegan.
+    El modelo se re-entrena una sola vez al final, en segundo plano.
+    """
+    batch = await _read_bulk_body(request, TransactionParser)
+
+    try:
+        summary = await asyncio.to_thread(service.add_transactions_bulk, batch, on_invalid == "skip")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"No se pudieron registrar las compras: {str(e)}")
+
+    if on_invalid == "reject" and (summary["unknown_user_ids"] or summary["unknown_item_ids"]):
+        raise HTTPException(status_code=422, detail={"message": "Hay usuarios o ítems inexistentes; no se registró ninguna compra.", **summary})
+
+    return summary
+
+
+def _limit_n(n: int):
+    """
+    Recorta la cantidad pedida a RECS_MAX_N (0 = sin límite) en lugar de rechazar el pedido:
+    un cliente que pide más recibe como mucho RECS_MAX_N ítems.
+    """
+    return min(n, RECS_MAX_N) if RECS_MAX_N > 0 else n
+
+def _encode_cursor(user_id: int, offset: int, ranking_id: str):
+    """
+    Cursor opaco de paginación: usuario, posición e identificador del ranking recorrido,
+    en JSON + base64 (URL-safe).
+    """
+    payload = json.dumps({"u": user_id, "o": offset, "r": ranking_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, user_id: int):
+    """
+    (posición, identificador del ranking) guardados en el cursor (400 si está mal formado o es de
+    otro usuario). Los cursores sin identificador siguen desde la posición sin comprobar el ranking.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = payload["o"]
+        ranking_id = payload.get("r")
+        valid = (
+            payload["u"] == user_id and isinstance(offset, int) and offset >= 0
+            and (ranking_id is None or isinstance(ranking_id, str))
+        )
+    except (ValueError, binascii.Error, TypeError, KeyError, AttributeError):
+        valid = False
+    if not valid:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return offset, ranking_id
+
+# Bytes del body que se juntan antes de parsearlos en un hilo (menos saltos entre hilos que por chunk)
+BULK_FEED_BYTES = 1 << 20
+
+async def _read_bulk_body(request: Request, parser_class):
+    """
+    Lee el body de una carga en lote a medida que llega (el formato sale del Content-Type).
+    El parseo va en un hilo, de a bloques de BULK_FEED_BYTES, para no frenar el event loop.
+    """
+    fmt = content_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Content-Type debe ser application/json, application/x-ndjson o text/csv")
+
+    parser = parser_class(fmt, max_rows=BULK_MAX_ROWS)
+    try:
+        pending, pending_bytes = [], 0
+        async for chunk in request.stream():
+            pending.append(chunk)
+            pending_bytes += len(chunk)
+            if pending_bytes >= BULK_FEED_BYTES:
+                await asyncio.to_thread(parser.feed, b"".join(pending))
+                pending, pending_bytes = [], 0
+        if pending:
+            await asyncio.to_thread(parser.feed, b"".join(pending))
+        return await asyncio.to_thread(parser.close)
+    except TooManyRowsError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except BulkParseError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,129 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from src.config import RECS_CACHE_SIZE, RECS_CACHE_TTL, RECS_PAGE_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+class RecommendationCache:
+    """
+    Caché LRU con TTL de listas de recomendaciones ya enriquecidas.
+
+    Por usuario guarda la lista más larga calculada junto con el 'n' pedido, la versión del modelo y
+    el compra_id de la última compra del usuario con que se calculó. Un pedido con n menor se sirve
+    recortando esa lista; si la versión del modelo cambió, venció el TTL o la última compra del usuario
+    ya es otra, la entrada ya no sirve.
+
+    La última compra se lee de Compras, así que una compra registrada por cualquier worker invalida
+    la entrada en todos. 'invalidate_user' además la descarta en el momento dentro del proceso
+    (ej: cuando el modelo se actualizó con la compra sin cambiar de versión).
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # { user_id: (n, model_version, última compra, creado, items) }
+        self._invalidated_at = {}      # { user_id: momento de la última invalidación }
+
+        # Contadores para dimensionar la caché
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def contains(self, user_id: int):
+        """
+        True si hay una entrada del usuario (vigente o no): la última compra se lee de la BD para
+        llamar a 'get' sólo en ese caso. Si no hay, cuenta como fallo.
+        """
+        if self.max_entries <= 0:
+            return False
+
+        with self._lock:
+            if user_id in self._entries:
+                return True
+            self.misses += 1
+            return False
+
+    def get(self, user_id: int, n: int, model_version, last_purchase: int):
+        if self.max_entries <= 0:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                cached_n, cached_version, cached_purchase, created, items = entry
+                expired = time.monotonic() - created > self.ttl_seconds
+
+                if cached_version != model_version or cached_purchase != last_purchase or expired:
+                    del self._entries[user_id]
+                # Sirve si se pidió al menos n, o si la lista ya estaba completa (había menos ítems que los pedidos)
+                elif n <= cached_n or len(items) < cached_n:
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return items[:n]
+
+            self.misses += 1
+            return None
+
+    def put(self, user_id: int, n: int, model_version, last_purchase: int, items: list, computed_since: float):
+        """
+        Guarda una lista calculada a partir de 'computed_since' (time.monotonic() al empezar) con el
+        historial que termina en la compra 'last_purchase'.
+        Si el usuario fue invalidado mientras se calculaba, el resultado se descarta.
+        """
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            if self._invalidated_at.get(user_id, 0.0) >= computed_since:
+                return
+
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] == model_version and entry[2] == last_purchase and entry[0] >= n:
+                return
+
+            self._entries[user_id] = (n, model_version, last_purchase, time.monotonic(), list(items))
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            now = time.monotonic()
+            self._invalidated_at[user_id] = now
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+
+            # Las marcas viejas ya no pueden afectar a ningún cálculo en curso
+            if len(self._invalidated_at) > self.max_entries:
+                limit = now - self.ttl_seconds
+                self._invalidated_at = {uid: t for uid, t in self._invalidated_at.items() if t >= limit}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+# Caché compartida por todas las instancias del servicio dentro del proceso
+recommendation_cache = RecommendationCache(max_entries=RECS_CACHE_SIZE, ttl_seconds=RECS_CACHE_TTL)
+
+# Rankings completos sin enriquecer ((item_id, score) por ítem) que se recorren por páginas
+ranking_cache = RecommendationCache(max_entries=RECS_PAGE_CACHE_SIZE, ttl_seconds=RECS_CACHE_TTL)
@@ -0,0 +1,170 @@
+import time
+import logging
+import threading
+import numpy as np
+from src.services.scoring import genre_norms, positions_of
+from src.database import get_data_as_dataframe, fetch_rows
+from src.config import ITEM_FEATURES_TTL
+from src.metrics import stage_timings
+
+logger = logging.getLogger(__name__)
+
+class ItemFeatures:
+    """
+    Foto inmutable de la matriz de características Item-Género.
+    Fila i = item_ids[i], columna j = genre_ids[j], valor 1 si el ítem tiene ese género.
+    """
+
+    def __init__(self, item_ids, genre_ids, matrix):
+        self.item_ids = item_ids
+        self.genre_ids = genre_ids
+        self.matrix = matrix
+        self.item_index = {int(iid): idx for idx, iid in enumerate(item_ids.tolist())}
+
+        # Norma de cada fila: el coseno es un producto matriz-vector sobre estas normas (ver genre_cosine)
+        self.norms = genre_norms(matrix)
+
+        # Posición de cada item_id en un array denso (los ids son enteros SERIAL), -1 si no está
+        self.row_lookup = np.full(int(item_ids.max()) + 1 if len(item_ids) else 0, -1, dtype=np.int64)
+        self.row_lookup[item_ids] = np.arange(len(item_ids))
+
+        # Firmas: combinaciones de géneros distintas del catálogo (unas pocas, aunque haya muchos ítems).
+        # El coseno y el refuerzo por preferencias dependen sólo de la firma, así que se calculan por
+        # firma. Las filas de cada firma quedan contiguas y en orden de catálogo (formato CSR).
+        self.signatures, signature_of_row = np.unique(matrix, axis=0, return_inverse=True)
+        self.signature_of_row = signature_of_row.reshape(-1).astype(np.int64)
+        self.signature_norms = genre_norms(self.signatures)
+        self.signature_members = np.argsort(self.signature_of_row, kind="stable")
+        self.signature_sizes = np.bincount(self.signature_of_row, minlength=len(self.signatures))
+        self.signature_indptr = np.zeros(len(self.signatures) + 1, dtype=np.int64)
+        np.cumsum(self.signature_sizes, out=self.signature_indptr[1:])
+
+    def rows_for(self, item_ids):
+        """
+        Índices de fila de los ítems dados (ignora los que no tienen metadatos).
+        """
+        rows = self.rows_of(np.fromiter(item_ids, dtype=np.int64, count=len(item_ids)))
+        return rows[rows >= 0]
+
+    def has_any_genre(self, item_ids, genre_ids):
+        """
+        Máscara booleana: True si el ítem tiene al menos uno de los géneros dados.
+        Ítems sin metadatos quedan en False.
+        """
+        rows = self.rows_of(item_ids)
+        preferred = self.preferred_signatures(genre_ids)
+        if preferred is None:
+            return np.zeros(len(rows), dtype=bool)
+
+        # Gather por candidato sobre la máscara de firmas (no se recorre el catálogo)
+        return (rows >= 0) & preferred[self.signature_of_row[np.maximum(rows, 0)]]
+
+    def preferred_signatures(self, genre_ids):
+        """
+        Máscara por firma: True si la combinación tiene al menos uno de los géneros dados.
+        None si ninguno de los géneros existe.
+        """
+        genre_cols = positions_of(self.genre_ids, np.fromiter(genre_ids, dtype=self.genre_ids.dtype))
+        if len(genre_cols) == 0:
+            return None
+        return (self.signatures[:, genre_cols] != 0).any(axis=1)
+
+    def rows_of(self, item_ids):
+        """
+        Fila de cada ítem (vectorizado), -1 para los que no tienen metadatos.
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        inside = (item_ids >= 0) & (item_ids < len(self.row_lookup))
+        rows = np.full(len(item_ids), -1, dtype=np.int64)
+        rows[inside] = self.row_lookup[item_ids[inside]]
+        return rows
+
+class ItemFeatureCache:
+    """
+    Matriz Item-Género compartida por el proceso. Se carga una vez y se refresca
+    cuando vence el TTL y el catálogo cambió, o cuando se invalida explícitamente.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._features = None
+        self._fingerprint = None
+        self._loaded_at = 0.0
+
+    def get(self):
+        features = self._features
+        if features is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return features
+
+        with self._lock:
+            # Otro hilo pudo haberla refrescado mientras esperábamos
+            if self._features is not None and time.monotonic() - self._loaded_at < self.ttl_seconds:
+                return self._features
+
+            fingerprint = self._catalog_fingerprint()
+            if self._features is None or fingerprint != self._fingerprint:
+                features = self._load()
+                if features is not None:
+                    self._features = features
+                    self._fingerprint = fingerprint
+            self._loaded_at = time.monotonic()
+            return self._features
+
+    def snapshot_state(self):
+        """
+        Matriz actual y huella del catálogo con la que se cargó (para el snapshot del modelo).
+        """
+        features = self.get()
+        return features, self._fingerprint
+
+    def seed(self, features: ItemFeatures, fingerprint):
+        """
+        Instala una matriz ya calculada (ej: desde un snapshot). Al vencer el TTL se compara
+        la huella contra la BD como siempre y, si el catálogo cambió, se recarga.
+        """
+        with self._lock:
+            self._features = features
+            self._fingerprint = fingerprint
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = 0.0
+            self._fingerprint = None
+
+    def _catalog_fingerprint(self):
+        # Consulta liviana: si no cambió, no hace falta recargar la matriz
+        sql = """
+            SELECT COUNT(*) as total, COALESCE(SUM(item_id * 1000 + genero_id), 0) as checksum
+            FROM ItemGeneros
+        """
+        rows = fetch_rows(sql)
+        if not rows:
+            return None
+        return int(rows[0].total), int(rows[0].checksum)
+
+    @stage_timings.timed("catalog.load")
+    def _load(self):
+        logger.info("[Catálogo] Cargando matriz de características Item-Género...")
+        sql = """
+            SELECT i.item_id, ig.genero_id
+            FROM Items i
+            JOIN ItemGeneros ig ON i.item_id = ig.item_id
+        """
+        df = get_data_as_dataframe(sql)
+        if df is None or df.empty:
+            logger.warning("[Catálogo] No se pudieron cargar los géneros de los ítems.")
+            return None
+
+        item_ids, item_codes = np.unique(df["item_id"].to_numpy(), return_inverse=True)
+        genre_ids, genre_codes = np.unique(df["genero_id"].to_numpy(), return_inverse=True)
+
+        matrix = np.zeros((len(item_ids), len(genre_ids)), dtype=np.float32)
+        matrix[item_codes, genre_codes] = 1.0
+
+        logger.info(f"[Catálogo] Matriz cargada: {len(item_ids)} ítems x {len(genre_ids)} géneros.")
+        return ItemFeatures(item_ids, genre_ids, matrix)
+
+# Caché compartida por todas las instancias del servicio dentro del proceso
+item_feature_cache = ItemFeatureCache(ttl_seconds=ITEM_FEATURES_TTL)
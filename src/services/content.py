@@ -0,0 +1,251 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+import numpy as np
+import scipy.sparse as sp
+from src.database import get_data_as_dataframe
+from src.config import CONTENT_NEIGHBORS, CONTENT_WEIGHTS
+from src.services.scoring import top_k_mask, positions_of, csr_row_offsets
+
+logger = logging.getLogger(__name__)
+
+# =========================================================================
+#              ÍNDICE DE CONTENIDO POR ATRIBUTOS (CBF_BACKEND=attributes)
+# =========================================================================
+#
+# Cada ítem es una fila dispersa con un bloque por atributo: géneros (varios por ítem), artista,
+# década, país e idioma (uno cada uno, one-hot). Cada bloque se normaliza (L2) y se multiplica por
+# sqrt(peso), y la fila completa se vuelve a normalizar: el producto de dos filas es el promedio,
+# ponderado por CONTENT_WEIGHTS, del coseno de cada atributo.
+#
+# Al entrenar se precalculan los CONTENT_NEIGHBORS vecinos más similares de cada ítem. Por request,
+# el score de un candidato j es  sum_h s(h, j) / |sum_h m_h|  sobre las compras h del usuario: el
+# coseno entre el perfil (promedio de sus compras) y el ítem, restringido a los vecinos guardados.
+# Sólo se recorren las listas de vecinos de lo comprado, no el catálogo.
+
+ATTRIBUTES = ("genero", "artista", "decada", "pais", "idioma")
+
+_ContentState = namedtuple("_ContentState", "item_ids matrix neighbors has_content")
+
+def item_attributes(df_items):
+    """
+    Atributos del catálogo desde las filas de Items (item_id, artista, anio, pais, idioma):
+    devuelve (item_ids ordenados, { atributo: valores alineados }) con el año agrupado por década.
+    """
+    df_items = df_items.sort_values("item_id")
+    years = df_items["anio"].tolist()
+    return df_items["item_id"].to_numpy(dtype=np.int64), {
+        "artista": df_items["artista"].tolist(),
+        "decada": [int(y) // 10 * 10 if y is not None and y == y else None for y in years],
+        "pais": df_items["pais"].tolist(),
+        "idioma": df_items["idioma"].tolist(),
+    }
+
+def build_content_matrix(item_ids, genre_item_ids, genre_ids, attributes: dict, weights: dict):
+    """
+    Matriz (ítems x valores de atributos) en CSR float32, con filas normalizadas.
+    'item_ids' ordenados; 'attributes' = { atributo: valores alineados con item_ids } (None = sin dato).
+    Los ítems sin ningún atributo quedan con la fila vacía.
+    """
+    n_items = len(item_ids)
+    blocks = []
+    for name in ATTRIBUTES:
+        weight = float(weights.get(name, 0.0))
+        if weight <= 0:
+            continue
+
+        if name == "genero":
+            rows = np.searchsorted(item_ids, genre_item_ids)
+            known = rows < n_items
+            known[known] = item_ids[rows[known]] == genre_item_ids[known]
+            rows, values = rows[known], np.asarray(genre_ids)[known]
+        else:
+            values = np.asarray(attributes[name], dtype=object)
+            rows = np.flatnonzero(np.array([v is not None for v in values], dtype=bool))
+            values = values[rows].astype(str)
+
+        if len(rows) == 0:
+            continue
+        _, cols = np.unique(values, return_inverse=True)
+        block = sp.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_items, int(cols.max()) + 1))
+        block.sum_duplicates()
+        block.data[:] = 1.0
+        blocks.append(_normalize_rows(block) * np.sqrt(weight))
+
+    if not blocks:
+        return sp.csr_matrix((n_items, 0), dtype=np.float32)
+    return _normalize_rows(sp.hstack(blocks, format="csr")).astype(np.float32)
+
+def top_content_neighbors(matrix, k: int, min_score: float = 0.0, block_cells: int = 2**24):
+    """
+    Los k vecinos más similares de cada ítem (sin sí mismo, score > min_score; k = 0: todos) en una
+    matriz CSR (ítems x ítems). Se calcula por bloques de filas para no armar la similitud completa.
+    """
+    n_items = matrix.shape[0]
+    matrix_t = matrix.T.tocsr()
+    rows_per_block = max(1, block_cells // max(n_items, 1))
+
+    rows, cols, scores = [], [], []
+    for start in range(0, n_items, rows_per_block):
+        stop = min(n_items, start + rows_per_block)
+        block = (matrix[start:stop] @ matrix_t).toarray().astype(np.float64)
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        block[block <= min_score] = -np.inf
+        keep = top_k_mask(block, k) if k > 0 else np.isfinite(block)
+        block_rows, block_cols = np.nonzero(keep)
+        rows.append(block_rows + start)
+        cols.append(block_cols)
+        scores.append(block[block_rows, block_cols])
+
+    neighbors = sp.csr_matrix(
+        (np.concatenate(scores).astype(np.float32), (np.concatenate(rows), np.concatenate(cols))),
+        shape=(n_items, n_items),
+    )
+    neighbors.sort_indices()
+    return neighbors
+
+class ContentIndex:
+    """
+    Vecinos de contenido precalculados (CBF_BACKEND=attributes), alternativa al coseno por géneros.
+    Se construye al entrenar (o desde un snapshot) y se reemplaza completo; por request sólo se leen
+    las filas de vecinos de los ítems comprados.
+    """
+
+    def __init__(self, neighbors: int = CONTENT_NEIGHBORS, weights: dict = None):
+        self._lock = threading.Lock()
+        self._state = None
+        self.neighbors = neighbors
+        self.weights = dict(CONTENT_WEIGHTS if weights is None else weights)
+        self.ready = False
+
+    @property
+    def params(self):
+        """
+        Parámetros con los que se arma el índice (se guardan en el manifest del snapshot).
+        """
+        return {"neighbors": self.neighbors, "weights": self.weights}
+
+    def rebuild(self):
+        """
+        Recalcula el índice desde Items/ItemGeneros.
+        """
+        df_items = get_data_as_dataframe("SELECT item_id, artista, anio, pais, idioma FROM Items")
+        df_genres = get_data_as_dataframe("SELECT item_id, genero_id FROM ItemGeneros")
+        if df_items is None or df_genres is None:
+            logger.warning("[Contenido] No se pudo reconstruir el índice de contenido.")
+            return
+
+        item_ids, attributes = item_attributes(df_items)
+        self.build(item_ids, df_genres["item_id"].to_numpy(dtype=np.int64), df_genres["genero_id"].to_numpy(dtype=np.int64), attributes)
+
+    def build(self, item_ids, genre_item_ids, genre_ids, attributes: dict):
+        """
+        Arma matriz de contenido y vecinos desde los atributos del catálogo ('item_ids' ordenados).
+        """
+        start = time.perf_counter()
+        matrix = build_content_matrix(item_ids, genre_item_ids, genre_ids, attributes, self.weights)
+        neighbors = top_content_neighbors(matrix, self.neighbors)
+        self.publish(item_ids, matrix, neighbors)
+        logger.info(f"[Contenido] Índice armado: {len(item_ids)} ítems x {matrix.shape[1]} valores de atributos, "
+                    f"{neighbors.nnz} vecinos en {time.perf_counter() - start:.2f}s.")
+
+    def publish(self, item_ids, matrix, neighbors):
+        matrix = sp.csr_matrix(matrix, dtype=np.float32)
+        state = _ContentState(
+            item_ids=np.asarray(item_ids, dtype=np.int64),
+            matrix=matrix,
+            neighbors=sp.csr_matrix(neighbors, dtype=np.float32),
+            has_content=np.diff(matrix.indptr) > 0,
+        )
+        with self._lock:
+            self._state = state
+            self.ready = True
+
+    def to_arrays(self):
+        state = self._state
+        if state is None:
+            return {}
+        return {
+            "content_item_ids": state.item_ids,
+            "content_matrix_indptr": state.matrix.indptr.astype(np.int64),
+            "content_matrix_indices": state.matrix.indices.astype(np.int32),
+            "content_matrix_data": state.matrix.data,
+            "content_neighbors_indptr": state.neighbors.indptr.astype(np.int64),
+            "content_neighbors_indices": state.neighbors.indices.astype(np.int32),
+            "content_neighbors_data": state.neighbors.data,
+            "content_n_features": np.array([state.matrix.shape[1]], dtype=np.int64),
+        }
+
+    def load_arrays(self, arrays: dict):
+        """
+        Publica el índice guardado en un snapshot. False si el snapshot no lo tiene.
+        """
+        if "content_neighbors_data" not in arrays:
+            return False
+        n_items = len(arrays["content_item_ids"])
+        matrix = sp.csr_matrix(
+            (arrays["content_matrix_data"], arrays["content_matrix_indices"], arrays["content_matrix_indptr"]),
+            shape=(n_items, int(arrays["content_n_features"][0])),
+        )
+        neighbors = sp.csr_matrix(
+            (arrays["content_neighbors_data"], arrays["content_neighbors_indices"], arrays["content_neighbors_indptr"]),
+            shape=(n_items, n_items),
+        )
+        self.publish(arrays["content_item_ids"], matrix, neighbors)
+        return True
+
+    @property
+    def item_ids(self):
+        state = self._state
+        return state.item_ids if state is not None else np.array([], dtype=np.int64)
+
+    @property
+    def matrix(self):
+        state = self._state
+        return state.matrix if state is not None else sp.csr_matrix((0, 0), dtype=np.float32)
+
+    @property
+    def neighbor_matrix(self):
+        state = self._state
+        return state.neighbors if state is not None else sp.csr_matrix((0, 0), dtype=np.float32)
+
+    def candidates(self, purchased, min_score: float = 0.1):
+        """
+        Candidatos CBF de un usuario desde las listas de vecinos de sus compras.
+        Devuelve (item_ids ordenados, scores), sin lo ya comprado y con score > min_score.
+        """
+        state = self._state
+        if state is None or not purchased:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        rows = positions_of(state.item_ids, np.fromiter(purchased, dtype=np.int64, count=len(purchased)))
+        rows = rows[state.has_content[rows]]
+        if len(rows) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        # Norma del perfil (suma de las filas de contenido de lo comprado)
+        offsets = csr_row_offsets(state.matrix.indptr, rows)
+        profile = np.bincount(state.matrix.indices[offsets], weights=state.matrix.data[offsets].astype(np.float64))
+        profile_norm = np.sqrt(np.dot(profile, profile))
+
+        # Suma de las listas de vecinos, por candidato (gather directo de las filas del CSR)
+        offsets = csr_row_offsets(state.neighbors.indptr, rows)
+        if len(offsets) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        cols, inverse = np.unique(state.neighbors.indices[offsets], return_inverse=True)
+        scores = np.bincount(inverse, weights=state.neighbors.data[offsets].astype(np.float64), minlength=len(cols)) / profile_norm
+
+        # Sin lo ya comprado ('cols' está ordenado: búsqueda binaria de cada compra)
+        keep = scores > min_score
+        positions = np.minimum(np.searchsorted(cols, rows), len(cols) - 1)
+        keep[positions[cols[positions] == rows]] = False
+        return state.item_ids[cols[keep]], scores[keep]
+
+def _normalize_rows(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1), dtype=np.float64)).ravel()
+    scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return sp.diags(scale) @ matrix
+
+# Índice compartido por todas las instancias del servicio dentro del proceso
+content_index = ContentIndex()
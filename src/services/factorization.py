@@ -0,0 +1,254 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+import numpy as np
+import scipy.sparse as sp
+from src.config import ALS_FACTORS, ALS_ITERATIONS, ALS_REGULARIZATION, ALS_ALPHA
+from src.services.scoring import top_k_indices, lookup_sorted, positions_of
+
+logger = logging.getLogger(__name__)
+
+# =========================================================================
+#            ALS PARA FEEDBACK IMPLÍCITO (Hu, Koren y Volinsky, 2008)
+# =========================================================================
+#
+# Cada compra es una preferencia p_ui = 1 con confianza c_ui = 1 + alpha * (veces que la compró);
+# lo no comprado es p_ui = 0 con confianza 1. Se buscan factores X (usuarios) e Y (ítems) que minimicen
+#     sum_ui c_ui (p_ui - x_u . y_i)^2 + lambda (|X|^2 + |Y|^2)
+# alternando: con Y fijo, cada x_u resuelve (Y^T C_u Y + lambda I) x_u = Y^T C_u p_u, y viceversa.
+# Como Y^T C_u Y = Y^T Y + Y^T (C_u - I) Y, sólo los ítems comprados aportan al término variable.
+#
+# Los sistemas se resuelven con unos pocos pasos de Gradiente Conjugado para TODOS los usuarios a la vez
+# (operaciones dispersas sobre las compras, sin un bucle por usuario) partiendo de la solución anterior.
+# El costo por iteración crece con compras x factores, no con ítems^2.
+
+def build_confidence_matrix(user_ids, item_ids, alpha: float):
+    """
+    Matriz de confianza (usuarios x ítems) en CSR: 1 + alpha * compras en las celdas compradas.
+    Devuelve la matriz, los user_id de cada fila, los item_id de cada columna y las compras por usuario.
+    """
+    users, user_codes = np.unique(np.asarray(user_ids), return_inverse=True)
+    items, item_codes = np.unique(np.asarray(item_ids), return_inverse=True)
+    counts = sp.csr_matrix(
+        (np.ones(len(user_codes), dtype=np.float32), (user_codes, item_codes)), shape=(len(users), len(items))
+    )
+    counts.sum_duplicates()
+    user_counts = np.asarray(counts.sum(axis=1)).ravel().astype(np.int64)
+
+    confidence = counts.copy()
+    confidence.data = 1.0 + alpha * confidence.data
+    return confidence, users, items, user_counts
+
+def train_implicit_als(confidence, factors: int, regularization: float, iterations: int,
+                       cg_steps: int = 3, seed: int = 42):
+    """
+    Entrena los factores de usuarios e ítems sobre la matriz de confianza (CSR usuarios x ítems).
+    Devuelve (factores de usuarios, factores de ítems) en float32.
+    """
+    rng = np.random.default_rng(seed)
+    n_users, n_items = confidence.shape
+    user_factors = rng.normal(0, 0.01, (n_users, factors)).astype(np.float32)
+    item_factors = rng.normal(0, 0.01, (n_items, factors)).astype(np.float32)
+
+    confidence = sp.csr_matrix(confidence, dtype=np.float32)
+    confidence_t = confidence.T.tocsr()
+    for _ in range(iterations):
+        _least_squares_cg(confidence, user_factors, item_factors, regularization, cg_steps)
+        _least_squares_cg(confidence_t, item_factors, user_factors, regularization, cg_steps)
+    return user_factors, item_factors
+
+def _least_squares_cg(confidence, X, Y, regularization: float, cg_steps: int):
+    """
+    Mejora X (en el lugar) con 'cg_steps' pasos de Gradiente Conjugado por fila, todas a la vez.
+    """
+    YtY = Y.T @ Y + regularization * np.eye(Y.shape[1], dtype=Y.dtype)
+
+    # Residuo r = b - A x, con b_u = Y^T C_u p_u
+    r = confidence @ Y - X @ YtY - _confidence_term(confidence, X, Y)
+    p = r.copy()
+    rs_old = np.einsum("ij,ij->i", r, r)
+    for _ in range(cg_steps):
+        Ap = p @ YtY + _confidence_term(confidence, p, Y)
+        denominator = np.einsum("ij,ij->i", p, Ap)
+        alpha = np.divide(rs_old, denominator, out=np.zeros_like(rs_old), where=denominator > 0)
+        X += alpha[:, None] * p
+        r -= alpha[:, None] * Ap
+        rs_new = np.einsum("ij,ij->i", r, r)
+        beta = np.divide(rs_new, rs_old, out=np.zeros_like(rs_new), where=rs_old > 0)
+        p = r + beta[:, None] * p
+        rs_old = rs_new
+
+def _confidence_term(confidence, V, Y):
+    """
+    Fila u: sum_i (c_ui - 1) (y_i . v_u) y_i, sólo sobre las celdas compradas (Y^T (C_u - I) Y v_u).
+    """
+    rows = np.repeat(np.arange(confidence.shape[0]), np.diff(confidence.indptr))
+    dots = np.einsum("ij,ij->i", V[rows], Y[confidence.indices])
+    weighted = sp.csr_matrix(((confidence.data - 1.0) * dots, confidence.indices, confidence.indptr), shape=confidence.shape)
+    return weighted @ Y
+
+def fold_in_user(item_factors, gram, item_rows, counts, regularization: float, alpha: float):
+    """
+    Factores de un usuario a partir de sus compras con los ítems fijos (un único sistema f x f):
+    sirve para usuarios nuevos o con compras posteriores al entrenamiento, sin re-entrenar.
+    'gram' es Y^T Y precalculado; 'item_rows' las filas de sus ítems y 'counts' las veces que compró cada uno.
+    """
+    Y_u = item_factors[item_rows].astype(np.float64)
+    c = 1.0 + alpha * np.asarray(counts, dtype=np.float64)
+    A = gram + (Y_u.T * (c - 1.0)) @ Y_u + regularization * np.eye(gram.shape[0])
+    b = Y_u.T @ c
+    return np.linalg.solve(A, b)
+
+# =========================================================================
+#                  MODELO DE FACTORES EN MEMORIA (CF EN PROCESO)
+# =========================================================================
+
+_FactorState = namedtuple("_FactorState", [
+    "user_ids", "user_factors", "user_counts", "item_ids", "item_factors", "gram", "regularization", "alpha",
+])
+
+class FactorModel:
+    """
+    Backend CF por factorización de matrices (CF_BACKEND=als), alternativa al Item-Item.
+
+    Guarda factores compactos de usuarios e ítems (float32, usuarios x f e ítems x f) y puntúa todo el
+    catálogo con un solo producto matriz-vector por usuario. Si el usuario compró algo después del
+    entrenamiento (o no estaba), sus factores se recalculan en el momento desde el contexto (fold-in),
+    así que las compras nuevas se reflejan sin actualizar el modelo.
+
+    Expone 'ready', 'version' y 'updates_since_rebuild' como el índice de co-ocurrencias, para que el
+    scheduler de entrenamiento y la caché lo traten igual.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self.ready = False
+        self.updates_since_rebuild = 0
+        self.version = 0  # aumenta con cada modelo publicado
+
+    def publish(self, user_ids, user_factors, user_counts, item_ids, item_factors, regularization: float, alpha: float):
+        """
+        Reemplaza el modelo completo (nueva versión).
+        """
+        item_factors = np.asarray(item_factors, dtype=np.float32)
+        state = _FactorState(
+            user_ids=np.asarray(user_ids, dtype=np.int64),
+            user_factors=np.asarray(user_factors, dtype=np.float32),
+            user_counts=np.asarray(user_counts, dtype=np.int64),
+            item_ids=np.asarray(item_ids, dtype=np.int64),
+            item_factors=item_factors,
+            gram=item_factors.T.astype(np.float64) @ item_factors.astype(np.float64),
+            regularization=float(regularization),
+            alpha=float(alpha),
+        )
+        with self._lock:
+            self._state = state
+            self.ready = True
+            self.updates_since_rebuild = 0
+            self.version += 1
+
+    def add_purchase(self):
+        """
+        Una compra nueva no cambia los factores (el fold-in la toma del contexto); sólo cuenta
+        para pedir el re-entrenamiento completo cada FULL_RETRAIN_EVERY compras.
+        """
+        with self._lock:
+            self.updates_since_rebuild += 1
+
+    def to_arrays(self):
+        state = self._state
+        if state is None:
+            return {}
+        return {
+            "als_user_ids": state.user_ids,
+            "als_user_factors": state.user_factors,
+            "als_user_counts": state.user_counts,
+            "als_item_ids": state.item_ids,
+            "als_item_factors": state.item_factors,
+        }
+
+    def load_arrays(self, arrays: dict, regularization: float, alpha: float):
+        """
+        Publica el modelo guardado en un snapshot. False si el snapshot no tiene factores.
+        """
+        if "als_item_factors" not in arrays:
+            return False
+        self.publish(
+            arrays["als_user_ids"], arrays["als_user_factors"], arrays["als_user_counts"],
+            arrays["als_item_ids"], arrays["als_item_factors"], regularization, alpha,
+        )
+        return True
+
+    @property
+    def item_ids(self):
+        state = self._state
+        return state.item_ids if state is not None else np.array([], dtype=np.int64)
+
+    @property
+    def item_factors(self):
+        state = self._state
+        return state.item_factors if state is not None else np.zeros((0, 0), dtype=np.float32)
+
+    def user_vectors(self, user_ids: list, purchase_lists: list):
+        """
+        Factores de varios usuarios (matriz usuarios x f): los guardados si el usuario no compró nada
+        desde el entrenamiento; si no, fold-in desde sus compras.
+        """
+        state = self._state
+        if state is None:
+            return np.zeros((len(user_ids), 0), dtype=np.float32)
+        vectors = np.zeros((len(user_ids), state.item_factors.shape[1]), dtype=np.float32)
+        for row, (user_id, purchases) in enumerate(zip(user_ids, purchase_lists)):
+            vectors[row] = self._user_vector(state, user_id, purchases)
+        return vectors
+
+    def candidates(self, user_id: int, purchases: list, limit: int):
+        """
+        Los 'limit' ítems no comprados de mayor score x_u . y_i (positivo), como (item_ids, scores)
+        ordenados por score (desempate por item_id).
+        """
+        state = self._state
+        if state is None or not purchases:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        vector = self._user_vector(state, user_id, purchases)
+        scores = (state.item_factors @ vector).astype(np.float64)
+
+        # Fuera lo ya comprado y lo que no tiene afinidad positiva
+        scores[positions_of(state.item_ids, np.asarray(purchases, dtype=np.int64))] = -np.inf
+        scores[scores <= 0] = -np.inf
+
+        order = top_k_indices(scores, limit, tie_keys=state.item_ids)
+        return state.item_ids[order], scores[order]
+
+    @staticmethod
+    def _user_vector(state, user_id: int, purchases: list):
+        row = positions_of(state.user_ids, np.array([user_id], dtype=np.int64))
+        if len(row) > 0 and state.user_counts[row[0]] == len(purchases):
+            return state.user_factors[row[0]]
+
+        items, counts = np.unique(np.asarray(purchases, dtype=np.int64), return_counts=True)
+        positions, known = lookup_sorted(state.item_ids, items)
+        if not known.any():
+            return np.zeros(state.item_factors.shape[1], dtype=np.float32)
+        vector = fold_in_user(state.item_factors, state.gram, positions[known], counts[known],
+                              state.regularization, state.alpha)
+        return vector.astype(np.float32)
+
+def fit_factors(user_ids, item_ids, factors: int = ALS_FACTORS, regularization: float = ALS_REGULARIZATION,
+                alpha: float = ALS_ALPHA, iterations: int = ALS_ITERATIONS, seed: int = 42):
+    """
+    Entrenamiento completo desde los pares (user_id, item_id) de Compras.
+    Devuelve (user_ids, factores de usuarios, compras por usuario, item_ids, factores de ítems).
+    """
+    start = time.perf_counter()
+    confidence, users, items, user_counts = build_confidence_matrix(user_ids, item_ids, alpha)
+    user_factors, item_factors = train_implicit_als(confidence, factors, regularization, iterations, seed=seed)
+    logger.info(f"[ALS] {len(users)} usuarios x {len(items)} ítems, {factors} factores, "
+                f"{iterations} iteraciones en {time.perf_counter() - start:.2f}s.")
+    return users, user_factors, user_counts, items, item_factors
+
+# Estado compartido por todas las instancias del servicio dentro del proceso
+factor_model = FactorModel()
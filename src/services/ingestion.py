@@ -0,0 +1,317 @@
+import io
+import csv
+import json
+import re
+from datetime import datetime
+import numpy as np
+
+# Lectura de cargas en lote: compras (POST /transactions/bulk) y usuarios (POST /users/bulk).
+#
+# Formatos aceptados (según el Content-Type del request):
+#  - application/json:      array de objetos
+#  - application/x-ndjson:  un objeto JSON por línea
+#  - text/csv:              una fila por registro (el encabezado es opcional)
+#
+# NDJSON y CSV se procesan a medida que llegan los bloques del body: sólo se guardan las filas
+# ya convertidas, nunca el body completo. El JSON array se parsea al final (no es divisible por líneas).
+
+FORMATS = {
+    "application/json": "json",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "text/csv": "csv",
+}
+
+class BulkParseError(ValueError):
+    """
+    Body mal formado. 'line' es la línea (NDJSON/CSV) o la posición en el array (JSON), desde 1.
+    """
+
+    def __init__(self, message: str, line: int = None, unit: str = "Línea"):
+        super().__init__(f"{unit} {line}: {message}" if line is not None else message)
+        self.line = line
+
+class TooManyRowsError(BulkParseError):
+    pass
+
+def content_format(content_type: str):
+    """
+    Formato del body según el Content-Type (None si no es uno de los aceptados).
+    """
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return FORMATS.get(media_type)
+
+class BulkParser:
+    """
+    Parser incremental: feed(bloque) por cada parte del body y close() al final.
+    Cada subclase define sus columnas (CSV_COLUMNS, las primeras REQUIRED obligatorias),
+    cómo leer un objeto JSON (_record_values), cómo convertir una fila (_convert) y el lote (_build).
+    """
+
+    CSV_COLUMNS = ()
+    REQUIRED = 0
+    JSON_UNIT = "Registro"  # cómo se nombra la posición en el array en los errores
+
+    def __init__(self, fmt: str, max_rows: int = 0):
+        if fmt not in FORMATS.values():
+            raise ValueError(f"Formato no soportado: {fmt}")
+        self.fmt = fmt
+        self.max_rows = max_rows
+        self._rows = []
+        self._pending = b""  # línea incompleta del bloque anterior (o todo el body, en JSON)
+        self._line = 0
+        self._unit = self.JSON_UNIT if fmt == "json" else "Línea"
+        self._csv_header_checked = False
+
+    def feed(self, chunk: bytes):
+        if self.fmt == "json":
+            self._pending += chunk
+            return
+
+        lines = (self._pending + chunk).split(b"\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._parse_line(line)
+
+    def close(self):
+        if self.fmt == "json":
+            self._parse_json_array(self._pending)
+        elif self._pending:
+            self._parse_line(self._pending)
+        self._pending = b""
+        return self._build()
+
+    # -------------------------------
+    #        Por formato
+    # -------------------------------
+
+    def _parse_line(self, raw: bytes):
+        self._line += 1
+        try:
+            line = raw.decode("utf-8").strip()
+        except UnicodeDecodeError:
+            raise BulkParseError("no es texto UTF-8", self._line)
+        if not line:
+            return
+
+        if self.fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise BulkParseError(f"JSON inválido ({e.msg})", self._line)
+            self._add_record(record, self._line)
+            return
+
+        fields = next(csv.reader([line]))
+        if not self._csv_header_checked:
+            self._csv_header_checked = True
+            if fields and fields[0].strip().lower() == self.CSV_COLUMNS[0]:
+                header = tuple(f.strip().lower() for f in fields)
+                if len(header) < self.REQUIRED or header != self.CSV_COLUMNS[:len(header)]:
+                    raise BulkParseError(f"encabezado inválido, se espera {','.join(self.CSV_COLUMNS)}", self._line)
+                return
+        if not self.REQUIRED <= len(fields) <= len(self.CSV_COLUMNS):
+            raise BulkParseError(
+                f"se esperan de {self.REQUIRED} a {len(self.CSV_COLUMNS)} columnas y hay {len(fields)}", self._line
+            )
+        self._add(fields + [None] * (len(self.CSV_COLUMNS) - len(fields)), self._line)
+
+    def _parse_json_array(self, body: bytes):
+        try:
+            records = json.loads(body or b"[]")
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise BulkParseError(f"JSON inválido ({e})")
+        if not isinstance(records, list):
+            raise BulkParseError("se espera un array de objetos")
+        for position, record in enumerate(records, start=1):
+            self._add_record(record, position)
+
+    def _add_record(self, record, line: int):
+        if not isinstance(record, dict):
+            raise BulkParseError("se espera un objeto", line, self._unit)
+        try:
+            values = self._record_values(record)
+        except ValueError as e:
+            raise BulkParseError(str(e), line, self._unit)
+        self._add(values, line)
+
+    def _add(self, values: list, line: int):
+        if self.max_rows > 0 and len(self._rows) >= self.max_rows:
+            raise TooManyRowsError(f"se superó el máximo de {self.max_rows} registros por request", line, self._unit)
+        try:
+            self._rows.append(self._convert(*values))
+        except ValueError as e:
+            raise BulkParseError(str(e), line, self._unit)
+
+    def _columns(self):
+        # Filas convertidas -> una lista por columna
+        if not self._rows:
+            return [[] for _ in self.CSV_COLUMNS]
+        return [list(column) for column in zip(*self._rows)]
+
+    def _record_values(self, record: dict):
+        return [record.get(column) for column in self.CSV_COLUMNS]
+
+    def _convert(self, *values):
+        raise NotImplementedError
+
+    def _build(self):
+        raise NotImplementedError
+
+# =========================================================================
+#                               COMPRAS
+# =========================================================================
+
+class TransactionBatch:
+    """
+    Compras leídas, por columnas. Los timestamps quedan como texto ISO 8601 (None = ahora).
+    """
+
+    def __init__(self, user_ids: list, item_ids: list, timestamps: list):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.timestamps = timestamps
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def select(self, mask):
+        """
+        Sub-lote con las filas donde 'mask' es True.
+        """
+        return TransactionBatch(
+            self.user_ids[mask], self.item_ids[mask],
+            [ts for ts, keep in zip(self.timestamps, mask.tolist()) if keep],
+        )
+
+    def to_csv(self):
+        """
+        Buffer CSV para COPY ... FROM STDIN (un timestamp vacío se lee como NULL).
+        """
+        buffer = io.StringIO()
+        for uid, iid, ts in zip(self.user_ids.tolist(), self.item_ids.tolist(), self.timestamps):
+            buffer.write(f"{uid},{iid},{ts or ''}\n")
+        return buffer
+
+class TransactionParser(BulkParser):
+    """
+    Compras (user_id, item_id, timestamp opcional). 'timestamp' en ISO 8601; si falta,
+    la compra se registra con la hora de la BD (NOW()).
+    """
+
+    CSV_COLUMNS = ("user_id", "item_id", "timestamp")
+    REQUIRED = 2
+    JSON_UNIT = "Compra"
+
+    def _convert(self, user_id, item_id, timestamp):
+        return parse_id(user_id, "user_id"), parse_id(item_id, "item_id"), parse_timestamp(timestamp)
+
+    def _build(self):
+        return TransactionBatch(*self._columns())
+
+# =========================================================================
+#                               USUARIOS
+# =========================================================================
+
+class UserBatch:
+    """
+    Usuarios leídos: username (o None), géneros favoritos y fecha de creación ISO 8601 (None = ahora).
+    """
+
+    def __init__(self, usernames: list, genres: list, created: list):
+        self.usernames = usernames
+        self.genres = genres
+        self.created = created
+
+    def __len__(self):
+        return len(self.usernames)
+
+    def genre_ids(self):
+        """
+        Todos los géneros mencionados, sin repetir.
+        """
+        return np.unique(np.fromiter((g for genres in self.genres for g in genres), dtype=np.int64))
+
+    def to_csv(self, user_ids):
+        """
+        Buffer CSV para COPY ... FROM STDIN con los ids ya reservados (géneros como array de PostgreSQL).
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+        for uid, username, genres, created in zip(user_ids, self.usernames, self.genres, self.created):
+            writer.writerow([uid, username, "{" + ",".join(map(str, genres)) + "}", created])
+        return buffer
+
+class UserParser(BulkParser):
+    """
+    Usuarios con el mismo formato que POST /user ({"username", "attributes": {"generos_id": [...]}}),
+    más 'fecha_creacion' opcional en 'attributes' para conservar la de la cuenta migrada.
+    En CSV: username,generos_id,fecha_creacion con los géneros separados por ';' o espacios.
+    """
+
+    CSV_COLUMNS = ("username", "generos_id", "fecha_creacion")
+    REQUIRED = 1
+    JSON_UNIT = "Usuario"
+
+    def _record_values(self, record: dict):
+        attributes = record.get("attributes") or {}
+        if not isinstance(attributes, dict):
+            raise ValueError("'attributes' debe ser un objeto")
+        return [record.get("username"), attributes.get("generos_id"), attributes.get("fecha_creacion")]
+
+    def _convert(self, username, genres, created):
+        if username is not None and not isinstance(username, str):
+            raise ValueError(f"username inválido: {username!r}")
+        username = (username.strip() or None) if username is not None else None
+        if username is not None and len(username) > 100:
+            raise ValueError("username de más de 100 caracteres")
+        return username, parse_genres(genres), parse_timestamp(created, "fecha_creacion")
+
+    def _build(self):
+        return UserBatch(*self._columns())
+
+# =========================================================================
+#                         CONVERSIÓN DE VALORES
+# =========================================================================
+
+_GENRE_SEPARATORS = re.compile(r"[;\s]+")
+
+def parse_id(value, name: str):
+    """
+    Id positivo desde un entero JSON o texto numérico (CSV). No se aceptan bool ni float.
+    """
+    parsed = None
+    if isinstance(value, int) and not isinstance(value, bool):
+        parsed = value
+    elif isinstance(value, str) and value.strip().isdigit():
+        parsed = int(value.strip())
+    if parsed is None or not 0 < parsed <= 2**31 - 1:
+        raise ValueError(f"{name} inválido: {value!r}")
+    return parsed
+
+def parse_genres(value):
+    """
+    Lista de géneros sin repetir (en el orden recibido): lista JSON o texto '1;12;5'.
+    """
+    if value is None:
+        return []
+    if isinstance(value, str):
+        value = [g for g in _GENRE_SEPARATORS.split(value.strip()) if g]
+    if not isinstance(value, list):
+        raise ValueError(f"generos_id inválido: {value!r}")
+    return list(dict.fromkeys(parse_id(g, "genero_id") for g in value))
+
+def parse_timestamp(value, name: str = "timestamp"):
+    """
+    Fecha normalizada a ISO 8601 (None si no vino). Con zona horaria, la BD la convierte a la
+    hora local de la sesión, igual que NOW().
+    """
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"{name} inválido: {value!r}")
+    try:
+        return datetime.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        raise ValueError(f"{name} inválido: {value!r}") from None
@@ -0,0 +1,200 @@
+import logging
+import threading
+import numpy as np
+from src.database import get_data_as_dataframe
+
+logger = logging.getLogger(__name__)
+
+class PopularityIndex:
+    """
+    Rankings de popularidad (global y por género) mantenidos en memoria.
+    Cada ranking es una lista de item_id ordenada por ventas descendente (desempate por item_id).
+    Se reconstruye desde la BD al entrenar y se actualiza incrementalmente con cada compra,
+    así el Cold Start no necesita consultar la BD.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sales = {}            # { item_id: ventas }
+        self.item_genres = {}      # { item_id: [genero_id, ...] }
+        self.global_ranking = []   # [item_id, ...]
+        self.genre_rankings = {}   # { genero_id: [item_id, ...] }
+        self._positions = {}       # { clave de ranking: { item_id: posición } }
+        self.ready = False
+
+    def rebuild(self):
+        """
+        Recalcula ventas y rankings completos desde Compras/ItemGeneros.
+        """
+        sql_sales = """
+            SELECT i.item_id, COUNT(c.compra_id) as ventas
+            FROM Items i
+            LEFT JOIN Compras c ON i.item_id = c.item_id
+            GROUP BY i.item_id
+        """
+        df_sales = get_data_as_dataframe(sql_sales)
+        df_genres = get_data_as_dataframe("SELECT item_id, genero_id FROM ItemGeneros")
+
+        if df_sales is None or df_genres is None:
+            logger.warning("[Popularidad] No se pudo reconstruir el índice de popularidad.")
+            return
+
+        self.build(
+            dict(zip(df_sales["item_id"].astype(int).tolist(), df_sales["ventas"].astype(int).tolist())),
+            df_genres["item_id"].astype(int).tolist(),
+            df_genres["genero_id"].astype(int).tolist(),
+        )
+
+    def build(self, sales: dict, genre_item_ids: list, genre_ids: list):
+        """
+        Arma los rankings desde las ventas por ítem ({ item_id: ventas }, todo el catálogo)
+        y los pares (item_id, genero_id) de ItemGeneros.
+        """
+        item_genres = {}
+        genre_items = {}
+        for iid, gid in zip(genre_item_ids, genre_ids):
+            item_genres.setdefault(iid, []).append(gid)
+            genre_items.setdefault(gid, []).append(iid)
+
+        def rank(items):
+            return sorted(items, key=lambda iid: (-sales.get(iid, 0), iid))
+
+        global_ranking = rank(sales.keys())
+        genre_rankings = {gid: rank(items) for gid, items in genre_items.items()}
+
+        positions = {None: {iid: pos for pos, iid in enumerate(global_ranking)}}
+        for gid, ranking in genre_rankings.items():
+            positions[gid] = {iid: pos for pos, iid in enumerate(ranking)}
+
+        with self._lock:
+            self.sales = sales
+            self.item_genres = item_genres
+            self.global_ranking = global_ranking
+            self.genre_rankings = genre_rankings
+            self._positions = positions
+            self.ready = True
+
+        logger.info(f"[Popularidad] Índice reconstruido: {len(global_ranking)} ítems, {len(genre_rankings)} géneros.")
+
+    def to_arrays(self):
+        """
+        Ventas y rankings como arrays planos (para el snapshot del modelo).
+        Los rankings por género van concatenados, con 'offsets' marcando dónde empieza cada uno.
+        """
+        with self._lock:
+            genre_ids = sorted(self.genre_rankings)
+            lengths = [len(self.genre_rankings[gid]) for gid in genre_ids]
+            genre_items = [iid for gid in genre_ids for iid in self.genre_rankings[gid]]
+            return {
+                "popularity_items": np.array(list(self.sales.keys()), dtype=np.int64),
+                "popularity_sales": np.array(list(self.sales.values()), dtype=np.int64),
+                "popularity_global": np.array(self.global_ranking, dtype=np.int64),
+                "popularity_genre_ids": np.array(genre_ids, dtype=np.int64),
+                "popularity_genre_offsets": np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+                "popularity_genre_items": np.array(genre_items, dtype=np.int64),
+            }
+
+    def load_arrays(self, arrays):
+        """
+        Restaura el índice desde los arrays de to_arrays, sin consultar la BD.
+        """
+        sales = dict(zip(arrays["popularity_items"].tolist(), arrays["popularity_sales"].tolist()))
+        global_ranking = arrays["popularity_global"].tolist()
+
+        offsets = arrays["popularity_genre_offsets"].tolist()
+        genre_items = arrays["popularity_genre_items"].tolist()
+        genre_rankings = {}
+        item_genres = {}
+        for idx, gid in enumerate(arrays["popularity_genre_ids"].tolist()):
+            genre_rankings[gid] = genre_items[offsets[idx]:offsets[idx + 1]]
+            for iid in genre_rankings[gid]:
+                item_genres.setdefault(iid, []).append(gid)
+
+        positions = {None: {iid: pos for pos, iid in enumerate(global_ranking)}}
+        for gid, ranking in genre_rankings.items():
+            positions[gid] = {iid: pos for pos, iid in enumerate(ranking)}
+
+        with self._lock:
+            self.sales = sales
+            self.item_genres = item_genres
+            self.global_ranking = global_ranking
+            self.genre_rankings = genre_rankings
+            self._positions = positions
+            self.ready = True
+
+    def ensure_ready(self):
+        if not self.ready:
+            self.rebuild()
+
+    def add_sale(self, item_id: int, quantity: int = 1):
+        """
+        Suma ventas a un ítem y lo hace subir en el ranking global y en los de sus géneros.
+        """
+        with self._lock:
+            if not self.ready:
+                return
+            self.sales[item_id] = self.sales.get(item_id, 0) + quantity
+            self._promote(None, self.global_ranking, item_id)
+            for gid in self.item_genres.get(item_id, []):
+                self._promote(gid, self.genre_rankings[gid], item_id)
+
+    def _promote(self, key, ranking, item_id):
+        positions = self._positions[key]
+        if item_id not in positions:
+            positions[item_id] = len(ranking)
+            ranking.append(item_id)
+
+        # Como las ventas sólo crecen, alcanza con ir intercambiando hacia arriba
+        pos = positions[item_id]
+        item_key = (-self.sales[item_id], item_id)
+        while pos > 0:
+            prev = ranking[pos - 1]
+            if (-self.sales.get(prev, 0), prev) <= item_key:
+                break
+            ranking[pos] = prev
+            positions[prev] = pos
+            pos -= 1
+        ranking[pos] = item_id
+        positions[item_id] = pos
+
+    def top(self, k: int, exclude: set = None):
+        """
+        Los k más vendidos de toda la tienda, como dicts con 'item_id' y 'ventas'.
+        """
+        exclude = exclude or set()
+        result = []
+        with self._lock:
+            for iid in self.global_ranking:
+                if len(result) >= k:
+                    break
+                if iid not in exclude:
+                    result.append({"item_id": iid, "ventas": self.sales.get(iid, 0)})
+        return result
+
+    def round_robin(self, genre_ids: list, k: int, limit_per_genre: int):
+        """
+        Mezcla los 'limit_per_genre' más vendidos de cada género tomando uno de cada uno por vuelta,
+        sin repetir ítems (un álbum puede estar en dos géneros).
+        """
+        with self._lock:
+            candidates = [self.genre_rankings.get(gid, [])[:limit_per_genre] for gid in genre_ids]
+            sales = self.sales
+
+            result = []
+            seen = set()
+            for idx in range(limit_per_genre):
+                added = False
+                for genre_list in candidates:
+                    if idx < len(genre_list) and genre_list[idx] not in seen:
+                        seen.add(genre_list[idx])
+                        result.append({"item_id": genre_list[idx], "ventas": sales.get(genre_list[idx], 0)})
+                        added = True
+                        if len(result) >= k:
+                            return result
+                # Una vuelta sin ítems nuevos corta la mezcla (el resto se completa con los globales)
+                if not added:
+                    break
+        return result
+
+# Índice compartido por todas las instancias del servicio dentro del proceso
+popularity_index = PopularityIndex()
@@ -1,58 +1,264 @@
+import io
+import time
+import asyncio
+import hashlib
+from collections import namedtuple
+import scipy.sparse as sp
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import logging
-from src.database import get_data_as_dataframe, execute_non_query
+from src.database import (
+    get_data_as_dataframe, execute_non_query, execute_returning, copy_in_transaction, fetch_rows, fetch_scalar,
+    fetch_arrays, execute_returning_async, fetch_rows_async, fetch_arrays_async, get_db_stats,
+)
+from src.services.cache import recommendation_cache, ranking_cache
+from src.services.catalog import ItemFeatures, item_feature_cache
+from src.services.popularity import popularity_index
+from src.services.user_context import UserContext, load_user_context, load_user_context_async, load_user_contexts, load_last_purchase_async
+from src.services.scoring import (
+    hybrid_weights, rank_hybrid_batch, top_k_indices, align_hybrid_model, align_factors, align_content, batch_chunk_size,
+    item_item_scores, factor_scores, genre_profile_scores, content_neighbor_scores, genre_cosine, lookup_sorted, csr_row_offsets,
+)
+from src.services.similarity import cooccurrence_index, similarity_model, build_user_item_matrix, compute_item_similarity, prune_top_k
+from src.services.factorization import factor_model, fit_factors
+from src.services.content import content_index
+from src.services.snapshots import model_snapshots
+from src.services.training import training_scheduler, PendingPurchase
+from src.services.ingestion import TransactionBatch, UserBatch, parse_genres
+from src.metrics import stage_timings, render_metrics
+from src.config import (
+    SIMILARITY_TOP_K, SIMILARITY_MIN_SCORE, SIMILARITY_SCORE_DTYPE,
+    CF_BACKEND, ALS_FACTORS, ALS_ITERATIONS, ALS_REGULARIZATION, ALS_ALPHA, CBF_BACKEND, RECS_PAGE_DEPTH,
+)
 
 logger = logging.getLogger(__name__)
 
+# Página del ranking paginado: 'offset' es donde empezó (0 si el ranking cambió y se reinició)
+RankingPage = namedtuple("RankingPage", ["items", "offset", "has_more", "ranking_id", "restarted"])
+
 class RecommenderService:
     def __init__(self):
 
         # Parámetros del modelo híbrido
         self.BOOST_VALUE = 0.1 # valor a sumar si coincide con preferencia explícita
+        self.SIM_TOP_K = SIMILARITY_TOP_K # vecinos guardados por ítem en MatrizSimilitud (0 = todos)
+        self.SIM_MIN_SCORE = SIMILARITY_MIN_SCORE # score mínimo de una relación guardada
+        self.BATCH_CHUNK_SIZE = 512 # máximo de usuarios por bloque matricial en las recomendaciones en lote
+        self.BATCH_MAX_CELLS = 4_000_000 # celdas usuarios x ítems por matriz densa de un bloque (~32 MB en float64)
+        self.CF_LIMIT = 20 # candidatos del Filtrado Colaborativo por usuario
+        self.PAGE_DEPTH = RECS_PAGE_DEPTH # largo del ranking que se recorre por páginas
+        self.CF_BACKEND = CF_BACKEND # 'item_item' (similitud Item-Item) o 'als' (factorización de matrices)
+        self.ALS_PARAMS = {
+            "factors": ALS_FACTORS, "iterations": ALS_ITERATIONS,
+            "regularization": ALS_REGULARIZATION, "alpha": ALS_ALPHA,
+        }
+        self.CBF_BACKEND = CBF_BACKEND # 'genres' (coseno por géneros) o 'attributes' (vecinos de contenido)
+        self.CBF_MIN_SCORE = 0.1 # similitud mínima de un candidato Content-Based
+
+        # Estado incremental del modelo CF, matriz de características y popularidad (compartidos en el proceso)
+        self.cooc_index = cooccurrence_index
+        self.similarity_model = similarity_model
+        self.factor_model = factor_model
+        self.content_index = content_index
+        self.item_features = item_feature_cache
+        self.popularity = popularity_index
+        self.results_cache = recommendation_cache
+        self.ranking_cache = ranking_cache
+        self.training = training_scheduler
+        self.snapshots = model_snapshots
+
+    @property
+    def model_state(self):
+        """
+        Estado del modelo CF del backend configurado: 'version' (clave de la caché), 'ready' y
+        'updates_since_rebuild' (para el scheduler de entrenamiento).
+        """
+        return self.factor_model if self.CF_BACKEND == "als" else self.cooc_index
 
-    def get_recommendations(self, user_id: int, top_k: int = 5):
+    def get_recommendations(self, user_id: int, top_k: int = 5, context: UserContext = None):
         """
         Decide qué lógica se usa según si es un usuario nuevo o no.
+        Si no se recibe el contexto del usuario, se carga aquí (una sola consulta).
+        El resultado queda guardado en la caché de recomendaciones.
         """
+        started = time.monotonic()
+        model_version = self.model_state.version
+
+        if context is None:
+            context = self.get_user_context(user_id) or UserContext(user_id)
+
         # Verificar si el usuario tiene historial de compras real
-        sql_check = "SELECT COUNT(*) as total FROM Compras WHERE user_id = :uid"
-        df_check = get_data_as_dataframe(sql_check, params={"uid": user_id})
-        compras_count = df_check.iloc[0]["total"] if df_check is not None else 0
+        compras_count = context.purchase_count
 
         if compras_count < 1: # cold start
             logger.info(f"Usuario {user_id} es nuevo (0 compras). Usando Cold Start.") 
-            raw_recs = self._get_cold_start_items(user_id, top_k)
-            return self._enrich_results(raw_recs)
+            raw_recs = self._get_cold_start_items(context, top_k)
+            recommendations = self._enrich_results(raw_recs)
         else:
             logger.info(f"Usuario {user_id} tiene historial ({compras_count} compras). Usando lógica estándar.")
-            return self._get_hybrid_recommendations(user_id, top_k, compras_count)
+            recommendations = self._get_hybrid_recommendations(context, top_k)
+
+        self.results_cache.put(user_id, top_k, model_version, context.last_purchase, recommendations, computed_since=started)
+        return recommendations
+
+    async def get_recommendations_async(self, user_id: int, top_k: int = 5):
+        """
+        Versión asíncrona de get_recommendations para los endpoints 'async def'.
+        El contexto del usuario y los candidatos CF no dependen entre sí, así que se consultan a la vez.
+        Devuelve None si el usuario no existe.
+        """
+        started = time.monotonic()
+        model_version = self.model_state.version
+
+        ranked = await self._rank_async(user_id, top_k)
+        if ranked is None:
+            return None
+        context, raw_recs = ranked
+
+        details_map = await self._load_item_details_async([r['item_id'] for r in raw_recs])
+        recommendations = self._enrich_results(raw_recs, details_map)
+
+        self.results_cache.put(user_id, top_k, model_version, context.last_purchase, recommendations, computed_since=started)
+        return recommendations
 
-    def _enrich_results(self, recommendations: list):
+    async def get_recommendation_page_async(self, user_id: int, offset: int, size: int, ranking_id: str = None):
+        """
+        Página [offset, offset + size) del ranking completo del usuario (PAGE_DEPTH ítems).
+        El ranking se calcula una sola vez y se guarda sin enriquecer en 'ranking_cache' (con la versión
+        del modelo): cada página siguiente es un recorte más la consulta de detalles de sus ítems.
+        'ranking_id' identifica el ranking de la página anterior (ver _ranking_id). Si el vigente es otro
+        (venció y se recalculó con otro modelo, el usuario compró algo u otro worker tiene otro ranking),
+        seguir desde el mismo offset repetiría o saltearía ítems: se reinicia desde el principio.
+        Devuelve un RankingPage o None si el usuario no existe.
+        """
+        started = time.monotonic()
+        model_version = self.model_state.version
+
+        ranking = await self._cache_lookup_async(self.ranking_cache, user_id, self.PAGE_DEPTH, model_version)
+        if ranking is None:
+            ranked = await self._rank_async(user_id, self.PAGE_DEPTH)
+            if ranked is None:
+                return None
+            context, raw_recs = ranked
+            ranking = [(r['item_id'], r.get('score', 0.0)) for r in raw_recs]
+            self.ranking_cache.put(user_id, self.PAGE_DEPTH, model_version, context.last_purchase, ranking, computed_since=started)
+
+        current_id = _ranking_id(ranking)
+        restarted = ranking_id is not None and ranking_id != current_id
+        if restarted:
+            offset = 0
+
+        page = [{"item_id": iid, "score": score} for iid, score in ranking[offset:offset + size]]
+        details_map = await self._load_item_details_async([r['item_id'] for r in page])
+        items = self._enrich_results(page, details_map)
+        return RankingPage(items, offset, offset + size < len(ranking), current_id, restarted)
+
+    async def _rank_async(self, user_id: int, top_k: int):
+        """
+        Top K sin enriquecer (Cold Start o híbrido) de la versión asíncrona, junto con el contexto con que
+        se calculó: (contexto, top K). None si el usuario no existe.
+        El contexto del usuario y los candidatos CF no dependen entre sí, así que se consultan a la vez.
+        El ranking (NumPy, y las lecturas síncronas de popularidad y características cuando vencen)
+        corre en un hilo: el event loop sigue atendiendo otras requests mientras tanto.
+        """
+        context, cf_candidates = await asyncio.gather(
+            load_user_context_async(user_id),
+            self._cf_candidates_async(user_id),
+        )
+        if context is None:
+            return None
+
+        return context, await asyncio.to_thread(self._rank_context, context, top_k, cf_candidates)
+
+    def _rank_context(self, context: UserContext, top_k: int, cf_candidates: tuple = None):
+        """
+        Top K sin enriquecer para un contexto ya cargado: Cold Start si no tiene compras, si no el híbrido.
+        """
+        if context.purchase_count < 1: # cold start
+            logger.info(f"Usuario {context.user_id} es nuevo (0 compras). Usando Cold Start.")
+            return self._get_cold_start_items(context, top_k)
+
+        logger.info(f"Usuario {context.user_id} tiene historial ({context.purchase_count} compras). Usando lógica estándar.")
+        return self._rank_hybrid(context, top_k, cf_candidates)
+
+    def invalidate_user_cache(self, user_id: int):
+        """
+        Descarta las recomendaciones y el ranking paginado guardados del usuario (ej: porque compró algo).
+        """
+        self.results_cache.invalidate_user(user_id)
+        self.ranking_cache.invalidate_user(user_id)
+
+    @stage_timings.timed("cache")
+    def get_cached_recommendations(self, user_id: int, top_k: int, last_purchase: int):
+        """
+        Recomendaciones desde la caché si siguen vigentes para la versión actual del modelo y la última
+        compra del usuario ('last_purchase', ej: del contexto ya cargado). Si no, None.
+        """
+        return self.results_cache.get(user_id, top_k, self.model_state.version, last_purchase)
+
+    @stage_timings.timed("cache")
+    async def get_cached_recommendations_async(self, user_id: int, top_k: int):
+        """
+        Igual que get_cached_recommendations, leyendo la última compra del usuario de Compras (sólo si
+        hay algo guardado): una compra registrada en otro worker también invalida lo cacheado acá.
+        """
+        return await self._cache_lookup_async(self.results_cache, user_id, top_k, self.model_state.version)
+
+    async def _cache_lookup_async(self, cache, user_id: int, n: int, model_version):
+        if not cache.contains(user_id):
+            return None
+        last_purchase = await load_last_purchase_async(user_id)
+        if last_purchase is None:
+            return None
+        return cache.get(user_id, n, model_version, last_purchase)
+
+    def get_cache_stats(self):
+        return self.results_cache.stats()
+
+    def get_db_stats(self):
+        return get_db_stats()
+
+    def get_training_stats(self):
+        return self.training.stats()
+
+    def get_metrics(self):
+        return render_metrics()
+
+    def start_training(self):
+        """
+        Arranca el entrenamiento en segundo plano sin bloquear. Si hay un snapshot en disco se carga
+        primero; el re-entrenamiento inicial sólo se pide si los datos avanzaron desde ese snapshot.
+        Con varios workers sólo uno entrena (ver TrainingScheduler): el resto sólo carga sus snapshots.
+        """
+        leader = self.training.claim_leadership()
+        watermark = self.load_snapshot(with_counts=leader)
+        self.training.start(self, watermark=watermark)
+
+    def stop_training(self):
+        self.training.stop()
+
+    def get_user_context(self, user_id: int):
+        """
+        Usuario, preferencias y compras en un solo round trip (None si no existe).
+        """
+        return load_user_context(user_id)
+
+    @stage_timings.timed("enrich")
+    def _enrich_results(self, recommendations: list, details_map: dict = None):
         """
         Recibe una lista de dicts con 'item_id'.
         Consulta la BD para traer TODOS los datos y formatear al esquema Item.
+        Si ya se tienen los detalles (ej: en lote), se pueden pasar en 'details_map'.
         """
         if not recommendations:
             return []
             
-        # Extraer los IDs para hacer una sola query
-        ids = [str(r['item_id']) for r in recommendations]
-        if not ids:
-            return []
-            
-        id_str = ",".join(ids)
+        if details_map is None:
+            # Extraer los IDs para hacer una sola query
+            details_map = self._load_item_details([r['item_id'] for r in recommendations])
         
-        # Traemos TODO (*) para llenar los atributos
-        sql = f"SELECT * FROM Items WHERE item_id IN ({id_str})"
-        df_details = get_data_as_dataframe(sql)
-        
-        if df_details is None or df_details.empty:
+        if not details_map:
             return recommendations
-            
-        # Convertir a diccionario para búsqueda rápida
-        details_map = df_details.set_index('item_id').to_dict(orient='index')
         
         enriched_list = []
         for rec in recommendations:
@@ -84,37 +290,58 @@ class RecommenderService:
                 }) 
                 
         return enriched_list
+
+    @stage_timings.timed("details")
+    def _load_item_details(self, item_ids: list):
+        """
+        Trae TODOS los datos de los ítems dados en una sola query: { item_id: {columna: valor} }.
+        """
+        if not item_ids:
+            return {}
+            
+        return _details_map(fetch_rows(_ITEM_DETAILS_SQL, params=_item_details_params(item_ids)))
+
+    @stage_timings.timed("details")
+    async def _load_item_details_async(self, item_ids: list):
+        """
+        Versión asíncrona de _load_item_details.
+        """
+        if not item_ids:
+            return {}
+
+        return _details_map(await fetch_rows_async(_ITEM_DETAILS_SQL, params=_item_details_params(item_ids)))
         
     #  =========================================================================
     #                   LÓGICA DEL SISTEMA HÍBRIDO PONDERADO 
     #  =========================================================================
 
-    def _get_hybrid_recommendations(self, user_id: int, k: int, n_compras: int):
+    def _get_hybrid_recommendations(self, context: UserContext, k: int):
         """
         Implementación del Sistema Híbrido con Pesos Dinámicos según madurez del usuario.
         """
+        # 6. Enriquecer con Título y Artista
+        return self._enrich_results(self._rank_hybrid(context, k))
 
-        # 1. Definir Pesos Dinámicos
-        # Si tiene pocas compras, el CF es débil -> confiamos en el contenido (CBF)
-        # Si tiene muchas, el CF es fuerte -> confiamos en la inteligencia colectiva
-        if n_compras <= 15:
-            w_cf, w_cbf = 0.3, 0.7 
-        elif n_compras <= 25:
-            w_cf, w_cbf = 0.5, 0.5
-        else:
-            w_cf, w_cbf = 0.7, 0.3
+    def _rank_hybrid(self, context: UserContext, k: int, cf_candidates: tuple = None):
+        """
+        Pasos 1-5 del sistema híbrido: Top K sin enriquecer (dicts con 'item_id' y 'score').
+        Si los candidatos CF ya se consultaron (ej: en paralelo, en la versión asíncrona), se reutilizan.
+        """
+        # 1. Definir Pesos Dinámicos según la cantidad de compras
+        w_cf, w_cbf = (float(w) for w in hybrid_weights(context.purchase_count))
 
         # 2. Obtener candidatos y scores vía Filtrado Colaborativo (Item-Item)
-        cf_candidates = self._get_collaborative_filtering_candidates(user_id)
+        if cf_candidates is None:
+            cf_candidates = self._get_collaborative_filtering_candidates(context)
         
         # 3. Obtener candidatos y scores vía Content-Based (Perfil de Usuario)
-        cbf_candidates = self._get_content_based_candidates(user_id)
+        cbf_candidates = self._get_content_based_candidates(context, k, cf_candidates[0])
         
         # 4. Combinar resultados, aplicar pesos y booster
-        combined_recommendations = self._combine_and_rank(user_id, cf_candidates, cbf_candidates, w_cf, w_cbf)
+        combined_recommendations = self._combine_and_rank(context, cf_candidates, cbf_candidates, w_cf, w_cbf, k)
         
-        # 5. Filtrar ítems ya comprados
-        final_list = self._filter_purchased_items(user_id, combined_recommendations)
+        # 5. Filtrar ítems ya comprados (ya enmascarados en el ranking; red de seguridad sobre el Top K)
+        final_list = self._filter_purchased_items(context, combined_recommendations)
         
         # Fallback de seguridad
         if not final_list:
@@ -122,429 +349,1046 @@ class RecommenderService:
             return self._get_global_top_sellers(k)
         
         # Recortar al Top K solicitado
-        top_k_recs = final_list[:k]
-        
-        # 6. Enriquecer con Título y Artista
-        return self._enrich_results(top_k_recs)
+        return final_list[:k]
 
     def get_user_data(self, user_id: int):
         """
         Recupera datos básicos del usuario Y sus géneros favoritos.
         """
-        # 1. Datos básicos del usuario
-        sql = "SELECT * FROM Usuarios WHERE user_id = :uid"
-        df = get_data_as_dataframe(sql, params={"uid": user_id})
-        
-        if df is not None and not df.empty:
-            # Convertimos a dict y tratamos la fecha
-            data = df.iloc[0].to_dict()
-            data['fecha_creacion'] = str(data['fecha_creacion'])
-            
-            # 2. Recuperar Preferencias (Géneros favoritos)
-            sql_prefs = "SELECT genero_id FROM PreferenciasUsuario WHERE user_id = :uid"
-            df_prefs = get_data_as_dataframe(sql_prefs, params={"uid": user_id})
-            
-            # Si tiene preferencias, las convertimos a lista de ints
-            if df_prefs is not None and not df_prefs.empty:
-                data['preferencias'] = df_prefs['genero_id'].tolist()
-            else:
-                data['preferencias'] = []
-                
-            return data
-            
-        return None
+        context = self.get_user_context(user_id)
+        return context.to_dict() if context is not None else None
 
+    async def get_user_data_async(self, user_id: int):
+        """
+        Versión asíncrona de get_user_data.
+        """
+        context = await load_user_context_async(user_id)
+        return context.to_dict() if context is not None else None
 
-    
+    @stage_timings.timed("train")
     def train_model(self):
         """
-        Calcula la matriz de similitud Item-Item y guarda en la tabla MatrizSimilitud.
-        Se debe llamar al iniciar la app y tras compras significativas.
+        Calcula la matriz de similitud Item-Item y guarda en la tabla MatrizSimilitud
+        (con CF_BACKEND=als entrena en cambio los factores de usuarios e ítems, ver _train_factors).
+        En la app lo llama el scheduler de entrenamiento (src/services/training.py) en segundo plano.
+        Devuelve los compra_id incluidos en el entrenamiento (None si no se pudo entrenar).
         """
         
         logger.info("[Training] Iniciando re-entrenamiento del modelo CF...")
         
         # 1. Traer datos crudos
-        sql = "SELECT user_id, item_id FROM Compras"
+        sql = "SELECT compra_id, user_id, item_id FROM Compras"
         df_compras = get_data_as_dataframe(sql)
         
         if df_compras is None or df_compras.empty:
             logger.warning("[Training] No hay datos suficientes para entrenar.") 
-            return
+            return None
 
-        # 2. Crear matriz en Memoria
-        user_item_matrix = df_compras.pivot_table(
-            index='user_id', 
-            columns='item_id', 
-            aggfunc=lambda x: 1, 
-            fill_value=0
-        )
+        if self.CF_BACKEND == "als":
+            return self._train_factors(df_compras)
 
-        # 3. Calcular Similitud del Coseno (Item-Item)
-        sim_matrix = cosine_similarity(user_item_matrix.T)
-        
-        # 4. Preparar datos para inserción masiva
-        item_ids = user_item_matrix.columns # obtenemos los IDs reales de las columnas
-        updates = []
-        
-        # Recorremos la matriz triangular superior (evitamos duplicados).
-        # Para simplificar la query de lectura, guardaremos la matriz completa.
-        num_items = len(item_ids)
-        for i in range(num_items):
-            for j in range(num_items):
-                if i != j: # ignoramos la diagonal principal
-                    score = float(sim_matrix[i][j])
-                    if score > 0: # Solo guardamos relaciones relevantes
-                        updates.append({
-                            "ia": int(item_ids[i]), 
-                            "ib": int(item_ids[j]), 
-                            "sc": score
-                        })
+        # 2-4. Matriz User-Item, similitud Item-Item y poda (en memoria)
+        item_ids, cooc_matrix, rows, cols, scores = self.fit_similarity(
+            df_compras["user_id"].to_numpy(),
+            df_compras["item_id"].to_numpy()
+        )
+        ia = item_ids[rows]
+        ib = item_ids[cols]
         
         # 5. Persistir en Base de Datos 
-        if updates:
-            logger.info(f"[Training] Guardando {len(updates)} relaciones de similitud en BD...")
-            
-            # Limpiar tabla
-            execute_non_query("DELETE FROM MatrizSimilitud")
-            
-            # Insertar en lotes
-            values_list = [f"({d['ia']}, {d['ib']}, {d['sc']})" for d in updates]
-            
-            # Insertamos en bloques de 1000 para no romper la query string
-            batch_size = 1000
-            for k in range(0, len(values_list), batch_size):
-                batch = values_list[k:k+batch_size]
-                sql_insert = f"INSERT INTO MatrizSimilitud (item_id_a, item_id_b, score) VALUES {','.join(batch)}"
-                execute_non_query(sql_insert)
-                
+        if len(ia) > 0:
+            logger.info(f"[Training] Guardando {len(ia)} relaciones de similitud en BD...")
+            self._persist_similarity(ia, ib, scores)
             logger.info("[Training] Modelo persistido correctamente.")
 
-    def _get_collaborative_filtering_candidates(self, user_id: int):
+        # 6. Publicar: co-ocurrencias y normas para las actualizaciones incrementales (nueva versión
+        #    del modelo) recién cuando MatrizSimilitud ya tiene el modelo nuevo
+        self.cooc_index.rebuild(item_ids, cooc_matrix)
+
+        # Reconciliamos también los rankings de popularidad (y el índice de contenido) con la BD
+        self._rebuild_catalog_models()
+
+        # 7. Snapshot en disco para que el próximo arranque no tenga que re-entrenar
+        compra_ids = df_compras["compra_id"].to_numpy()
+        self._save_snapshot(item_ids, cooc_matrix, rows, cols, scores, compra_ids)
+
+        return compra_ids
+
+    def _train_factors(self, df_compras):
+        """
+        Entrenamiento del backend 'als': factores de usuarios e ítems en lugar de la similitud
+        Item-Item (no se calculan pares ni se escribe MatrizSimilitud).
+        Devuelve los compra_id incluidos en el entrenamiento.
+        """
+        model = fit_factors(df_compras["user_id"].to_numpy(), df_compras["item_id"].to_numpy(), **self.ALS_PARAMS)
+        self.factor_model.publish(*model, self.ALS_PARAMS["regularization"], self.ALS_PARAMS["alpha"])
+        self._rebuild_catalog_models()
+
+        compra_ids = df_compras["compra_id"].to_numpy()
+        self._write_snapshot(self.factor_model.to_arrays(), {"als": dict(self.ALS_PARAMS)}, compra_ids)
+        return compra_ids
+
+    def _rebuild_catalog_models(self):
+        """
+        Modelos que no dependen del backend CF: rankings de popularidad y, con CBF_BACKEND=attributes,
+        el índice de vecinos de contenido.
+        """
+        self.popularity.rebuild()
+        if self.CBF_BACKEND == "attributes":
+            self.content_index.rebuild()
+
+    def fit_similarity(self, user_ids, item_ids):
+        """
+        Parte en memoria del entrenamiento, a partir de los pares (user_id, item_id) de Compras.
+        Devuelve (item_ids, co-ocurrencias, filas, columnas, scores) con los pares ya podados.
+        """
+        # 2. Crear matriz dispersa User-Item (CSR) en Memoria
+        user_item_matrix, item_ids = build_user_item_matrix(user_ids, item_ids)
+
+        # 3. Calcular Similitud del Coseno (Item-Item) con productos dispersos
+        cooc_matrix, rows, cols, scores = compute_item_similarity(user_item_matrix)
+
+        # 4. Preparar datos para inserción masiva
+        #    Guardamos la matriz (ambos sentidos) sin la diagonal, sólo scores > 0,
+        #    podada a los K vecinos más similares de cada ítem si está configurado.
+        rows, cols, scores = prune_top_k(rows, cols, scores, self.SIM_TOP_K, self.SIM_MIN_SCORE)
+        return item_ids, cooc_matrix, rows, cols, scores
+
+    def _save_snapshot(self, item_ids, cooc_matrix, rows, cols, scores, compra_ids):
+        """
+        Guarda el modelo recién publicado: índice de ítems, co-ocurrencias y similitud (CSR),
+        matriz Item-Género y rankings de popularidad, con la marca de agua de Compras.
+        """
+        n_items = len(item_ids)
+        cooc = sp.csr_matrix(cooc_matrix)
+        similarity = sp.csr_matrix((scores, (rows, cols)), shape=(n_items, n_items))
+        similarity.sort_indices()
+
+        arrays = {
+            "item_ids": np.asarray(item_ids, dtype=np.int32),
+            "cooc_indptr": cooc.indptr.astype(np.int64),
+            "cooc_indices": cooc.indices.astype(np.int32),
+            "cooc_data": cooc.data.astype(np.int64),
+            "cooc_counts": cooc.diagonal().astype(np.int64),
+            "similarity_indptr": similarity.indptr.astype(np.int64),
+            "similarity_indices": similarity.indices.astype(np.int32),
+            "similarity_scores": similarity.data.astype(SIMILARITY_SCORE_DTYPE),
+        }
+
+        metadata = {
+            "similarity": {
+                "top_k": self.SIM_TOP_K,
+                "min_score": self.SIM_MIN_SCORE,
+                "pairs": int(similarity.nnz),
+                "score_dtype": SIMILARITY_SCORE_DTYPE,
+            },
+        }
+        if self._write_snapshot(arrays, metadata, compra_ids) is not None:
+            self.similarity_model.refresh()
+        else:
+            # El modelo mapeado quedaría desfasado de MatrizSimilitud: el CF vuelve a consultar la BD
+            self.similarity_model.clear()
+
+    def _write_snapshot(self, model_arrays: dict, model_metadata: dict, compra_ids):
+        """
+        Parte común de los snapshots de ambos backends: agrega la matriz Item-Género, los rankings
+        de popularidad y la marca de agua de Compras. Devuelve la versión escrita (None si falló).
+        """
+        arrays = dict(model_arrays)
+        features, fingerprint = self.item_features.snapshot_state()
+        if features is not None:
+            arrays["feature_item_ids"] = features.item_ids
+            arrays["feature_genre_ids"] = features.genre_ids
+            arrays["feature_matrix"] = features.matrix
+
+        arrays.update(self.popularity.to_arrays())
+        content = None
+        if self.CBF_BACKEND == "attributes" and self.content_index.ready:
+            arrays.update(self.content_index.to_arrays())
+            content = self.content_index.params
+
+        metadata = {
+            "watermark": int(compra_ids.max()),
+            "purchases": int(len(compra_ids)),
+            "cf_backend": self.CF_BACKEND,
+            **model_metadata,
+            "content": content,
+            "features_fingerprint": list(fingerprint) if fingerprint is not None else None,
+        }
+        return self.snapshots.save(arrays, metadata)
+
+    def load_snapshot(self, with_counts: bool = True):
+        """
+        Carga el último snapshot válido: modelo CF (co-ocurrencias o factores, según el backend),
+        popularidad y matriz de características quedan listos sin re-entrenar.
+        Sin 'with_counts' (procesos que no entrenan) no se arman los conteos de co-ocurrencia en
+        memoria ni se revisa MatrizSimilitud: el CF se sirve sólo desde la similitud mapeada.
+        Devuelve la marca de agua si además está al día con Compras (None: hay que re-entrenar).
+        """
+        snapshot = self.snapshots.load_latest()
+        if snapshot is None:
+            logger.info("[Snapshot] No hay snapshots del modelo, se entrena desde cero.")
+            return None
+
+        # El modelo CF sólo sirve si el snapshot es del backend configurado; el resto se carga igual
+        backend = snapshot.manifest.get("cf_backend", "item_item")
+        if backend != self.CF_BACKEND:
+            logger.info(f"[Snapshot] Versión {snapshot.version} es del backend '{backend}', se entrena '{self.CF_BACKEND}'.")
+        elif backend == "als":
+            params = snapshot.manifest["als"]
+            self.factor_model.load_arrays(snapshot.arrays, params["regularization"], params["alpha"])
+        elif with_counts:
+            if "cooc_counts" in snapshot.arrays:
+                self.cooc_index.load_arrays(snapshot.arrays)
+            self.similarity_model.refresh()
+        else:
+            self.cooc_index.mark_loaded()
+            self.similarity_model.refresh()
+        self.popularity.load_arrays(snapshot.arrays)
+        if self.CBF_BACKEND == "attributes" and snapshot.manifest.get("content") == self.content_index.params:
+            self.content_index.load_arrays(snapshot.arrays)
+
+        if "feature_matrix" in snapshot.arrays:
+            fingerprint = snapshot.manifest.get("features_fingerprint")
+            self.item_features.seed(
+                ItemFeatures(snapshot["feature_item_ids"], snapshot["feature_genre_ids"], snapshot["feature_matrix"]),
+                tuple(fingerprint) if fingerprint is not None else None
+            )
+
+        if not with_counts:
+            logger.info(f"[Snapshot] Cargada la versión {snapshot.version} (compra_id <= {snapshot.watermark}).")
+            return None
+
+        if not self._snapshot_is_current(snapshot):
+            logger.info(f"[Snapshot] Versión {snapshot.version} desactualizada respecto de Compras: se re-entrena.")
+            return None
+
+        # Los datos no cambiaron: si MatrizSimilitud no coincide (ej: BD restaurada), se repone desde el snapshot
+        if backend == "item_item":
+            pairs = snapshot.manifest["similarity"]["pairs"]
+            if fetch_scalar("SELECT COUNT(*) FROM MatrizSimilitud", default=-1) != pairs:
+                logger.warning("[Snapshot] MatrizSimilitud no coincide con el snapshot, se restaura.")
+                item_ids = snapshot["item_ids"]
+                indptr = snapshot["similarity_indptr"]
+                ia = item_ids[np.repeat(np.arange(len(item_ids)), np.diff(indptr))]
+                ib = item_ids[snapshot["similarity_indices"]]
+                self._persist_similarity(ia, ib, snapshot["similarity_scores"].astype(np.float64))
+
+        logger.info(f"[Snapshot] Modelo versión {snapshot.version} al día (compra_id <= {snapshot.watermark}).")
+        return snapshot.watermark
+
+    def _snapshot_is_current(self, snapshot):
+        manifest = snapshot.manifest
+        if manifest.get("cf_backend", "item_item") != self.CF_BACKEND:
+            return False
+        if self.CF_BACKEND == "als":
+            if manifest["als"] != self.ALS_PARAMS:
+                return False
+        else:
+            similarity = manifest["similarity"]
+            if similarity["top_k"] != self.SIM_TOP_K or similarity["min_score"] != self.SIM_MIN_SCORE:
+                return False
+            # Snapshots anteriores sin los conteos por ítem: no hay sobre qué aplicar compras
+            if "cooc_counts" not in snapshot.arrays:
+                return False
+        if self.CBF_BACKEND == "attributes" and manifest.get("content") != self.content_index.params:
+            return False
+
+        rows = fetch_rows("SELECT COALESCE(MAX(compra_id), 0) AS watermark, COUNT(*) AS total FROM Compras")
+        if not rows:
+            return False
+        return rows[0].watermark == snapshot.watermark and rows[0].total == manifest["purchases"]
+
+    def _persist_similarity(self, ia, ib, scores):
+        """
+        Carga los pares con COPY en una tabla staging y la intercambia por MatrizSimilitud
+        en la misma transacción: quien lee ve el modelo anterior completo o el nuevo completo.
+        """
+        buffer = io.StringIO()
+        pd.DataFrame({"a": ia, "b": ib, "sc": scores}).to_csv(buffer, index=False, header=False)
+
+        # Tabla staging sin índices: se crean después del COPY (carga más rápida)
+        before = [
+            "DROP TABLE IF EXISTS MatrizSimilitud_staging",
+            """
+            CREATE TABLE MatrizSimilitud_staging (
+                item_id_a INTEGER NOT NULL,
+                item_id_b INTEGER NOT NULL,
+                score FLOAT NOT NULL
+            )
+            """,
+        ]
+        copy_sql = "COPY MatrizSimilitud_staging (item_id_a, item_id_b, score) FROM STDIN WITH (FORMAT csv)"
+
+        # Mismo esquema que init_db.sql, luego swap y renombrado a los nombres originales
+        after = [
+            "ALTER TABLE MatrizSimilitud_staging ADD CONSTRAINT matrizsimilitud_staging_pkey PRIMARY KEY (item_id_a, item_id_b)",
+            "ALTER TABLE MatrizSimilitud_staging ADD CONSTRAINT matrizsimilitud_staging_item_id_a_fkey FOREIGN KEY (item_id_a) REFERENCES Items(item_id)",
+            "ALTER TABLE MatrizSimilitud_staging ADD CONSTRAINT matrizsimilitud_staging_item_id_b_fkey FOREIGN KEY (item_id_b) REFERENCES Items(item_id)",
+            "CREATE INDEX idx_similitud_a_staging ON MatrizSimilitud_staging(item_id_a)",
+            "DROP TABLE IF EXISTS MatrizSimilitud",
+            "ALTER TABLE MatrizSimilitud_staging RENAME TO MatrizSimilitud",
+            "ALTER TABLE MatrizSimilitud RENAME CONSTRAINT matrizsimilitud_staging_pkey TO matrizsimilitud_pkey",
+            "ALTER TABLE MatrizSimilitud RENAME CONSTRAINT matrizsimilitud_staging_item_id_a_fkey TO matrizsimilitud_item_id_a_fkey",
+            "ALTER TABLE MatrizSimilitud RENAME CONSTRAINT matrizsimilitud_staging_item_id_b_fkey TO matrizsimilitud_item_id_b_fkey",
+            "ALTER INDEX idx_similitud_a_staging RENAME TO idx_similitud_a",
+        ]
+        copy_in_transaction(copy_sql, buffer, before=before, after=after)
+
+    @stage_timings.timed("train.incremental")
+    def update_model_incremental(self, item_id: int, previous_items: set):
+        """
+        Actualiza sólo la fila/columna del ítem comprado en MatrizSimilitud,
+        usando los conteos de co-ocurrencia en memoria.
+        """
+        if self.CF_BACKEND == "als":
+            # Con factores no hay filas que actualizar: el fold-in toma la compra del contexto
+            if item_id not in previous_items:
+                self.factor_model.add_purchase()
+            return
+
+        changed = self.cooc_index.add_purchase(item_id, previous_items)
+        if not changed:
+            return
+
+        if self.SIM_TOP_K > 0 or self.SIM_MIN_SCORE > 0:
+            # Con poda, el cambio del ítem puede alterar el Top-K de sus vecinos:
+            # reescribimos completas las filas del ítem y de cada vecino.
+            affected = {item_id} | {ib for _, ib, _ in changed}
+            new_rows = self.cooc_index.pruned_rows(affected, self.SIM_TOP_K, self.SIM_MIN_SCORE)
+
+            sql_update = f"DELETE FROM MatrizSimilitud WHERE item_id_a IN ({','.join(map(str, affected))});"
+            if new_rows:
+                values_list = [f"({ia}, {ib}, {sc})" for ia, ib, sc in new_rows]
+                sql_update += f" INSERT INTO MatrizSimilitud (item_id_a, item_id_b, score) VALUES {','.join(values_list)}"
+            execute_non_query(sql_update)
+            self.similarity_model.replace_rows(affected, new_rows)
+        else:
+            values_list = [f"({ia}, {ib}, {sc})" for ia, ib, sc in changed]
+            sql_upsert = f"""
+                INSERT INTO MatrizSimilitud (item_id_a, item_id_b, score) VALUES {','.join(values_list)}
+                ON CONFLICT (item_id_a, item_id_b) DO UPDATE SET score = EXCLUDED.score
+            """
+            execute_non_query(sql_upsert)
+            self.similarity_model.upsert_pairs(changed)
+
+        logger.info(f"[Training] Actualización incremental: {len(changed)} relaciones del ítem {item_id}.")
+
+    def previous_items(self, user_id: int, compra_id: int):
+        """
+        Ítems distintos que el usuario había comprado antes de la compra 'compra_id'.
+        """
+        sql = "SELECT DISTINCT item_id FROM Compras WHERE user_id = :uid AND compra_id < :cid"
+        rows = fetch_rows(sql, params={"uid": user_id, "cid": compra_id})
+        if rows is None:
+            raise RuntimeError("No se pudieron leer las compras previas del usuario.")
+        return {row[0] for row in rows}
+
+    @stage_timings.timed("train.poll")
+    def purchases_since(self, watermark: int, limit: int):
+        """
+        Compras con compra_id > 'watermark' en orden, con los ítems que cada usuario ya tenía
+        (lo que necesita la actualización incremental). Las lee el proceso que entrena, así que
+        incluye las registradas por cualquier worker.
+        """
+        sql = """
+            SELECT c.compra_id, c.user_id, c.item_id,
+                   ARRAY(SELECT DISTINCT p.item_id FROM Compras p
+                         WHERE p.user_id = c.user_id AND p.compra_id < c.compra_id) AS previous_items
+            FROM Compras c
+            WHERE c.compra_id > :after
+            ORDER BY c.compra_id
+            LIMIT :limit
+        """
+        rows = fetch_rows(sql, params={"after": watermark, "limit": limit})
+        if rows is None:
+            raise RuntimeError("No se pudieron leer las compras nuevas.")
+        return [PendingPurchase(r.compra_id, r.user_id, r.item_id, set(r.previous_items)) for r in rows]
+
+    def _get_collaborative_filtering_candidates(self, context: UserContext):
         """
-        Versión Optimizada: Consulta la BD en lugar de calcular al vuelo.
+        Versión Optimizada: usa el modelo persistido en lugar de calcular al vuelo.
+        Con un snapshot mapeado se resuelve en proceso (gather + promedio en NumPy);
+        si no, se consulta MatrizSimilitud en la BD.
+        Devuelve (item_ids, scores) como arrays alineados.
         """
+        if not context.purchases:
+            return _empty_candidates()
+
+        if self.CF_BACKEND == "als" and self.factor_model.ready:
+            return self.factor_model.candidates(context.user_id, context.purchases, self.CF_LIMIT)
+
+        if self.similarity_model.available():
+            return self.similarity_model.candidates(context.purchases, self.CF_LIMIT)
+
         logger.debug("Consultando Modelo CF persistido en BD...") 
         
         # Lógica SQL:
-        # 1. Encuentra mis compras (Items A)
+        # 1. Mis compras (Items A) vienen en el contexto, no hace falta leer Compras
         # 2. Busca en MatrizSimilitud los Items B que sean parecidos a A.
         # 3. Excluye los que ya compré.
         # 4. Promedia el score.
-        
         sql = """
             SELECT 
                 ms.item_id_b as item_id,
                 AVG(ms.score) as score_cf
-            FROM Compras c
+            FROM unnest(CAST(:items AS INTEGER[])) AS c(item_id)
             JOIN MatrizSimilitud ms ON c.item_id = ms.item_id_a
-            WHERE c.user_id = :uid
-            AND ms.item_id_b NOT IN (SELECT item_id FROM Compras WHERE user_id = :uid)
+            WHERE ms.item_id_b <> ALL(CAST(:items AS INTEGER[]))
             GROUP BY ms.item_id_b
             ORDER BY score_cf DESC
-            LIMIT 20
+            LIMIT :limit
         """
         
-        df_recs = get_data_as_dataframe(sql, params={"uid": user_id})
+        candidates = fetch_arrays(sql, params={"items": context.purchases, "limit": self.CF_LIMIT}, dtypes=(np.int64, np.float64))
         
-        if df_recs is not None and not df_recs.empty:
-            return df_recs.to_dict(orient="records")
+        if candidates is not None and len(candidates[0]) > 0:
+            return candidates
         
         logger.debug("No se encontraron candidatos CF.")
 
-        return []
+        return _empty_candidates()
 
-    def _get_content_based_candidates(self, user_id: int):
+    def _cf_in_process(self):
+        """
+        True si el CF se resuelve en memoria (factores ALS o modelo Item-Item mapeado), sin consultar la BD.
+        """
+        if self.CF_BACKEND == "als" and self.factor_model.ready:
+            return True
+        return self.similarity_model.available()
+
+    async def _cf_candidates_async(self, user_id: int):
+        """
+        Candidatos CF de la versión asíncrona: por SQL (en paralelo con el contexto) o None si el CF
+        se resuelve en proceso, en cuyo caso se calcula junto con el ranking a partir del contexto.
+        """
+        if self.similarity_model.poll_due():
+            # Buscar un snapshot más nuevo lee el disco: fuera del event loop
+            await asyncio.to_thread(self.similarity_model.refresh)
+        if self._cf_in_process():
+            return None
+        return await self._get_collaborative_filtering_candidates_async(user_id)
+
+    @stage_timings.timed("cf")
+    async def _get_collaborative_filtering_candidates_async(self, user_id: int):
+        """
+        Igual que _get_collaborative_filtering_candidates, pero leyendo las compras desde Compras
+        para no depender del contexto: así se puede consultar en paralelo con él.
+        """
+        sql = """
+            SELECT 
+                ms.item_id_b as item_id,
+                AVG(ms.score) as score_cf
+            FROM Compras c
+            JOIN MatrizSimilitud ms ON c.item_id = ms.item_id_a
+            WHERE c.user_id = :uid
+              AND ms.item_id_b NOT IN (SELECT item_id FROM Compras WHERE user_id = :uid)
+            GROUP BY ms.item_id_b
+            ORDER BY score_cf DESC
+            LIMIT :limit
+        """
+
+        candidates = await fetch_arrays_async(sql, params={"uid": user_id, "limit": self.CF_LIMIT}, dtypes=(np.int64, np.float64))
+
+        if candidates is not None and len(candidates[0]) > 0:
+            return candidates
+
+        return _empty_candidates()
+
+    @stage_timings.timed("cbf")
+    def _get_content_based_candidates(self, context: UserContext, k: int = None, keep_ids=None):
         """
         Calcula candidatos basándose en la similitud de atributos (Géneros).
         Crea un perfil del usuario promediando sus compras y busca ítems similares (Coseno).
+        Con CBF_BACKEND=attributes se usan en cambio los vecinos precalculados del índice de contenido.
+        Con 'k' no se devuelve todo el catálogo sino lo que puede entrar al Top K híbrido (ver
+        _top_content_candidates) y los ítems de 'keep_ids' (candidatos CF), que necesitan su score CBF.
+        Devuelve (item_ids, scores) como arrays alineados, ordenados por item_id.
         """
+        if self.CBF_BACKEND == "attributes" and self.content_index.ready:
+            return self.content_index.candidates(context.purchased, self.CBF_MIN_SCORE)
+
         logger.debug("Calculando: Content-Based Filtering (Perfil de Usuario)...") 
         
-        # 1. Obtener Metadatos (Géneros) de todos los ítems
-        #    Traemos item_id y el nombre del género para hacer One-Hot Encoding
-        sql_items = """
-            SELECT i.item_id, g.nombre as genero 
-            FROM Items i
-            JOIN ItemGeneros ig ON i.item_id = ig.item_id
-            JOIN Generos g ON ig.genero_id = g.genero_id
-        """
-        df_items = get_data_as_dataframe(sql_items)
+        # 1. Matriz de características (Item-Géneros) cacheada en memoria
+        features = self.item_features.get()
         
-        # 2. Obtener historial de compras del usuario
-        sql_bought = "SELECT item_id FROM Compras WHERE user_id = :uid"
-        df_bought = get_data_as_dataframe(sql_bought, params={"uid": user_id})
+        # 2. Historial de compras del usuario (del contexto)
+        bought_ids = context.purchased
         
-        if df_items is None or df_bought is None or df_bought.empty:
-            return []
-            
-        bought_ids = df_bought["item_id"].tolist()
+        if features is None or not bought_ids:
+            return _empty_candidates()
         
-        # 3. Construir la Matriz de Características (Item-Features)
-        #    Queremos una tabla donde: Índice=Item, Columnas=Géneros, Valor=1 si lo tiene.
-        item_features = pd.get_dummies(df_items.set_index('item_id')['genero'])
-        item_features = item_features.groupby('item_id').sum()
+        # 3. Construir el Perfil del Usuario (Vector Promedio)
+        #    Tomamos las filas de los ítems que el usuario compró (sólo los que tienen metadatos).
+        history_rows = features.rows_for(bought_ids)
         
-        # 4. Construir el Perfil del Usuario (Vector Promedio)
-        #    Filtramos la matriz maestra para quedarnos solo con los ítems que el usuario compró.
-        #    Aseguramos que solo usamos items que existen en item_features (intersección).
-        user_history_features = item_features.loc[item_features.index.isin(bought_ids)]
-        
-        if user_history_features.empty:
+        if len(history_rows) == 0:
             logger.warning("El usuario compró ítems sin metadatos de género.") 
-            return []
+            return _empty_candidates()
             
-        # El "Perfil" es el promedio de los vectores de sus compras.
-        # Ej: Si compró 9 rocks y 1 jazz, su vector será 0.9 Rock y 0.1 Jazz.
-        user_profile = user_history_features.mean().values.reshape(1, -1)
+        # El "Perfil" es la suma de los vectores de sus compras (el promedio da el mismo coseno).
+        # Ej: Si compró 9 rocks y 1 jazz, su vector será 9 Rock y 1 Jazz.
+        user_profile = features.matrix[history_rows].sum(axis=0)
+        if not user_profile.any():
+            return _empty_candidates()
         
-        # 5. Calcular Similitud Coseno (Perfil vs Catálogo)
-        #    Comparamos el vector del usuario contra TODOS los ítems del catálogo.
-        similarity_scores = cosine_similarity(user_profile, item_features.values)
-        
-        # 6. Empaquetar resultados
-        recommendations = []
-        all_item_ids = item_features.index.tolist()
-        
-        # similarity_scores es una matriz [[score1, score2, ...]], tomamos la fila 0
-        for idx, score in enumerate(similarity_scores[0]):
-            item_id = all_item_ids[idx]
-            
-            # Solo recomendamos si no lo ha comprado aún y tiene cierta similitud
-            if item_id not in bought_ids and score > 0.1:
-                recommendations.append({
-                    "item_id": int(item_id),
-                    "score_cbf": float(score)
-                })
-        
-        # Ordenamos solo para debug
-        recommendations.sort(key=lambda x: x['score_cbf'], reverse=True)
+        if k is not None:
+            return self._top_content_candidates(features, context, user_profile, history_rows, k, keep_ids)
+
+        # 4. Calcular Similitud Coseno (Perfil vs Catálogo) con un único producto matriz-vector,
+        #    con la misma aritmética que las recomendaciones en lote (ver genre_cosine)
+        similarity_scores = genre_cosine(features.matrix @ user_profile, user_profile, features.norms)
         
-        if recommendations: pass
+        # 5. Empaquetar resultados
+        #    Solo recomendamos si no lo ha comprado aún y tiene cierta similitud
+        candidates = similarity_scores > self.CBF_MIN_SCORE
+        candidates[history_rows] = False
+        candidate_rows = np.flatnonzero(candidates)
         
-        return recommendations
+        return features.item_ids[candidate_rows].astype(np.int64), similarity_scores[candidate_rows].astype(np.float64)
 
-    def _combine_and_rank(self, user_id: int, cf_recs: list, cbf_recs: list, w_cf: float, w_cbf: float):
+    def _top_content_candidates(self, features: ItemFeatures, context: UserContext, user_profile, history_rows, k: int, keep_ids):
         """
-        Unifica las listas de CF y CBF, aplica pesos y el Booster por preferencias explícitas.
+        Candidatos CBF que pueden entrar al Top K híbrido: los k de mayor score final fuera de CF
+        (w_cbf * score + refuerzo por géneros preferidos, las mismas operaciones que _combine_and_rank)
+        más los de 'keep_ids'. Cualquier otro ítem queda detrás de esos k, así que el Top K no cambia.
+        Los scores se calculan por firma de géneros y de cada firma se leen a lo sumo
+        k + len(historial) filas: el costo no depende del tamaño del catálogo.
+        Devuelve (item_ids, scores) ordenados por item_id.
         """
-        # 1. Crear diccionario maestro de scores
-        #    Estructura: { item_id: {'score': float, 'origin': str} }
-        combined_scores = {}
+        scores = genre_cosine(features.signatures @ user_profile, user_profile, features.signature_norms)
+        _, w_cbf = hybrid_weights(context.purchase_count)
+        final_scores = np.multiply(scores, float(w_cbf), dtype=np.float64)
+        if context.preferences:
+            preferred = features.preferred_signatures(context.preferences)
+            if preferred is not None:
+                final_scores += preferred * self.BOOST_VALUE
 
-        # Procesar CF ponderado
-        for item in cf_recs:
-            iid = item['item_id']
-            # Normalizamos score CF para que compita
-            raw_score = item['score_cf']
-            score = raw_score * w_cf
-            combined_scores[iid] = score
+        # Firmas candidatas de mayor a menor score final. Alcanza con las primeras que juntan
+        # k + len(historial) filas (más las empatadas con la última): de cada una se leen a lo sumo
+        # esas filas, y se ordenan por score final y fila (empates por item_id, como en el ranking)
+        eligible = np.flatnonzero(scores > self.CBF_MIN_SCORE)
+        eligible = eligible[np.argsort(-final_scores[eligible])]
+        history = np.sort(history_rows)
+        limit = k + len(history)
+        n_signatures = int(np.searchsorted(np.cumsum(np.minimum(features.signature_sizes[eligible], limit)), limit)) + 1
+        if n_signatures < len(eligible):
+            n_signatures = int(np.searchsorted(-final_scores[eligible], -final_scores[eligible[n_signatures - 1]], side="right"))
 
-        # Procesar CBF ponderado
-        for item in cbf_recs:
-            iid = item['item_id']
-            score = item['score_cbf'] * w_cbf
-            
-            # Si ya existe (vino por CF), sumamos. Si no, inicializamos.
-            if iid in combined_scores:
-                combined_scores[iid] += score
-            else:
-                combined_scores[iid] = score
+        selected = []
+        if n_signatures > 0 and len(eligible) > 0:
+            rows = features.signature_members[csr_row_offsets(features.signature_indptr, eligible[:n_signatures], limit)]
+            rows = rows[np.lexsort((rows, -final_scores[features.signature_of_row[rows]]))]
+            selected.append(rows[~lookup_sorted(history, rows)[1]][:k])
+
+        if keep_ids is not None and len(keep_ids) > 0:
+            keep_rows = features.rows_of(keep_ids)
+            keep_rows = keep_rows[keep_rows >= 0]
+            keep_rows = keep_rows[scores[features.signature_of_row[keep_rows]] > self.CBF_MIN_SCORE]
+            selected.append(keep_rows[~lookup_sorted(history, keep_rows)[1]])
+
+        if not selected:
+            return _empty_candidates()
+        rows = np.unique(np.concatenate(selected))
+        return features.item_ids[rows].astype(np.int64), scores[features.signature_of_row[rows]].astype(np.float64)
+
+    @stage_timings.timed("combine")
+    def _combine_and_rank(self, context: UserContext, cf_candidates: tuple, cbf_candidates: tuple, w_cf: float, w_cbf: float, k: int = None):
+        """
+        Unifica los candidatos de CF y CBF, aplica pesos y el Booster por preferencias explícitas.
+        Todo se calcula sobre arrays alineados por item_id, sin recorrer candidato por candidato.
+        Con 'k' sólo se seleccionan (argpartition) y ordenan los k mejores, no todo el catálogo.
+        """
+        cf_ids, cf_scores = cf_candidates
+        cbf_ids, cbf_scores = cbf_candidates
+
+        # 1. Alinear ambos modelos sobre el mismo vector de candidatos.
+        #    Los ids de CBF ya vienen únicos y ordenados (orden del catálogo): sólo se ubican los
+        #    pocos de CF (búsqueda binaria) y se agregan al final los que no están en CBF.
+        cf_pos = np.searchsorted(cbf_ids, cf_ids)
+        in_cbf = cf_pos < len(cbf_ids)
+        in_cbf[in_cbf] = cbf_ids[cf_pos[in_cbf]] == cf_ids[in_cbf]
+
+        candidate_ids = np.concatenate([cbf_ids, cf_ids[~in_cbf]])
+        combined_scores = np.concatenate([cbf_scores * w_cbf, cf_scores[~in_cbf] * w_cf])
+        # Procesar CF ponderado (si un ítem vino por ambos modelos, se suman)
+        np.add.at(combined_scores, cf_pos[in_cbf], cf_scores[in_cbf] * w_cf)
 
         # 2. Aplicar refuerzo de Preferencias Explícitas
+        #    ¿Tiene este álbum algún género que el usuario marcó como favorito? (máscara Item-Género)
+        if context.preferences and len(candidate_ids) > 0:
+            features = self.item_features.get()
+            if features is not None:
+                with stage_timings.timer("boost"):
+                    boosted = features.has_any_genre(candidate_ids, context.preferences)
+                    combined_scores += boosted * self.BOOST_VALUE
 
-        # Traer géneros explícitos del usuario
-        sql_prefs = "SELECT genero_id FROM PreferenciasUsuario WHERE user_id = :uid"
-        df_prefs = get_data_as_dataframe(sql_prefs, params={"uid": user_id})
-        
-        if df_prefs is not None and not df_prefs.empty and combined_scores:
-            user_explicit_genres = set(df_prefs["genero_id"].tolist())
-            candidate_ids = list(combined_scores.keys())
-            
-            # Traer géneros de los candidatos
-            if candidate_ids:
-                sql_item_genres = f"""
-                    SELECT item_id, genero_id 
-                    FROM ItemGeneros 
-                    WHERE item_id IN ({','.join(map(str, candidate_ids))})
-                """
-                df_item_genres = get_data_as_dataframe(sql_item_genres)
-                
-                if df_item_genres is not None:
-                    # Iterar para ver quién merece el refuerzo
-                    for iid in candidate_ids:
-                        # Géneros de este ítem
-                        genres_of_item = set(df_item_genres[df_item_genres['item_id'] == iid]['genero_id'])
-                        
-                        # Intersección: ¿Tiene este álbum algún género que yo marqué como favorito?
-                        if not genres_of_item.isdisjoint(user_explicit_genres):
-                            original = combined_scores[iid]
-                            combined_scores[iid] += self.BOOST_VALUE
-
-        # 3. Formatear salida final
-        final_list = []
-        for iid, score in combined_scores.items():
-            final_list.append({
-                "item_id": iid,
-                "score": score
-            })
-
-        # Ordenar descendente por score final
-        final_list.sort(key=lambda x: x['score'], reverse=True)
+        # 3. Enmascarar lo ya comprado (score -inf) antes de seleccionar, así el Top K sale completo
+        if context.purchased and len(candidate_ids) > 0:
+            combined_scores[_purchased_mask(candidate_ids, len(cbf_ids), context.purchases)] = -np.inf
+
+        # 4. Top K descendente por score final (empates por item_id) y formatear salida
+        order = top_k_indices(combined_scores, len(candidate_ids) if k is None else k, tie_keys=candidate_ids)
+        final_list = [
+            {"item_id": iid, "score": score}
+            for iid, score in zip(candidate_ids[order].tolist(), combined_scores[order].tolist())
+        ]
         
-        logger.info(f"Ranking híbrido generado con {len(final_list)} candidatos.") 
+        logger.info(f"Ranking híbrido generado con {len(final_list)} de {len(candidate_ids)} candidatos.") 
         return final_list
 
-    def _filter_purchased_items(self, user_id: int, recommendations: list):
+    @stage_timings.timed("filter")
+    def _filter_purchased_items(self, context: UserContext, recommendations: list):
         """
         Quita de la lista de recomendaciones los álbumes que el usuario ya compró.
         """
         if not recommendations:
             return []
             
-        sql_bought = "SELECT item_id FROM Compras WHERE user_id = :uid"
-        df_bought = get_data_as_dataframe(sql_bought, params={"uid": user_id})
-        
-        ids_bought = df_bought["item_id"].tolist() if df_bought is not None else []
+        ids_bought = context.purchased
         
         # Filtrar
         clean_list = [r for r in recommendations if r['item_id'] not in ids_bought]
         return clean_list
 
+    # =========================================================================
+    #                     RECOMENDACIONES EN LOTE (VARIOS USUARIOS)
+    # =========================================================================
+
+    @stage_timings.timed("batch")
+    def get_batch_recommendations(self, user_ids: list, top_k: int = 5):
+        """
+        Recomendaciones para muchos usuarios en una sola llamada.
+        Carga contextos y modelo una única vez, resuelve el híbrido con operaciones matriciales
+        y agrupa a los usuarios Cold Start con las mismas preferencias.
+        Devuelve ({ user_id: [items] }, [user_id inexistentes]).
+        """
+        started = time.monotonic()
+        model_version = self.model_state.version
+        unique_ids = list(dict.fromkeys(int(uid) for uid in user_ids))
+
+        # 1. Contextos de todos los usuarios en una sola consulta (con su última compra, que valida la caché)
+        contexts = load_user_contexts(unique_ids)
+        missing = [uid for uid in unique_ids if uid not in contexts]
+
+        # 2. Los que ya están en la caché no se recalculan
+        results = {}
+        pending = []
+        for uid, ctx in contexts.items():
+            cached = self.get_cached_recommendations(uid, top_k, ctx.last_purchase)
+            if cached is not None:
+                results[uid] = cached
+            else:
+                pending.append(ctx)
+
+        cold_start = [ctx for ctx in pending if ctx.purchase_count < 1]
+        hybrid = [ctx for ctx in pending if ctx.purchase_count >= 1]
+        logger.info(f"[Lote] {len(results)} desde caché, {len(hybrid)} híbridos, {len(cold_start)} Cold Start, {len(missing)} inexistentes.")
+
+        raw_recs = {}
+
+        # 3. Cold Start: una sola mezcla por combinación de géneros preferidos
+        by_preferences = {}
+        for ctx in cold_start:
+            by_preferences.setdefault(tuple(ctx.preferences), []).append(ctx)
+        for group in by_preferences.values():
+            recs = self._get_cold_start_items(group[0], top_k)
+            for ctx in group:
+                raw_recs[ctx.user_id] = recs
+
+        # 4. Híbrido en bloques matriciales
+        if hybrid:
+            raw_recs.update(self._get_hybrid_batch(hybrid, top_k))
+
+        # 5. Enriquecer todo con una sola consulta a Items
+        details_map = self._load_item_details([r["item_id"] for recs in raw_recs.values() for r in recs])
+        for uid, recs in raw_recs.items():
+            results[uid] = self._enrich_results(recs, details_map)
+            self.results_cache.put(uid, top_k, model_version, contexts[uid].last_purchase, results[uid], computed_since=started)
+
+        ordered = {uid: results[uid] for uid in unique_ids if uid in results}
+        return ordered, missing
+
+    def _get_hybrid_batch(self, contexts: list, k: int):
+        """
+        Pipeline híbrido para varios usuarios, con el modelo CF y la matriz de características
+        cargados una sola vez y alineados sobre el mismo índice de ítems.
+        El modelo Item-Item sale del snapshot mapeado si lo hay (sin leer MatrizSimilitud entera)
+        y los bloques de usuarios se achican con el catálogo (ver batch_chunk_size).
+        """
+        features = self.item_features.get()
+        use_factors = self.CF_BACKEND == "als" and self.factor_model.ready
+        sim_arrays = None
+        if not use_factors:
+            if self.similarity_model.available():
+                sim_arrays = self.similarity_model.pairs()
+            if sim_arrays is None:
+                sim_arrays = fetch_arrays(
+                    "SELECT item_id_a, item_id_b, score FROM MatrizSimilitud", dtypes=(np.int64, np.int64, np.float64)
+                )
+        if sim_arrays is None:
+            sim_arrays = (np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.float64))
+
+        use_content = self.CBF_BACKEND == "attributes" and self.content_index.ready
+
+        # Índice de ítems común: catálogo con metadatos + ítems del modelo CF (y del índice de contenido)
+        extra_item_ids = np.union1d(
+            self.factor_model.item_ids if use_factors else np.array([], dtype=np.int64),
+            self.content_index.item_ids if use_content else np.array([], dtype=np.int64),
+        )
+        if features is not None:
+            aligned = align_hybrid_model(*sim_arrays, features.item_ids, features.matrix, extra_item_ids)
+        else:
+            aligned = align_hybrid_model(*sim_arrays, np.array([], dtype=np.int64), np.zeros((0, 0)), extra_item_ids)
+        item_ids, similarity, item_features = aligned
+        n_items = len(item_ids)
+        n_genres = item_features.shape[1]
+        if use_factors:
+            item_factors = align_factors(item_ids, self.factor_model.item_ids, self.factor_model.item_factors)
+        if use_content:
+            content_matrix, content_neighbors = align_content(
+                item_ids, self.content_index.item_ids, self.content_index.matrix, self.content_index.neighbor_matrix
+            )
+
+        recommendations = {}
+        chunk_size = batch_chunk_size(n_items, self.BATCH_MAX_CELLS, self.BATCH_CHUNK_SIZE)
+        for start in range(0, len(contexts), chunk_size):
+            chunk = contexts[start:start + chunk_size]
+
+            # Matriz de compras del bloque (cantidad de compras por ítem, ignorando ítems fuera del índice)
+            user_rows = np.repeat(np.arange(len(chunk)), [len(ctx.purchases) for ctx in chunk])
+            bought_ids = np.fromiter((iid for ctx in chunk for iid in ctx.purchases), dtype=np.int64, count=len(user_rows))
+            known = np.isin(bought_ids, item_ids)
+            purchases = sp.csr_matrix(
+                (np.ones(known.sum()), (user_rows[known], np.searchsorted(item_ids, bought_ids[known]))),
+                shape=(len(chunk), n_items)
+            )
+
+            # Géneros explícitos del bloque
+            preferences = np.zeros((len(chunk), n_genres), dtype=bool)
+            if features is not None:
+                for row, ctx in enumerate(chunk):
+                    preferences[row] = np.isin(features.genre_ids, ctx.preferences)
+
+            # Scores CF del bloque según el backend
+            if use_factors:
+                user_vectors = self.factor_model.user_vectors([ctx.user_id for ctx in chunk], [ctx.purchases for ctx in chunk])
+                cf_scores, cf_valid = factor_scores(user_vectors, item_factors)
+            else:
+                cf_scores, cf_valid = item_item_scores(purchases, similarity)
+
+            # Scores CBF del bloque según el backend
+            bought = purchases.toarray() > 0
+            if use_content:
+                cbf_scores, cbf_valid = content_neighbor_scores(bought, content_matrix, content_neighbors, self.CBF_MIN_SCORE)
+            else:
+                cbf_scores, cbf_valid = genre_profile_scores(bought, item_features, self.CBF_MIN_SCORE)
+
+            w_cf, w_cbf = hybrid_weights([ctx.purchase_count for ctx in chunk])
+            ranked = rank_hybrid_batch(
+                purchases, cf_scores, cf_valid, cbf_scores, cbf_valid, item_features, preferences,
+                w_cf, w_cbf, self.BOOST_VALUE, k, cf_limit=self.CF_LIMIT
+            )
+
+            for ctx, (cols, scores) in zip(chunk, ranked):
+                if len(cols) == 0:
+                    # Fallback de seguridad, igual que en el pipeline individual
+                    recommendations[ctx.user_id] = self._get_global_top_sellers(k)
+                else:
+                    recommendations[ctx.user_id] = [
+                        {"item_id": iid, "score": score}
+                        for iid, score in zip(item_ids[cols].tolist(), scores.tolist())
+                    ]
+
+        return recommendations
+
     # =========================================================================
     #                            LÓGICA COLD START
     # =========================================================================
 
-    def _get_cold_start_items(self, user_id: int, k: int):
+    @stage_timings.timed("cold_start")
+    def _get_cold_start_items(self, context: UserContext, k: int):
         """
         Estrategia Mejorada: Round Robin por Género.
         Garantiza diversidad iterando sobre cada género preferido.
         """
-        # Obtener géneros
-        sql_prefs = "SELECT genero_id FROM PreferenciasUsuario WHERE user_id = :uid"
-        df_prefs = get_data_as_dataframe(sql_prefs, params={"uid": user_id})
-        
-        if df_prefs is None or df_prefs.empty:
+        # Géneros preferidos (del contexto)
+        if not context.preferences:
             return self._get_global_top_sellers(k)
             
-        mis_generos = df_prefs["genero_id"].tolist()
-        
-        # Round Robin
-        candidates = []
+        mis_generos = context.preferences
+        self.popularity.ensure_ready()
         
         # Calculamos cuántos traer por género para tener de sobra 
         # (ej: si pide 5 y tiene 2 géneros, traemos 3 de c/u)
         limit_per_genre = (k // len(mis_generos)) + 2 
         
-        for gid in mis_generos:
-            # Query específica para CADA género
-            sql_genre = """
-                SELECT 
-                    i.item_id, i.titulo, i.artista, COUNT(c.compra_id) as ventas
-                FROM Items i
-                JOIN ItemGeneros ig ON i.item_id = ig.item_id
-                LEFT JOIN Compras c ON i.item_id = c.item_id
-                WHERE ig.genero_id = :gid
-                GROUP BY i.item_id, i.titulo, i.artista
-                ORDER BY ventas DESC
-                LIMIT :lim
-            """
-            df_g = get_data_as_dataframe(sql_genre, params={"gid": gid, "lim": limit_per_genre})
-            
-            if df_g is not None and not df_g.empty:
-                # Convertimos a lista de dicts y la agregamos a una lista de listas
-                candidates.append(df_g.to_dict(orient="records"))
-        
-        # Mezclar resultados
-        final_recommendations = []
-        keep_going = True
-        idx = 0
-        
-        # Mientras no hayamos llenado el cupo K y sigamos teniendo ítems para sacar
-        while len(final_recommendations) < k and keep_going:
-            keep_going = False
-            for genre_list in candidates:
-                if idx < len(genre_list):
-                    item = genre_list[idx]
-                    # Evitar duplicados (un álbum podría estar en dos géneros)
-                    if item["item_id"] not in [x["item_id"] for x in final_recommendations]:
-                        final_recommendations.append(item)
-                        keep_going = True
-                    
-                    if len(final_recommendations) >= k:
-                        break
-            idx += 1
+        # Round Robin sobre los rankings por género precalculados (sin consultar la BD)
+        final_recommendations = self.popularity.round_robin(mis_generos, k, limit_per_genre)
             
         # Relleno de seguridad: si no llegamos a K por escasez, rellenamos con populares globales
         if len(final_recommendations) < k:
-            needed = k - len(final_recommendations)
-            global_top = self._get_global_top_sellers(k + len(final_recommendations)) # exceso por las dudas
-            
-            for item in global_top:
-                # Agregar si no fue recomendado ya
-                if item["item_id"] not in [x["item_id"] for x in final_recommendations]:
-                    final_recommendations.append(item)
-                    if len(final_recommendations) >= k:
-                        break
+            already = {x["item_id"] for x in final_recommendations}
+            final_recommendations += self.popularity.top(k - len(final_recommendations), exclude=already)
                         
         return final_recommendations
 
+    @stage_timings.timed("top_sellers")
     def _get_global_top_sellers(self, k: int):
         """
         Fallback: los más vendidos de toda la tienda sin importar género.
         """
-        sql = """
-            SELECT i.item_id, i.titulo, i.artista, COUNT(c.compra_id) as ventas
-            FROM Items i
-            LEFT JOIN Compras c ON i.item_id = c.item_id
-            GROUP BY i.item_id, i.titulo, i.artista
-            ORDER BY ventas DESC
-            LIMIT :limit
-        """
-        df = get_data_as_dataframe(sql, params={"limit": k})
-        return df.to_dict(orient="records") if df is not None else []
+        self.popularity.ensure_ready()
+        return self.popularity.top(k)
     
     # =========================================================================
     #                      GESTIÓN DE USUARIOS Y TRANSACCIONES
     # =========================================================================
     
+    @stage_timings.timed("create_user")
     def create_user(self, username: str, attributes: dict):
         """
         Crea usuario con username opcional y procesa atributos (como géneros favoritos).
+        Usuario y preferencias se insertan en una sola sentencia (un round trip, una transacción):
+        el id sale del RETURNING, así que dos altas simultáneas nunca se confunden.
         """
-        # 1. Insertar usuario en la tabla
-        sql_user = "INSERT INTO Usuarios (username, fecha_creacion) VALUES (:uname, NOW()) RETURNING user_id"
-        
-        execute_non_query(
-            "INSERT INTO Usuarios (username, fecha_creacion) VALUES (:uname, NOW())",
-            params={"uname": username}
+        rows = execute_returning(_CREATE_USER_SQL, params=_create_user_params(username, attributes))
+        if not rows:
+            raise RuntimeError("No se pudo crear el usuario (¿géneros inexistentes?).")
+
+        return int(rows[0][0])
+
+    @stage_timings.timed("create_user")
+    async def create_user_async(self, username: str, attributes: dict):
+        """
+        Versión asíncrona de create_user (misma sentencia, motor asyncpg).
+        """
+        rows = await execute_returning_async(_CREATE_USER_SQL, params=_create_user_params(username, attributes))
+        if not rows:
+            raise RuntimeError("No se pudo crear el usuario (¿géneros inexistentes?).")
+
+        return int(rows[0][0])
+
+    @stage_timings.timed("create_user.bulk")
+    def import_users_bulk(self, batch: UserBatch):
+        """
+        Alta de muchos usuarios con sus preferencias en UNA transacción (para migrar cuentas).
+        Los géneros se validan en bloque antes de insertar: si alguno no existe no se inserta nada.
+        Devuelve un resumen con los ids asignados, en el mismo orden que los usuarios recibidos.
+        """
+        known_genres = self._existing_ids("Generos", "genero_id", batch.genre_ids())
+        summary = {
+            "received": len(batch),
+            "created": 0,
+            "user_ids": [],
+            "unknown_genre_ids": np.setdiff1d(batch.genre_ids(), known_genres).tolist(),
+        }
+        if summary["unknown_genre_ids"] or len(batch) == 0:
+            return summary
+
+        # Ids reservados de la secuencia de Usuarios (los mismos que daría el SERIAL, sin carreras)
+        reserved = fetch_arrays(
+            "SELECT nextval(pg_get_serial_sequence('Usuarios', 'user_id')) FROM generate_series(1, :n)",
+            params={"n": len(batch)}, dtypes=[np.int64],
         )
-        
-        # Recuperamos el ID generado
-        df = get_data_as_dataframe("SELECT MAX(user_id) as id FROM Usuarios")
-        new_user_id = int(df.iloc[0]["id"])
+        if reserved is None:
+            raise RuntimeError("No se pudieron reservar los ids de los usuarios.")
+        user_ids = np.sort(reserved[0]).tolist()
 
-        # 2. Procesar Preferencias (Cold Start)
-        generos = attributes.get("generos_id", [])
-        
-        if generos and isinstance(generos, list):
-            for genero_id in generos:
-                sql_pref = "INSERT INTO PreferenciasUsuario (user_id, genero_id) VALUES (:uid, :gid)"
-                execute_non_query(sql_pref, params={"uid": new_user_id, "gid": genero_id})
-            
-        return new_user_id
+        # COPY a una tabla temporal y de ahí a Usuarios y PreferenciasUsuario
+        before = [
+            "CREATE TEMP TABLE Usuarios_staging "
+            "(user_id INTEGER, username VARCHAR(100), generos INTEGER[], fecha_creacion TIMESTAMPTZ) ON COMMIT DROP",
+        ]
+        copy_sql = "COPY Usuarios_staging (user_id, username, generos, fecha_creacion) FROM STDIN WITH (FORMAT csv)"
+        after = [
+            "INSERT INTO Usuarios (user_id, username, fecha_creacion) "
+            "SELECT user_id, username, COALESCE(fecha_creacion, NOW()) FROM Usuarios_staging",
+            "INSERT INTO PreferenciasUsuario (user_id, genero_id) "
+            "SELECT user_id, unnest(generos) FROM Usuarios_staging",
+        ]
+        summary["created"] = copy_in_transaction(copy_sql, batch.to_csv(user_ids), before, after)
+        summary["user_ids"] = user_ids
+        return summary
 
     def add_transaction(self, user_id: int, item_id: int):
         """
         Registra compra y actualiza el modelo.
+        Las compras previas del usuario (fila de la matriz User-Item antes de la compra) no se leen acá:
+        las lee quien aplica la compra al modelo (ver TrainingScheduler._apply_inline).
         """
         # 1. Insertar compra (persistencia de la celda en la matriz User-Item)
-        sql = "INSERT INTO Compras (user_id, item_id, timestamp) VALUES (:uid, :iid, NOW())"
-        rows = execute_non_query(sql, params={"uid": user_id, "iid": item_id})
+        sql = "INSERT INTO Compras (user_id, item_id, timestamp) VALUES (:uid, :iid, NOW()) RETURNING compra_id"
+        rows = execute_returning(sql, params={"uid": user_id, "iid": item_id})
         
-        if rows > 0:
-            # 2. Actualizar la Matriz de Similitud (Item-Item)
-            self.train_model() 
+        if rows:
+            self._apply_purchase(rows[0][0], user_id, item_id)
             return True
             
-        return False
\ No newline at end of file
+        return False
+
+    async def add_transaction_async(self, user_id: int, item_id: int):
+        """
+        Versión asíncrona de add_transaction (el INSERT va por el motor asyncpg).
+        """
+        sql = "INSERT INTO Compras (user_id, item_id, timestamp) VALUES (:uid, :iid, NOW()) RETURNING compra_id"
+        rows = await execute_returning_async(sql, params={"uid": user_id, "iid": item_id})
+
+        if rows:
+            if self.training.running:
+                self._apply_purchase(rows[0][0], user_id, item_id)
+            else:
+                # Sin scheduler la actualización del modelo es en el momento: fuera del event loop
+                await asyncio.to_thread(self._apply_purchase, rows[0][0], user_id, item_id)
+            return True
+
+        return False
+
+    @stage_timings.timed("purchase.apply")
+    def _apply_purchase(self, compra_id: int, user_id: int, item_id: int):
+        """
+        Propaga una compra ya persistida a la popularidad, la caché y el modelo CF.
+        """
+        # Sumar la venta a los rankings de popularidad (Cold Start)
+        self.popularity.add_sale(item_id)
+
+        # Las recomendaciones cacheadas del usuario ya no son válidas
+        self.invalidate_user_cache(user_id)
+
+        # 2. Actualizar la Matriz de Similitud (Item-Item)
+        #    Incremental sobre la fila/columna del ítem; cada tanto, reconstrucción completa.
+        #    Con el scheduler corriendo, ambas cosas se hacen en segundo plano.
+        self.training.submit_purchase(self, PendingPurchase(compra_id, user_id, item_id, None))
+
+    @stage_timings.timed("purchase.bulk")
+    def add_transactions_bulk(self, batch: TransactionBatch, skip_invalid: bool = False):
+        """
+        Registra muchas compras en UNA transacción (COPY) y actualiza el modelo una sola vez al final.
+        Usuarios e ítems se validan en bloque antes de insertar: con 'skip_invalid' se descartan las
+        filas con ids inexistentes; si no, con alguna fila inválida no se inserta nada.
+        Devuelve un resumen con las cantidades y los ids desconocidos.
+        """
+        known_users = self._existing_ids("Usuarios", "user_id", batch.user_ids)
+        known_items = self._existing_ids("Items", "item_id", batch.item_ids)
+        valid = np.isin(batch.user_ids, known_users) & np.isin(batch.item_ids, known_items)
+
+        summary = {
+            "received": len(batch),
+            "inserted": 0,
+            "skipped": 0,
+            "unknown_user_ids": np.setdiff1d(batch.user_ids, known_users).tolist(),
+            "unknown_item_ids": np.setdiff1d(batch.item_ids, known_items).tolist(),
+            "model_update": None,
+        }
+        if not valid.all():
+            if not skip_invalid:
+                return summary
+            batch = batch.select(valid)
+            summary["skipped"] = int((~valid).sum())
+        if len(batch) == 0:
+            return summary
+
+        # COPY a una tabla temporal y de ahí a Compras: los timestamps faltantes toman NOW() de la BD
+        # (como las compras individuales) y los que traen zona horaria se convierten a la de la sesión
+        before = [
+            "CREATE TEMP TABLE Compras_staging (user_id INTEGER, item_id INTEGER, timestamp TIMESTAMPTZ) ON COMMIT DROP",
+        ]
+        copy_sql = "COPY Compras_staging (user_id, item_id, timestamp) FROM STDIN WITH (FORMAT csv)"
+        after = [
+            "INSERT INTO Compras (user_id, item_id, timestamp) "
+            "SELECT user_id, item_id, COALESCE(timestamp, NOW()) FROM Compras_staging",
+        ]
+        summary["inserted"] = copy_in_transaction(copy_sql, batch.to_csv(), before, after)
+        summary["model_update"] = self._apply_purchases_bulk(batch)
+        return summary
+
+    def _existing_ids(self, table: str, column: str, ids):
+        """
+        Cuáles de los ids existen en la tabla (una sola consulta para todo el lote).
+        """
+        result = fetch_arrays(
+            f"SELECT {column} FROM {table} WHERE {column} = ANY(:ids)",
+            params={"ids": np.unique(ids).tolist()}, dtypes=[np.int64],
+        )
+        if result is None:
+            raise RuntimeError(f"No se pudieron validar los ids de {table}.")
+        return result[0]
+
+    def _apply_purchases_bulk(self, batch: TransactionBatch):
+        """
+        Propaga un lote ya persistido: popularidad y caché en el momento, y un único re-entrenamiento
+        completo en lugar de una actualización incremental por compra.
+        """
+        items, counts = np.unique(batch.item_ids, return_counts=True)
+        for item_id, quantity in zip(items.tolist(), counts.tolist()):
+            self.popularity.add_sale(item_id, quantity)
+
+        for user_id in np.unique(batch.user_ids).tolist():
+            self.invalidate_user_cache(user_id)
+
+        # Con el scheduler corriendo se agrupa con otros pedidos (como mucho uno cada TRAIN_MIN_INTERVAL)
+        if self.training.running:
+            self.training.request_retrain()
+            return "scheduled"
+
+        self.train_model()
+        return "done"
+
+_CREATE_USER_SQL = """
+    WITH nuevo AS (
+        INSERT INTO Usuarios (username, fecha_creacion) VALUES (:uname, NOW()) RETURNING user_id
+    ), preferencias AS (
+        INSERT INTO PreferenciasUsuario (user_id, genero_id)
+        SELECT nuevo.user_id, genero_id FROM nuevo, unnest(CAST(:gids AS INTEGER[])) AS genero_id
+    )
+    SELECT user_id FROM nuevo
+"""
+
+def _create_user_params(username: str, attributes: dict):
+    # Preferencias (Cold Start): sin repetidos, en el orden recibido
+    generos = attributes.get("generos_id", [])
+    generos = parse_genres(generos) if isinstance(generos, list) else []
+    return {"uname": username, "gids": generos}
+
+def _ranking_id(ranking: list):
+    """
+    Identificador corto de un ranking paginado: hash de sus item_id en orden. Sólo depende del
+    contenido, así que coincide entre workers y entre recálculos que dan el mismo ranking.
+    """
+    item_ids = np.fromiter((iid for iid, _ in ranking), dtype=np.int64, count=len(ranking))
+    return hashlib.blake2b(item_ids.tobytes(), digest_size=8).hexdigest()
+
+def _empty_candidates():
+    return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+def _purchased_mask(candidate_ids, sorted_prefix: int, purchases: list):
+    """
+    Máscara de candidatos ya comprados. Los primeros 'sorted_prefix' ids están ordenados
+    (búsqueda binaria de cada compra); el resto son pocos y se comparan directamente.
+    """
+    purchases = np.unique(np.asarray(purchases, dtype=candidate_ids.dtype))
+    mask = np.zeros(len(candidate_ids), dtype=bool)
+
+    head = candidate_ids[:sorted_prefix]
+    pos = np.searchsorted(head, purchases)
+    found = pos < len(head)
+    found[found] = head[pos[found]] == purchases[found]
+    mask[pos[found]] = True
+
+    mask[sorted_prefix:] = np.isin(candidate_ids[sorted_prefix:], purchases)
+    return mask
+
+# Traemos TODO (*) para llenar los atributos. Los ids van como un único parámetro (array):
+# el texto de la consulta no cambia y asyncpg reutiliza la sentencia preparada en cada conexión
+_ITEM_DETAILS_SQL = "SELECT * FROM Items WHERE item_id = ANY(CAST(:ids AS INTEGER[]))"
+
+def _item_details_params(item_ids):
+    return {"ids": sorted({int(iid) for iid in item_ids})}
+
+def _details_map(rows):
+    if not rows:
+        return {}
+
+    # Convertir a diccionario para búsqueda rápida
+    return {row.item_id: dict(row._mapping) for row in rows}
@@ -0,0 +1,285 @@
+import numpy as np
+import scipy.sparse as sp
+
+# =========================================================================
+#          ÍNDICES DE ÍTEMS Y FILAS DE MATRICES CSR
+# =========================================================================
+
+def lookup_sorted(sorted_ids, ids):
+    """
+    Busca cada id en 'sorted_ids' (ordenado). Devuelve (posiciones, máscara de encontrados),
+    alineadas con 'ids'; la posición de un id que no está no es válida.
+    """
+    ids = np.asarray(ids)
+    if len(sorted_ids) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return positions, sorted_ids[positions] == ids
+
+def positions_of(sorted_ids, ids):
+    """
+    Posición en 'sorted_ids' (ordenado) de cada id presente (los que no están se descartan).
+    """
+    positions, found = lookup_sorted(sorted_ids, ids)
+    return positions[found]
+
+def csr_row_offsets(indptr, rows, limit: int = None):
+    """
+    Posiciones en indices/data de todas las celdas de las filas dadas de un CSR, fila tras fila
+    (gather directo, sin armar la submatriz). Con 'limit', sólo las primeras 'limit' de cada fila.
+    """
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    if limit is not None:
+        lengths = np.minimum(lengths, limit)
+    total = int(lengths.sum())
+    return np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(total)
+
+# =========================================================================
+#          PUNTAJE HÍBRIDO VECTORIZADO (VARIOS USUARIOS A LA VEZ)
+# =========================================================================
+
+def hybrid_weights(purchase_counts):
+    """
+    Pesos Dinámicos (w_cf, w_cbf) según la madurez del usuario. Acepta un escalar o un array.
+    Si tiene pocas compras, el CF es débil -> confiamos en el contenido (CBF).
+    Si tiene muchas, el CF es fuerte -> confiamos en la inteligencia colectiva.
+    """
+    if np.ndim(purchase_counts) == 0:
+        # Un solo usuario: mismos pesos sin np.select (cuesta más que el ranking de contenido)
+        if purchase_counts <= 15:
+            return 0.3, 0.7
+        return (0.5, 0.5) if purchase_counts <= 25 else (0.7, 0.3)
+
+    counts = np.asarray(purchase_counts)
+    conditions = [counts <= 15, counts <= 25]
+    w_cf = np.select(conditions, [0.3, 0.5], 0.7)
+    w_cbf = np.select(conditions, [0.7, 0.5], 0.3)
+    return w_cf, w_cbf
+
+def top_k_indices(scores, k: int, tie_keys=None):
+    """
+    Índices de los k mayores scores finitos (las celdas en -inf se descartan), de mayor a menor.
+    Selección con partición en O(n): sólo se ordenan los k elegidos, no todo el vector.
+    Los empates se resuelven por 'tie_keys' ascendente (por defecto, la posición), igual que un
+    ordenamiento estable completo, también en el borde del Top-K.
+    """
+    scores = np.asarray(scores)
+    by_position = tie_keys is None
+    tie_keys = np.arange(len(scores)) if by_position else np.asarray(tie_keys)
+    if k <= 0 or len(scores) == 0:
+        return np.array([], dtype=np.int64)
+
+    if k < len(scores):
+        # Valor del k-ésimo mayor: entran todos los mayores y, de los iguales, los de menor clave
+        kth = -np.partition(-scores, k - 1)[k - 1]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)
+        # Por posición los empates ya vienen ordenados (pueden ser muchos: no se ordenan)
+        if not by_position:
+            ties = ties[np.argsort(tie_keys[ties], kind="stable")]
+        ties = ties[:k - len(above)]
+        selected = np.concatenate([above, ties])
+    else:
+        selected = np.arange(len(scores))
+
+    selected = selected[np.isfinite(scores[selected])]
+    return selected[np.lexsort((tie_keys[selected], -scores[selected]))]
+
+def top_k_per_row(scores, k: int):
+    """
+    Índices de los k mayores scores de cada fila, ordenados de mayor a menor.
+    Las celdas en -inf se consideran no candidatas y se descartan.
+    Los empates se resuelven por columna ascendente, como top_k_indices por posición (también en el
+    borde del Top-K): con columnas ordenadas por item_id, igual que el ranking de un solo usuario.
+    Devuelve una lista con un array de columnas por fila.
+    """
+    n_rows, n_cols = scores.shape
+    if k <= 0 or n_cols == 0:
+        return [np.array([], dtype=np.int64) for _ in range(n_rows)]
+
+    if k < n_cols:
+        # Exactamente k celdas por fila: np.nonzero las devuelve por fila y en orden de columna
+        top = np.nonzero(_top_k_cells(scores, k))[1].reshape(n_rows, k)
+    else:
+        top = np.tile(np.arange(n_cols), (n_rows, 1))
+
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+    return [row[np.isfinite(row_scores)] for row, row_scores in zip(top, top_scores)]
+
+def top_k_mask(scores, k: int):
+    """
+    Máscara booleana con los k mayores scores finitos de cada fila (sin ordenar).
+    Los empates en el borde se resuelven por columna ascendente, como top_k_per_row.
+    """
+    n_cols = scores.shape[1]
+    if k >= n_cols:
+        return np.isfinite(scores)
+
+    if k <= 0:
+        return np.zeros(scores.shape, dtype=bool)
+    return _top_k_cells(scores, k) & np.isfinite(scores)
+
+def _top_k_cells(scores, k: int):
+    """
+    Máscara con exactamente k celdas por fila (0 < k < columnas): las mayores al k-ésimo score de la
+    fila y, de las iguales, las de menor columna hasta completar k.
+    """
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+    above = scores > kth
+    ties = scores == kth
+    missing = k - above.sum(axis=1, keepdims=True)
+    return above | (ties & (np.cumsum(ties, axis=1, dtype=np.int32) <= missing))
+
+def align_hybrid_model(sim_a, sim_b, sim_scores, feature_item_ids, feature_matrix, cf_item_ids=()):
+    """
+    Alinea el modelo CF (pares item_a, item_b, score) y la matriz Item-Género sobre un mismo índice
+    de ítems: catálogo con metadatos + ítems del modelo CF (los sin metadatos quedan en cero).
+    'cf_item_ids' suma al índice otros ítems (ej: los de los factores ALS o del índice de contenido).
+    Devuelve (item_ids, similitud CSR, features) para rank_hybrid_batch.
+    """
+    item_ids = np.union1d(np.union1d(np.union1d(sim_a, sim_b), feature_item_ids), np.asarray(cf_item_ids, dtype=np.int64))
+    n_items = len(item_ids)
+
+    similarity = sp.csr_matrix(
+        (sim_scores, (np.searchsorted(item_ids, sim_a), np.searchsorted(item_ids, sim_b))),
+        shape=(n_items, n_items)
+    )
+
+    n_genres = feature_matrix.shape[1]
+    features = np.zeros((n_items, n_genres), dtype=np.float32)
+    if len(feature_item_ids) > 0:
+        features[np.searchsorted(item_ids, feature_item_ids)] = feature_matrix
+    return item_ids, similarity, features
+
+def batch_chunk_size(n_items: int, max_cells: int = 4_000_000, max_rows: int = 512, min_rows: int = 16):
+    """
+    Usuarios por bloque matricial: cada bloque arma varias matrices densas usuarios x ítems,
+    así que el tamaño sale de un presupuesto de celdas por matriz ('max_cells', ~32 MB en float64)
+    y los bloques son más chicos cuanto más grande el catálogo.
+    """
+    return int(max(min_rows, min(max_rows, max_cells // max(1, n_items))))
+
+def item_item_scores(purchases, similarity):
+    """
+    CF Item-Item para un bloque de usuarios: promedio de similitud contra cada compra (las compras
+    repetidas pesan más, como en SQL). Devuelve (scores densos, máscara de celdas con algún vecino).
+    """
+    similarity_mask = similarity.copy()
+    similarity_mask.data[:] = 1.0
+    cf_sum = (purchases @ similarity).toarray()
+    cf_count = (purchases @ similarity_mask).toarray()
+    cf_scores = np.divide(cf_sum, cf_count, out=np.zeros_like(cf_sum), where=cf_count > 0)
+    return cf_scores, cf_count > 0
+
+def factor_scores(user_vectors, item_factors):
+    """
+    CF por factores (ALS) para un bloque de usuarios: x_u . y_i de todo el catálogo con un solo
+    producto de matrices. Sólo son candidatas las celdas con afinidad positiva.
+    """
+    cf_scores = (user_vectors @ item_factors.T).astype(np.float64)
+    return cf_scores, cf_scores > 0
+
+def align_factors(item_ids, factor_item_ids, item_factors):
+    """
+    Factores de ítems alineados con 'item_ids' (filas en cero para los ítems fuera del modelo).
+    """
+    aligned = np.zeros((len(item_ids), item_factors.shape[1]), dtype=np.float32)
+    positions, known = lookup_sorted(factor_item_ids, item_ids)
+    aligned[known] = item_factors[positions[known]]
+    return aligned
+
+def genre_norms(features):
+    """
+    Norma L2 de cada fila de la matriz Item-Género (float64), para genre_cosine.
+    """
+    return np.sqrt(np.square(features, dtype=np.float64).sum(axis=-1))
+
+def genre_cosine(dots, profiles, item_norms):
+    """
+    Coseno entre perfiles de géneros y los ítems a partir de los productos 'dots' (perfil . ítem), para
+    un perfil (vectores) o un bloque de perfiles (matrices). El perfil es la suma de los géneros de lo
+    comprado (el promedio da el mismo coseno): con la matriz Item-Género binaria, productos y normas al
+    cuadrado son enteros exactos sea cual sea el orden de la suma, así el score de un ítem es idéntico
+    bit a bit por usuario y en lote, y los empates también.
+    """
+    profile_norms = genre_norms(profiles)[..., np.newaxis] if np.ndim(profiles) > 1 else genre_norms(profiles)
+    denominators = profile_norms * item_norms
+    return np.divide(dots, denominators, out=np.zeros(np.shape(dots), dtype=np.float64), where=denominators > 0)
+
+def genre_profile_scores(bought, features, min_score: float = 0.1):
+    """
+    CBF por géneros para un bloque de usuarios: perfil = géneros de los ítems comprados (con metadatos),
+    coseno contra todo el catálogo (ver genre_cosine). Devuelve (scores densos, máscara de candidatos).
+    """
+    history = bought & features.any(axis=1)
+    profiles = history.astype(np.float32) @ features
+    cbf_scores = genre_cosine(profiles @ features.T, profiles, genre_norms(features))
+    return cbf_scores, (cbf_scores > min_score) & ~history
+
+def content_neighbor_scores(bought, content_matrix, neighbors, min_score: float = 0.1):
+    """
+    CBF por vecinos de contenido (ContentIndex) para un bloque de usuarios: suma de los vecinos de lo
+    comprado sobre la norma del perfil (ver src/services/content.py). Devuelve (scores densos, máscara).
+    """
+    history = bought & (np.diff(content_matrix.indptr) > 0)
+    history_csr = sp.csr_matrix(history, dtype=np.float64)
+    profiles = history_csr @ content_matrix.astype(np.float64)
+    profile_norms = np.sqrt(np.asarray(profiles.multiply(profiles).sum(axis=1))).reshape(-1, 1)
+    totals = (history_csr @ neighbors.astype(np.float64)).toarray()
+    cbf_scores = np.divide(totals, profile_norms, out=np.zeros_like(totals), where=profile_norms > 0)
+    return cbf_scores, (cbf_scores > min_score) & ~history
+
+def align_content(item_ids, content_item_ids, content_matrix, neighbors):
+    """
+    Matriz de contenido y vecinos (ContentIndex) reindexados sobre 'item_ids', que debe incluir
+    a todos los ítems del índice de contenido.
+    """
+    positions = np.searchsorted(item_ids, content_item_ids)
+    placement = sp.csr_matrix(
+        (np.ones(len(positions)), (positions, np.arange(len(positions)))), shape=(len(item_ids), len(content_item_ids))
+    )
+    aligned_matrix = (placement @ content_matrix).tocsr()
+    aligned_neighbors = (placement @ neighbors @ placement.T).tocsr()
+    return aligned_matrix, aligned_neighbors
+
+def rank_hybrid_batch(purchases, cf_scores, cf_valid, cbf_scores, cbf_valid, features, preferences,
+                      w_cf, w_cbf, boost: float, k: int, cf_limit: int = 20):
+    """
+    Misma lógica que el pipeline híbrido por usuario, para un bloque de usuarios con operaciones matriciales.
+
+    purchases:             CSR (usuarios x ítems) con la cantidad de compras de cada ítem; las columnas
+                           van en orden de item_id (ver align_hybrid_model), así los empates se
+                           resuelven igual que en el pipeline por usuario.
+    cf_scores, cf_valid:   scores CF densos (usuarios x ítems) y máscara de candidatos, del backend
+                           configurado (item_item_scores o factor_scores).
+    cbf_scores, cbf_valid: lo mismo para el CBF (genre_profile_scores o content_neighbor_scores).
+    features:              matriz (ítems x géneros) binaria, alineada con las columnas de 'purchases'.
+    preferences:           matriz (usuarios x géneros) binaria con los géneros explícitos.
+    w_cf, w_cbf:           pesos por usuario (arrays).
+
+    Devuelve, por usuario, (columnas, scores) del Top-K ordenado.
+    """
+    bought = purchases.toarray() > 0
+
+    # 1. CF: sólo los 'cf_limit' mejores candidatos no comprados por usuario
+    cf_valid = cf_valid & ~bought
+    cf_top = top_k_mask(np.where(cf_valid, cf_scores, -np.inf), cf_limit)
+
+    # 2. Combinar CF y CBF con los pesos de cada usuario y aplicar el Booster de preferencias explícitas
+    candidates = cf_top | cbf_valid
+    combined = (
+        np.where(cf_top, cf_scores, 0.0) * np.asarray(w_cf).reshape(-1, 1)
+        + np.where(cbf_valid, cbf_scores, 0.0) * np.asarray(w_cbf).reshape(-1, 1)
+    )
+    preferred = (preferences.astype(np.float32) @ features.T) > 0
+    combined += (preferred & candidates) * boost
+
+    # 3. Quitar comprados y quedarnos con el Top-K (empates por columna, es decir por item_id)
+    combined[~candidates | bought] = -np.inf
+    ranked = top_k_per_row(combined, k)
+    return [(cols, combined[user_row, cols]) for user_row, cols in enumerate(ranked)]
@@ -0,0 +1,423 @@
+import time
+import logging
+import threading
+from collections import namedtuple
+import numpy as np
+import scipy.sparse as sp
+from src.config import SNAPSHOT_POLL_INTERVAL
+from src.services.snapshots import model_snapshots
+from src.services.scoring import top_k_indices, lookup_sorted, positions_of, csr_row_offsets
+
+logger = logging.getLogger(__name__)
+
+# Co-ocurrencias de la última reconstrucción en CSR (fila = posición del ítem en 'item_ids', con la
+# diagonal) y conteos por ítem (la diagonal aparte), reemplazados siempre juntos
+_CooccurrenceArrays = namedtuple("_CooccurrenceArrays", ["item_ids", "indptr", "indices", "data", "counts"])
+
+class ItemCooccurrenceIndex:
+    """
+    Estado incremental del modelo Item-Item.
+
+    Sobre la matriz binaria User-Item que usa train_model, el coseno entre dos ítems es:
+        sim(a, b) = co(a, b) / sqrt(n_a * n_b)
+    donde n_a es la cantidad de usuarios distintos que compraron 'a' (norma al cuadrado)
+    y co(a, b) la cantidad de usuarios que compraron ambos (co-ocurrencia).
+    Guardando esos conteos, una compra nueva sólo modifica la fila/columna del ítem comprado.
+
+    Los conteos de la última reconstrucción quedan como arrays CSR (los mismos del snapshot, sin
+    pasarlos a estructuras de Python: cargarlos no depende de la cantidad de compras) y las compras
+    aplicadas desde entonces se suman aparte, en diccionarios chicos, hasta la próxima reconstrucción.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._arrays = _empty_cooccurrence()
+        self._delta_counts = {}  # { item_id: usuarios nuevos desde la reconstrucción }
+        self._delta_cooc = {}    # { item_id: { item_id: co-ocurrencias nuevas } }
+        self.ready = False
+        self.updates_since_rebuild = 0
+        self.version = 0  # aumenta con cada reconstrucción completa del modelo
+
+    def rebuild(self, item_ids, cooc_matrix):
+        """
+        Reemplaza el estado completo a partir de la matriz dispersa de co-ocurrencia (X^T X).
+        La diagonal contiene la norma al cuadrado de cada ítem.
+        """
+        cooc_matrix = sp.csr_matrix(cooc_matrix)
+        self._install(_CooccurrenceArrays(
+            np.asarray(item_ids), cooc_matrix.indptr, cooc_matrix.indices, cooc_matrix.data,
+            cooc_matrix.diagonal().astype(np.int64),
+        ))
+
+    def load_arrays(self, arrays: dict):
+        """
+        Reemplaza el estado completo con los arrays de un snapshot (ver RecommenderService._save_snapshot).
+        """
+        self._install(_CooccurrenceArrays(
+            arrays["item_ids"], arrays["cooc_indptr"], arrays["cooc_indices"], arrays["cooc_data"],
+            arrays["cooc_counts"],
+        ))
+
+    def mark_loaded(self):
+        """
+        Modelo nuevo entrenado por otro proceso y cargado desde su snapshot: éste no guarda los
+        conteos (no aplica compras), sólo publica la nueva versión para invalidar la caché.
+        """
+        self._install(_empty_cooccurrence())
+
+    def _install(self, arrays: _CooccurrenceArrays):
+        with self._lock:
+            self._arrays = arrays
+            self._delta_counts = {}
+            self._delta_cooc = {}
+            self.ready = True
+            self.updates_since_rebuild = 0
+            self.version += 1
+
+    def add_purchase(self, item_id: int, previous_items: set):
+        """
+        Aplica la compra de 'item_id' por un usuario que ya tenía 'previous_items'.
+        Devuelve las relaciones (item_a, item_b, score) que cambiaron, en ambos sentidos.
+        """
+        # Si ya lo había comprado la matriz binaria no cambia
+        if item_id in previous_items:
+            return []
+
+        with self._lock:
+            self.updates_since_rebuild += 1
+            self._delta_counts[item_id] = self._delta_counts.get(item_id, 0) + 1
+            row = self._delta_cooc.setdefault(item_id, {})
+            for other in previous_items:
+                row[other] = row.get(other, 0) + 1
+                other_row = self._delta_cooc.setdefault(other, {})
+                other_row[item_id] = other_row.get(item_id, 0) + 1
+
+            # Al cambiar n_item cambian todos los scores de su fila/columna
+            others, co = self._row(item_id)
+            n_item = self._counts_of(np.array([item_id], dtype=np.int64))[0]
+            n_others = np.maximum(self._counts_of(others), co)
+
+        scores = co / np.sqrt((n_item * n_others).astype(np.float64))
+        changed = []
+        for other, score in zip(others.tolist(), scores.tolist()):
+            changed.append((item_id, other, score))
+            changed.append((other, item_id, score))
+        return changed
+
+    def pruned_rows(self, item_ids, top_k: int, min_score: float = 0.0):
+        """
+        Recalcula desde los conteos las filas completas de 'item_ids' y les aplica la poda Top-K.
+        Devuelve las relaciones (item_a, item_b, score) que deben quedar guardadas.
+        """
+        rows, cols, scores = [], [], []
+        with self._lock:
+            for item_a in item_ids:
+                others, co = self._row(item_a)
+                n_a = self._counts_of(np.array([item_a], dtype=np.int64))[0]
+                n_b = np.maximum(self._counts_of(others), co)
+                rows.append(np.full(len(others), item_a, dtype=np.int64))
+                cols.append(others)
+                scores.append(co / np.sqrt((np.maximum(n_a, co) * n_b).astype(np.float64)))
+
+        if not rows:
+            return []
+        rows, cols, scores = prune_top_k(np.concatenate(rows), np.concatenate(cols), np.concatenate(scores), top_k, min_score)
+        return list(zip(rows.tolist(), cols.tolist(), scores.tolist()))
+
+    def _row(self, item_id: int):
+        """
+        Fila completa de 'item_id' sin la diagonal: (item_ids vecinos, co-ocurrencias), la base más
+        las compras aplicadas desde la reconstrucción. Se llama con el lock tomado.
+        """
+        arrays = self._arrays
+        position = positions_of(arrays.item_ids, np.array([item_id], dtype=np.int64))
+        if len(position) > 0:
+            start, end = arrays.indptr[position[0]], arrays.indptr[position[0] + 1]
+            cols = arrays.indices[start:end]
+            off_diagonal = cols != position[0]
+            others = arrays.item_ids[cols[off_diagonal]].astype(np.int64)
+            co = arrays.data[start:end][off_diagonal].astype(np.int64)
+        else:
+            others, co = np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+        delta = self._delta_cooc.get(item_id)
+        if delta:
+            others = np.concatenate([others, np.fromiter(delta.keys(), dtype=np.int64, count=len(delta))])
+            co = np.concatenate([co, np.fromiter(delta.values(), dtype=np.int64, count=len(delta))])
+            others, inverse = np.unique(others, return_inverse=True)
+            co = np.bincount(inverse, weights=co, minlength=len(others)).astype(np.int64)
+        return others, co
+
+    def _counts_of(self, item_ids):
+        """
+        Usuarios distintos que compraron cada ítem (base + compras aplicadas). Con el lock tomado.
+        """
+        arrays = self._arrays
+        counts = np.zeros(len(item_ids), dtype=np.int64)
+        positions, found = lookup_sorted(arrays.item_ids, item_ids)
+        counts[found] = arrays.counts[positions[found]]
+
+        if self._delta_counts:
+            delta_ids = np.fromiter(self._delta_counts.keys(), dtype=np.int64, count=len(self._delta_counts))
+            delta_counts = np.fromiter(self._delta_counts.values(), dtype=np.int64, count=len(self._delta_counts))
+            order = np.argsort(delta_ids)
+            positions, found = lookup_sorted(delta_ids[order], item_ids)
+            counts[found] += delta_counts[order][positions[found]]
+        return counts
+
+def _empty_cooccurrence():
+    return _CooccurrenceArrays(
+        np.array([], dtype=np.int64), np.zeros(1, dtype=np.int64), np.array([], dtype=np.int32),
+        np.array([], dtype=np.int64), np.array([], dtype=np.int64),
+    )
+
+# Arrays del modelo mapeado + filas modificadas desde el snapshot, reemplazados siempre juntos
+_MappedState = namedtuple("_MappedState", ["version", "item_ids", "indptr", "indices", "scores", "overrides"])
+
+class SimilarityModel:
+    """
+    Modelo Item-Item para el Filtrado Colaborativo en proceso, sin consultar la BD.
+
+    Lee del último snapshot la similitud en CSR (fila = posición del ítem en 'item_ids',
+    índices int32, scores float32/float16) con mmap de sólo lectura: todos los workers
+    comparten las mismas páginas del archivo y la memoria no crece con la cantidad de procesos.
+
+    Las actualizaciones incrementales posteriores al snapshot se guardan como filas completas
+    en 'overrides' (chico y propio de cada proceso) hasta el próximo snapshot.
+    """
+
+    def __init__(self, store, poll_interval: int):
+        self.store = store
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._state = None
+        self._checked_at = 0.0
+        self._min_version = 0  # versiones anteriores no se vuelven a mapear (ver clear)
+
+    def available(self):
+        """
+        True si hay un modelo mapeado. Cada 'poll_interval' segundos busca un snapshot más nuevo.
+        """
+        if self.poll_due():
+            self.refresh()
+        return self._state is not None
+
+    def poll_due(self):
+        """
+        True si ya pasaron 'poll_interval' segundos desde la última búsqueda de un snapshot más nuevo.
+        """
+        return time.monotonic() - self._checked_at >= self.poll_interval
+
+    def refresh(self):
+        """
+        Mapea el snapshot más reciente si es más nuevo que el actual.
+        """
+        with self._lock:
+            self._checked_at = time.monotonic()
+            latest = self.store.latest_version()
+            current = self._state
+            if latest is None or latest < self._min_version or (current is not None and current.version >= latest):
+                return
+
+            snapshot = self.store.load_latest(mmap_mode="r")
+            if snapshot is None or snapshot.version < self._min_version or "similarity_indptr" not in snapshot.arrays:
+                return
+
+            self._state = _MappedState(
+                version=snapshot.version,
+                item_ids=snapshot["item_ids"],
+                indptr=snapshot["similarity_indptr"],
+                indices=snapshot["similarity_indices"],
+                scores=snapshot["similarity_scores"],
+                overrides={},
+            )
+            logger.info(f"[CF] Modelo Item-Item mapeado desde el snapshot versión {snapshot.version}.")
+
+    def clear(self):
+        """
+        Deja de usar el modelo mapeado (ej: no se pudo escribir el snapshot del último entrenamiento)
+        hasta que aparezca un snapshot más nuevo que los actuales.
+        """
+        with self._lock:
+            latest = self.store.latest_version()
+            self._min_version = (latest or 0) + 1
+            self._state = None
+
+    def candidates(self, purchases: list, limit: int):
+        """
+        Misma lógica que la consulta CF en SQL: para cada compra (con repeticiones) toma los vecinos
+        de su fila, descarta los ya comprados, promedia el score por vecino y devuelve los
+        'limit' mejores como (item_ids, scores), ordenados por score (desempate por item_id).
+        """
+        state = self._state
+        purchases = np.asarray(purchases, dtype=np.int64)
+        if state is None or len(purchases) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        neighbor_ids, neighbor_scores = [], []
+
+        # Filas modificadas desde el snapshot
+        overridden = np.isin(purchases, list(state.overrides)) if state.overrides else np.zeros(len(purchases), dtype=bool)
+        for item_id in purchases[overridden].tolist():
+            ids, scores = state.overrides[item_id]
+            neighbor_ids.append(ids)
+            neighbor_scores.append(scores)
+
+        # Resto: gather de las filas del CSR mapeado
+        offsets = csr_row_offsets(state.indptr, positions_of(state.item_ids, purchases[~overridden]))
+        if len(offsets) > 0:
+            neighbor_ids.append(state.item_ids[state.indices[offsets]].astype(np.int64))
+            neighbor_scores.append(state.scores[offsets].astype(np.float64))
+
+        if not neighbor_ids:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        ids = np.concatenate(neighbor_ids)
+        scores = np.concatenate(neighbor_scores)
+        keep = ~np.isin(ids, purchases)
+        ids, scores = ids[keep], scores[keep]
+        if len(ids) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+
+        # Reduce: promedio por vecino
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        averages = np.bincount(inverse, weights=scores) / np.bincount(inverse)
+
+        order = top_k_indices(averages, limit, tie_keys=unique_ids)
+        return unique_ids[order], averages[order]
+
+    def pairs(self):
+        """
+        Todas las relaciones del modelo mapeado como arrays (item_a, item_b, score), con las filas
+        modificadas desde el snapshot ya aplicadas: lo mismo que leer MatrizSimilitud, sin la BD.
+        None si no hay modelo mapeado.
+        """
+        state = self._state
+        if state is None:
+            return None
+
+        rows = np.repeat(np.arange(len(state.item_ids)), np.diff(state.indptr))
+        item_a = state.item_ids[rows].astype(np.int64)
+        item_b = state.item_ids[state.indices].astype(np.int64)
+        scores = state.scores.astype(np.float64)
+        if not state.overrides:
+            return item_a, item_b, scores
+
+        keep = ~np.isin(item_a, list(state.overrides))
+        overrides = list(state.overrides.items())
+        return (
+            np.concatenate([item_a[keep]] + [np.full(len(ids), a, dtype=np.int64) for a, (ids, _) in overrides]),
+            np.concatenate([item_b[keep]] + [ids for _, (ids, _) in overrides]),
+            np.concatenate([scores[keep]] + [row_scores for _, (_, row_scores) in overrides]),
+        )
+
+    def upsert_pairs(self, pairs: list):
+        """
+        Aplica relaciones (item_a, item_b, score) nuevas o modificadas sobre las filas actuales.
+        """
+        with self._lock:
+            state = self._state
+            if state is None or not pairs:
+                return
+            overrides = dict(state.overrides)
+            by_row = {}
+            for item_a, item_b, score in pairs:
+                by_row.setdefault(item_a, ([], []))
+                by_row[item_a][0].append(item_b)
+                by_row[item_a][1].append(score)
+
+            for item_a, (new_ids, new_scores) in by_row.items():
+                ids, scores = self._current_row(state, overrides, item_a)
+                keep = ~np.isin(ids, new_ids)
+                overrides[item_a] = (
+                    np.concatenate([ids[keep], np.array(new_ids, dtype=np.int64)]),
+                    np.concatenate([scores[keep], np.array(new_scores, dtype=np.float64)]),
+                )
+            self._state = state._replace(overrides=overrides)
+
+    def replace_rows(self, item_ids, pairs: list):
+        """
+        Reemplaza completas las filas de 'item_ids' por las relaciones dadas (ej: tras re-podar el Top-K).
+        """
+        with self._lock:
+            state = self._state
+            if state is None:
+                return
+            overrides = dict(state.overrides)
+            rows = {item_a: ([], []) for item_a in item_ids}
+            for item_a, item_b, score in pairs:
+                rows[item_a][0].append(item_b)
+                rows[item_a][1].append(score)
+            for item_a, (ids, scores) in rows.items():
+                overrides[item_a] = (np.array(ids, dtype=np.int64), np.array(scores, dtype=np.float64))
+            self._state = state._replace(overrides=overrides)
+
+    @staticmethod
+    def _current_row(state, overrides, item_id):
+        if item_id in overrides:
+            return overrides[item_id]
+        rows = positions_of(state.item_ids, np.array([item_id], dtype=np.int64))
+        if len(rows) == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float64)
+        start, end = state.indptr[rows[0]], state.indptr[rows[0] + 1]
+        return state.item_ids[state.indices[start:end]].astype(np.int64), state.scores[start:end].astype(np.float64)
+
+def build_user_item_matrix(user_ids, item_ids):
+    """
+    Construye la matriz binaria User-Item en formato CSR directamente desde los pares de compras.
+    Devuelve la matriz y el array de item_id correspondiente a cada columna.
+    """
+    users, user_codes = np.unique(np.asarray(user_ids), return_inverse=True)
+    items, item_codes = np.unique(np.asarray(item_ids), return_inverse=True)
+
+    ones = np.ones(len(user_codes), dtype=np.int32)
+    matrix = sp.csr_matrix((ones, (user_codes, item_codes)), shape=(len(users), len(items)))
+
+    # Compras repetidas del mismo ítem se suman al construir: las volvemos a 1
+    matrix.sum_duplicates()
+    matrix.data[:] = 1
+    return matrix, items
+
+def compute_item_similarity(user_item_matrix):
+    """
+    Similitud del coseno Item-Item con productos dispersos.
+    Devuelve la matriz de co-ocurrencia y los pares no nulos (fila, columna, score) como arrays,
+    sin la diagonal. El costo crece con la cantidad de compras, no con usuarios x ítems.
+    """
+    cooc = (user_item_matrix.T @ user_item_matrix).tocsr()
+    norms = np.sqrt(cooc.diagonal().astype(np.float64))
+
+    pairs = cooc.tocoo()
+    off_diagonal = pairs.row != pairs.col
+    rows = pairs.row[off_diagonal]
+    cols = pairs.col[off_diagonal]
+    scores = pairs.data[off_diagonal] / (norms[rows] * norms[cols])
+    return cooc, rows, cols, scores
+
+def prune_top_k(rows, cols, scores, top_k: int, min_score: float = 0.0):
+    """
+    Conserva, por cada fila, sólo los 'top_k' pares de mayor score (0 = sin límite)
+    y descarta los que no alcanzan 'min_score'. Selección vectorizada, sin bucles por fila.
+    """
+    if min_score > 0:
+        keep = scores >= min_score
+        rows, cols, scores = rows[keep], cols[keep], scores[keep]
+
+    if top_k <= 0 or len(rows) == 0:
+        return rows, cols, scores
+
+    # Ordenamos por fila y, dentro de cada fila, por score descendente (desempate por columna)
+    order = np.lexsort((cols, -scores, rows))
+    sorted_rows = rows[order]
+
+    # Posición de cada par dentro de su fila = índice global - inicio de la fila
+    row_starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+    row_lengths = np.diff(np.r_[row_starts, len(sorted_rows)])
+    rank = np.arange(len(sorted_rows)) - np.repeat(row_starts, row_lengths)
+
+    selected = order[rank < top_k]
+    return rows[selected], cols[selected], scores[selected]
+
+# Estado compartido por todas las instancias del servicio dentro del proceso
+cooccurrence_index = ItemCooccurrenceIndex()
+similarity_model = SimilarityModel(model_snapshots, poll_interval=SNAPSHOT_POLL_INTERVAL)
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+import numpy as np
+from src.config import SNAPSHOT_DIR, SNAPSHOT_KEEP
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = ".lock"
+TMP_PREFIX = ".tmp-"
+TMP_MAX_AGE = 3600  # segundos: un directorio temporal más viejo quedó de un proceso que murió a mitad de camino
+
+class FileLock:
+    """
+    Lock entre procesos (ej: varios workers de uvicorn) sobre un archivo: flock en POSIX.
+    En Windows se usa msvcrt, que no tiene locks compartidos: ahí todos son exclusivos.
+    Cada acquire abre su propio descriptor, así que también excluye a otros hilos del mismo proceso.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def acquire(self, shared: bool = False, blocking: bool = True):
+        """
+        Toma el lock. Devuelve el archivo abierto (para release) o None si 'blocking' es False y estaba tomado.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        handle = open(self.path, "a+b")
+        try:
+            if fcntl is not None:
+                mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+                fcntl.flock(handle.fileno(), mode if blocking else mode | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            return handle
+        except OSError:
+            handle.close()
+            if blocking:
+                raise
+            return None
+
+    @staticmethod
+    def release(handle):
+        # Cerrar el descriptor libera el lock (flock y msvcrt)
+        if handle is not None:
+            handle.close()
+
+    @contextmanager
+    def hold(self, shared: bool = False):
+        handle = self.acquire(shared)
+        try:
+            yield
+        finally:
+            self.release(handle)
+
+class ModelSnapshot:
+    """
+    Snapshot cargado: manifest + arrays por nombre (en memoria o mapeados desde disco).
+    """
+
+    def __init__(self, version: int, path: str, manifest: dict, arrays: dict):
+        self.version = version
+        self.path = path
+        self.manifest = manifest
+        self.arrays = arrays
+
+    @property
+    def watermark(self):
+        return self.manifest["watermark"]
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+class ModelSnapshotStore:
+    """
+    Snapshots versionados del modelo en disco: un directorio por versión (v000001, v000002, ...)
+    con un .npy por array y un manifest.json que registra versión, marca de agua de los datos
+    (máximo compra_id entrenado), parámetros y dtype/shape de cada array.
+
+    Cada snapshot se escribe en un directorio temporal y se renombra al final: un directorio
+    con manifest siempre está completo. Se guardan los 'keep' más recientes.
+    Los .npy se pueden abrir con mmap (np.load(mmap_mode='r')) sin copiarlos a memoria.
+
+    Varios procesos comparten el directorio: la versión se asigna, se renombra y se podan las
+    viejas con el lock exclusivo de '.lock' tomado, y las lecturas toman el lock compartido,
+    así que la poda nunca borra un snapshot a mitad de carga. Una vez mapeados, los archivos
+    borrados siguen accesibles hasta que el proceso los suelta (POSIX).
+    """
+
+    def __init__(self, directory: str, keep: int):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._dir_lock = FileLock(os.path.join(directory, LOCK_FILE))
+
+    def save(self, arrays: dict, metadata: dict):
+        """
+        Escribe un snapshot nuevo. Devuelve su versión (None si falló).
+        """
+        with self._lock:
+            tmp_path = None
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = tempfile.mkdtemp(prefix=f"{TMP_PREFIX}{os.getpid()}-", dir=self.directory)
+
+                array_info = {}
+                for name, array in arrays.items():
+                    array = np.ascontiguousarray(array)
+                    np.save(os.path.join(tmp_path, f"{name}.npy"), array, allow_pickle=False)
+                    array_info[name] = {"dtype": array.dtype.str, "shape": list(array.shape)}
+
+                # Versión, renombrado y poda con el lock entre procesos: dos workers que guardan
+                # a la vez nunca eligen la misma versión
+                with self._dir_lock.hold():
+                    versions = self._versions()
+                    version = (versions[-1] if versions else 0) + 1
+                    final_path = self._version_path(version)
+
+                    manifest = {
+                        "format": SNAPSHOT_FORMAT,
+                        "version": version,
+                        "created_at": datetime.now().isoformat(timespec="seconds"),
+                        **metadata,
+                        "arrays": array_info,
+                    }
+                    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+                        json.dump(manifest, f, indent=2)
+
+                    os.rename(tmp_path, final_path)
+                    tmp_path = None
+                    self._prune(versions + [version])
+                logger.info(f"[Snapshot] Modelo guardado en {final_path}.")
+                return version
+            except Exception as e:
+                logger.error(f"[Snapshot] No se pudo guardar el snapshot: {e}")
+                return None
+            finally:
+                if tmp_path is not None:
+                    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def load_latest(self, mmap_mode=None):
+        """
+        Carga el snapshot válido más reciente (None si no hay ninguno).
+        Uno dañado o de otro formato se saltea y se prueba con el anterior.
+        """
+        if not os.path.isdir(self.directory):
+            return None
+        with self._dir_lock.hold(shared=True):
+            for version in reversed(self._versions()):
+                snapshot = self._load(version, mmap_mode)
+                if snapshot is not None:
+                    return snapshot
+        return None
+
+    def latest_version(self):
+        versions = self._versions()
+        return versions[-1] if versions else None
+
+    def _load(self, version: int, mmap_mode):
+        path = self._version_path(version)
+        start = time.perf_counter()
+        try:
+            with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != SNAPSHOT_FORMAT:
+                logger.warning(f"[Snapshot] {path} tiene otro formato, se ignora.")
+                return None
+
+            arrays = {}
+            for name, info in manifest["arrays"].items():
+                array = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+                if array.dtype.str != info["dtype"] or list(array.shape) != info["shape"]:
+                    raise ValueError(f"el array '{name}' no coincide con el manifest")
+                arrays[name] = array
+        except Exception as e:
+            logger.warning(f"[Snapshot] {path} no es válido ({e}), se ignora.")
+            return None
+
+        logger.info(f"[Snapshot] Cargado {path} en {(time.perf_counter() - start) * 1000:.1f} ms.")
+        return ModelSnapshot(version, path, manifest, arrays)
+
+    def _versions(self):
+        if not os.path.isdir(self.directory):
+            return []
+        versions = []
+        for name in os.listdir(self.directory):
+            if name.startswith("v") and name[1:].isdigit():
+                versions.append(int(name[1:]))
+        return sorted(versions)
+
+    def _version_path(self, version: int):
+        return os.path.join(self.directory, f"v{version:06d}")
+
+    def _prune(self, versions: list):
+        # Directorios temporales de procesos que murieron mientras escribían
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(TMP_PREFIX) and time.time() - os.path.getmtime(path) > TMP_MAX_AGE:
+                shutil.rmtree(path, ignore_errors=True)
+
+        if self.keep <= 0:
+            return
+        for version in versions[:-self.keep]:
+            shutil.rmtree(self._version_path(version), ignore_errors=True)
+
+# Almacén compartido por todas las instancias del servicio dentro del proceso
+model_snapshots = ModelSnapshotStore(SNAPSHOT_DIR, SNAPSHOT_KEEP)
@@ -0,0 +1,266 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+from src.config import FULL_RETRAIN_EVERY, TRAIN_MIN_INTERVAL, TRAIN_POLL_INTERVAL, SNAPSHOT_DIR, SNAPSHOT_POLL_INTERVAL
+from src.services.snapshots import FileLock
+
+logger = logging.getLogger(__name__)
+
+# Compra ya persistida cuyo efecto en el modelo CF está pendiente. 'previous_items' (ítems que el
+# usuario ya tenía) puede venir en None: se lee de Compras recién si hace falta aplicarla
+PendingPurchase = namedtuple("PendingPurchase", ["compra_id", "user_id", "item_id", "previous_items"])
+
+TRAINER_LOCK_FILE = "trainer.lock"  # en el directorio de snapshots: lo tiene tomado el proceso que entrena
+POLL_BATCH = 1000  # compras leídas por consulta si no hay re-entrenamiento periódico (FULL_RETRAIN_EVERY=0)
+
+class TrainingScheduler:
+    """
+    Hilo de fondo que mantiene actualizado el modelo CF, para que ni el arranque de la app
+    ni el endpoint de compras esperen a un entrenamiento.
+
+    Con varios workers de uvicorn entrena un solo proceso (líder): el que tiene tomado el lock
+    'trainer.lock' del directorio de snapshots. Sólo él guarda los conteos de co-ocurrencia y escribe
+    MatrizSimilitud; los demás (seguidores) cargan cada snapshot nuevo que publica y, si el líder
+    termina o muere, el primero que toma el lock pasa a entrenar.
+
+    En el líder:
+    - Las compras nuevas se leen de Compras por compra_id (marca de agua), las haya registrado el
+      worker que sea, y se aplican en orden como actualizaciones incrementales. Una compra propia
+      sólo despierta al hilo; las de los demás workers se encuentran cada 'poll_interval' segundos.
+    - El re-entrenamiento completo se marca como pendiente (dirty) al arrancar, cuando el índice
+      no está listo, tras 'retrain_every' actualizaciones incrementales o si llegan de una vez más
+      compras que eso (ej: una carga en lote). Se ejecuta como mucho una vez cada 'min_interval'
+      segundos: varios pedidos seguidos se agrupan en uno solo.
+    - Como un único hilo de un único proceso entrena y actualiza, nunca hay dos entrenamientos
+      escribiendo a la vez. El modelo nuevo se publica de una vez (swap de MatrizSimilitud + snapshot).
+    - Una compra que se confirma después de que se leyó otra con compra_id mayor queda fuera de la
+      actualización incremental; el próximo re-entrenamiento completo la incluye.
+
+    Los seguidores ven las actualizaciones incrementales del líder recién con el próximo snapshot.
+    """
+
+    def __init__(self, min_interval: int, retrain_every: int, poll_interval: int, follow_interval: int, lock: FileLock):
+        self.min_interval = min_interval
+        self.retrain_every = retrain_every
+        self.poll_interval = poll_interval      # líder: compras nuevas en Compras
+        self.follow_interval = follow_interval  # seguidor: snapshots nuevos (y lock libre)
+        self._lock_file = lock
+        self._leader_handle = None
+        self._cond = threading.Condition()
+        self._wakeup = False
+        self._watermark = None         # líder: último compra_id reflejado en el modelo
+        self._snapshot_version = None  # seguidor: último snapshot cargado
+        self._retrain_requested = False
+        self._last_retrain = None  # time.monotonic() del último entrenamiento completo
+        self._service = None
+        self._thread = None
+        self._stopping = False
+
+        # Contadores para monitoreo
+        self.retrains = 0
+        self.incremental_updates = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def leader(self):
+        return self._leader_handle is not None
+
+    def claim_leadership(self):
+        """
+        Intenta ser el proceso que entrena, sin esperar. Devuelve True si ya lo era o lo consiguió.
+        """
+        if self._leader_handle is None:
+            self._leader_handle = self._lock_file.acquire(blocking=False)
+            if self._leader_handle is not None:
+                logger.info(f"[Training] Este proceso (pid {os.getpid()}) entrena el modelo.")
+        return self.leader
+
+    def start(self, service, watermark: int = None):
+        """
+        Arranca el hilo de fondo (no bloquea). En el líder, 'watermark' es el último compra_id que ya
+        refleja el modelo cargado; sin él se pide un entrenamiento inicial.
+        """
+        with self._cond:
+            if self.running:
+                return
+            self._service = service
+            self._stopping = False
+            self._watermark = watermark
+            self._retrain_requested = self.leader and watermark is None
+            self._snapshot_version = service.snapshots.latest_version()
+            self._thread = threading.Thread(target=self._run, name="training-scheduler", daemon=True)
+            self._thread.start()
+        logger.info(f"[Training] Scheduler de entrenamiento iniciado ({'líder' if self.leader else 'seguidor'}).")
+
+    def stop(self, timeout: float = 30.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+        # Otro worker puede tomar el entrenamiento
+        FileLock.release(self._leader_handle)
+        self._leader_handle = None
+
+    def request_retrain(self):
+        with self._cond:
+            self._retrain_requested = True
+            self._cond.notify()
+
+    def submit_purchase(self, service, purchase: PendingPurchase):
+        """
+        Avisa de una compra ya persistida. Con el hilo corriendo el líder la lee de Compras
+        (acá sólo se lo despierta) y un seguidor no hace nada. Sin el hilo (ej: scripts de
+        evaluación), se aplica en el momento como antes.
+        """
+        if not self.running:
+            self._apply_inline(service, purchase)
+            return
+
+        with self._cond:
+            self._wakeup = True
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            since_last = time.monotonic() - self._last_retrain if self._last_retrain is not None else None
+            return {
+                "running": self.running,
+                "role": "leader" if self.leader else "follower",
+                "watermark": self._watermark if self.leader else None,
+                "snapshot_version": self._snapshot_version,
+                "retrain_requested": self._retrain_requested,
+                "seconds_since_retrain": since_last,
+                "retrains": self.retrains,
+                "incremental_updates": self.incremental_updates,
+            }
+
+    # -------------------------------
+    #        Hilo de fondo
+    # -------------------------------
+
+    def _retrain_due(self):
+        if not self._retrain_requested or not self.leader:
+            return False
+        if self._last_retrain is None:
+            return True
+        return time.monotonic() - self._last_retrain >= self.min_interval
+
+    def _wait_timeout(self):
+        if not self.leader:
+            return self.follow_interval
+        # Si hay un entrenamiento pedido pero todavía no toca, despertamos cuando toque
+        if self._retrain_requested and self._last_retrain is not None:
+            remaining = self.min_interval - (time.monotonic() - self._last_retrain)
+            return max(0.0, min(self.poll_interval, remaining))
+        return self.poll_interval
+
+    def _run(self):
+        while True:
+            with self._cond:
+                # Sin aviso ni entrenamiento pendiente, al vencer la espera se consulta igual
+                if not self._stopping and not self._wakeup and not self._retrain_due():
+                    self._cond.wait(self._wait_timeout())
+                if self._stopping:
+                    return
+
+                self._wakeup = False
+                retrain = self._retrain_due()
+                if retrain:
+                    self._retrain_requested = False
+
+            try:
+                if not self.leader:
+                    self._follow()
+                elif retrain:
+                    self._retrain()
+                else:
+                    self._apply_new_purchases()
+            except Exception as e:
+                logger.error(f"[Training] Error en el scheduler de entrenamiento: {e}")
+
+    def _follow(self):
+        # Si el líder terminó (o murió) el lock quedó libre: este proceso pasa a entrenar,
+        # empezando por un entrenamiento completo (un seguidor no tiene los conteos)
+        if self.claim_leadership():
+            with self._cond:
+                self._watermark = None
+                self._retrain_requested = True
+            return
+
+        latest = self._service.snapshots.latest_version()
+        if latest is not None and latest != self._snapshot_version:
+            self._service.load_snapshot(with_counts=False)
+            self._snapshot_version = latest
+
+    def _retrain(self):
+        start = time.perf_counter()
+        trained_ids = self._service.train_model()
+
+        with self._cond:
+            self._last_retrain = time.monotonic()
+            self.retrains += 1
+            if trained_ids is not None:
+                # Las compras posteriores se leen de Compras a partir de acá
+                self._watermark = int(trained_ids.max())
+            self._snapshot_version = self._service.snapshots.latest_version()
+
+        logger.info(f"[Training] Re-entrenamiento completo en {time.perf_counter() - start:.2f}s "
+                    f"(compra_id <= {self._watermark}).")
+
+    def _apply_new_purchases(self):
+        service = self._service
+        limit = self.retrain_every if self.retrain_every > 0 else POLL_BATCH
+        pending = service.purchases_since(self._watermark or 0, limit)
+        if not pending:
+            return
+
+        # Sin índice no hay sobre qué aplicar, y con más compras que 'retrain_every' de una vez un
+        # entrenamiento completo sale más barato: en ambos casos el próximo entrenamiento las incluye
+        too_many = self.retrain_every > 0 and len(pending) >= self.retrain_every
+        if self._watermark is None or not service.model_state.ready or too_many:
+            self.request_retrain()
+            return
+
+        for purchase in pending:
+            self._apply_inline(service, purchase)
+            self._watermark = purchase.compra_id
+
+        if self.retrain_every > 0 and service.model_state.updates_since_rebuild >= self.retrain_every:
+            self.request_retrain()
+        elif len(pending) == limit:
+            # Quedaron más compras por leer
+            with self._cond:
+                self._wakeup = True
+
+    def _apply_inline(self, service, purchase: PendingPurchase):
+        # Sin el hilo, el re-entrenamiento periódico también se hace en el momento
+        needs_rebuild = (
+            not self.running and self.retrain_every > 0
+            and service.model_state.updates_since_rebuild >= self.retrain_every
+        )
+        if not service.model_state.ready or needs_rebuild:
+            service.train_model()
+        else:
+            previous_items = purchase.previous_items
+            if previous_items is None:
+                previous_items = service.previous_items(purchase.user_id, purchase.compra_id)
+            service.update_model_incremental(purchase.item_id, previous_items)
+            self.incremental_updates += 1
+
+        # La caché del usuario se invalidó al comprar; volvemos a hacerlo con el modelo ya actualizado
+        service.invalidate_user_cache(purchase.user_id)
+
+# Scheduler compartido por todas las instancias del servicio dentro del proceso
+training_scheduler = TrainingScheduler(
+    min_interval=TRAIN_MIN_INTERVAL, retrain_every=FULL_RETRAIN_EVERY,
+    poll_interval=TRAIN_POLL_INTERVAL, follow_interval=SNAPSHOT_POLL_INTERVAL,
+    lock=FileLock(os.path.join(SNAPSHOT_DIR, TRAINER_LOCK_FILE)),
+)
@@ -0,0 +1,112 @@
+import logging
+from src.database import fetch_rows, fetch_rows_async
+from src.metrics import stage_timings
+
+logger = logging.getLogger(__name__)
+
+class UserContext:
+    """
+    Todo lo que una recomendación necesita saber del usuario, cargado en una sola consulta:
+    fila de Usuarios, géneros preferidos, compras (con repeticiones, como en Compras) y el compra_id
+    de la última (0 si no tiene), que identifica el historial en la caché de recomendaciones.
+    Se pasa por todas las etapas del pipeline para no volver a consultar la BD.
+    """
+
+    def __init__(self, user_id: int, username=None, fecha_creacion=None, preferences=None, purchases=None,
+                 last_purchase: int = 0):
+        self.user_id = user_id
+        self.username = username
+        self.fecha_creacion = fecha_creacion
+        self.preferences = list(preferences or [])
+        self.purchases = list(purchases or [])
+        self.purchased = set(self.purchases)
+        self.purchase_count = len(self.purchases)
+        self.last_purchase = last_purchase
+
+    def to_dict(self):
+        """
+        Formato histórico de get_user_data.
+        """
+        return {
+            "user_id": self.user_id,
+            "username": self.username,
+            "fecha_creacion": self.fecha_creacion,
+            "preferencias": self.preferences,
+        }
+
+_CONTEXT_SQL = """
+    SELECT
+        u.user_id,
+        u.username,
+        u.fecha_creacion,
+        ARRAY(SELECT p.genero_id FROM PreferenciasUsuario p WHERE p.user_id = u.user_id) as preferencias,
+        ARRAY(SELECT c.item_id FROM Compras c WHERE c.user_id = u.user_id) as compras,
+        (SELECT COALESCE(MAX(c.compra_id), 0) FROM Compras c WHERE c.user_id = u.user_id) as ultima_compra
+    FROM Usuarios u
+"""
+
+def _context_from_row(row):
+    return UserContext(
+        user_id=int(row.user_id),
+        username=row.username,
+        fecha_creacion=str(row.fecha_creacion),
+        preferences=[int(g) for g in row.preferencias],
+        purchases=[int(i) for i in row.compras],
+        last_purchase=int(row.ultima_compra),
+    )
+
+@stage_timings.timed("context")
+def load_user_context(user_id: int):
+    """
+    Carga usuario, preferencias y compras en un único round trip.
+    Devuelve None si el usuario no existe.
+    """
+    rows = fetch_rows(_CONTEXT_SQL + " WHERE u.user_id = :uid", params={"uid": user_id})
+
+    if not rows:
+        return None
+
+    return _context_from_row(rows[0])
+
+@stage_timings.timed("context")
+async def load_user_context_async(user_id: int):
+    """
+    Versión asíncrona de load_user_context (misma consulta, motor asyncpg).
+    """
+    rows = await fetch_rows_async(_CONTEXT_SQL + " WHERE u.user_id = :uid", params={"uid": user_id})
+
+    if not rows:
+        return None
+
+    return _context_from_row(rows[0])
+
+@stage_timings.timed("context.batch")
+def load_user_contexts(user_ids: list):
+    """
+    Igual que load_user_context para muchos usuarios, también en un único round trip.
+    Devuelve { user_id: UserContext } sólo con los usuarios que existen.
+    """
+    if not user_ids:
+        return {}
+
+    rows = fetch_rows(_CONTEXT_SQL + " WHERE u.user_id = ANY(:uids)", params={"uids": list(user_ids)})
+
+    if not rows:
+        return {}
+
+    return {ctx.user_id: ctx for ctx in (_context_from_row(row) for row in rows)}
+
+_LAST_PURCHASE_SQL = "SELECT COALESCE(MAX(compra_id), 0) AS ultima_compra FROM Compras WHERE user_id = :uid"
+
+@stage_timings.timed("context.last_purchase")
+async def load_last_purchase_async(user_id: int):
+    """
+    Sólo el compra_id de la última compra del usuario (0 si no tiene): alcanza para saber si una
+    recomendación cacheada sigue vigente sin cargar el contexto entero. None si falló la consulta.
+    """
+    rows = await fetch_rows_async(_LAST_PURCHASE_SQL, params={"uid": user_id})
+
+    if not rows:
+        return None
+
+    return int(rows[0].ultima_compra)
@@ -0,0 +1,96 @@
+import time
+import random
+import asyncio
+import argparse
+import statistics
+import logging
+import anyio
+from src.database import get_data_as_dataframe, async_engine
+from src.services.recommender import RecommenderService
+
+# Prueba de carga: ¿cuántas recomendaciones por segundo salen con N clientes concurrentes?
+#
+#  - "sync":  lo que hace FastAPI con un endpoint 'def': cada request ocupa un hilo del
+#             threadpool (40 por defecto) mientras espera a la BD.
+#  - "async": el endpoint 'async def' con asyncpg: el event loop atiende otras requests
+#             mientras espera, y contexto + candidatos CF se consultan en paralelo.
+#
+# Se desactiva la caché de recomendaciones para medir siempre el camino completo.
+# Uso: python -m src.tests.async_throughput --concurrency 50 --duration 10
+
+THREADPOOL_SIZE = 40 # mismo límite que usa Starlette para los endpoints síncronos
+
+def recommend_sync(service: RecommenderService, user_id: int, n: int):
+    context = service.get_user_context(user_id)
+    if context is None:
+        return None
+    return service.get_recommendations(user_id, top_k=n, context=context)
+
+async def run_mode(mode: str, service: RecommenderService, user_ids: list, concurrency: int, duration: float, n: int):
+    limiter = anyio.CapacityLimiter(THREADPOOL_SIZE)
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def client(seed: int):
+        nonlocal errors
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            uid = rng.choice(user_ids)
+            start = time.perf_counter()
+            try:
+                if mode == "sync":
+                    await anyio.to_thread.run_sync(recommend_sync, service, uid, n, limiter=limiter)
+                else:
+                    await service.get_recommendations_async(uid, top_k=n)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(seed) for seed in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+def report(mode: str, latencies: list, errors: int, elapsed: float):
+    if not latencies:
+        print(f"{mode:>5} | sin requests completadas ({errors} errores)")
+        return
+
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(
+        f"{mode:>5} | {len(latencies) / elapsed:8.1f} req/s | "
+        f"p50 {statistics.median(ordered):7.2f} ms | p95 {p95:7.2f} ms | "
+        f"requests {len(latencies):6d} | errores {errors}"
+    )
+
+async def main(concurrency: int, duration: float, n: int, modes: list):
+    service = RecommenderService()
+    service.train_model()
+    service.results_cache.max_entries = 0
+
+    df_users = get_data_as_dataframe("SELECT user_id FROM Usuarios")
+    user_ids = df_users["user_id"].astype(int).tolist()
+
+    print(f"\n=== THROUGHPUT: {concurrency} clientes concurrentes, {duration:.0f}s por modo, n={n} ===")
+    try:
+        for mode in modes:
+            # Warm-up: conexiones del pool abiertas y matriz de características cargada
+            await run_mode(mode, service, user_ids, concurrency, 1.0, n)
+            report(mode, *(await run_mode(mode, service, user_ids, concurrency, duration, n)))
+    finally:
+        await async_engine.dispose()
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Prueba de carga sync (threadpool) vs async (asyncpg)")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--n", type=int, default=5)
+    parser.add_argument("--modes", nargs="+", default=["sync", "async"], choices=["sync", "async"])
+    args = parser.parse_args()
+
+    asyncio.run(main(args.concurrency, args.duration, args.n, args.modes))
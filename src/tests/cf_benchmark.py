@@ -0,0 +1,100 @@
+import json
+import argparse
+import tempfile
+import logging
+from src.services.factorization import FactorModel, fit_factors
+from src.tests.synthetic_data import generate_dataset
+from src.tests.stage_benchmark import fresh_service, timed, per_call, format_time, format_bytes
+from src.tests.model_evaluation import from_dataset, evaluate_holdout_temporal
+
+# Comparación de los backends de filtrado colaborativo (CF_BACKEND) sobre el mismo dataset sintético:
+#
+#  - item_item: similitud del coseno Item-Item podada (fit_similarity + snapshot mapeado)
+#  - als:       factorización implícita por mínimos cuadrados alternados (fit_factors)
+#
+# Por backend se mide:
+#  - entrenamiento: tiempo de ajuste del modelo CF con todas las compras
+#  - tamaño:        bytes del modelo publicado (pares podados o matrices de factores)
+#  - cf:            tiempo por request de los candidatos CF (mediana sobre la muestra)
+#  - calidad:       métricas del Hold-Out Temporal (model_evaluation) con ese backend
+#
+# Uso: python -m src.tests.cf_benchmark --users 20000 --items 2000 --output cf.json
+
+BACKENDS = ("item_item", "als")
+METRICS = ("hit_rate", "recall_at_k", "ndcg_at_k", "precision_genre", "catalog_coverage")
+
+def benchmark_backend(backend: str, dataset, sample: int, repeats: int, workers: int):
+    result = {"backend": backend}
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = fresh_service(directory)
+        service.factor_model = FactorModel()
+        service.CF_BACKEND = backend
+
+        if backend == "als":
+            model, result["train_s"] = timed(lambda: fit_factors(
+                dataset.purchase_user_ids, dataset.purchase_item_ids, **service.ALS_PARAMS
+            ))
+            service.factor_model.publish(*model, service.ALS_PARAMS["regularization"], service.ALS_PARAMS["alpha"])
+            result["model_bytes"] = int(model[1].nbytes + model[4].nbytes)
+            result["params"] = dict(service.ALS_PARAMS)
+        else:
+            model, result["train_s"] = timed(lambda: service.fit_similarity(
+                dataset.purchase_user_ids, dataset.purchase_item_ids
+            ))
+            service.cooc_index.rebuild(model[0], model[1])
+            service._save_snapshot(*model, dataset.compra_ids)
+            assert service.similarity_model.available(), "el modelo CF no quedó mapeado"
+            # Pares (item_a, item_b, score) como en MatrizSimilitud
+            result["model_bytes"] = int(len(model[4]) * (4 + 4 + 8))
+            result["similarity_pairs"] = int(len(model[4]))
+
+        contexts = dataset.contexts(sample)
+        result["cf_request_s"] = per_call(service._get_collaborative_filtering_candidates,
+                                          [(c,) for c in contexts], repeats)
+
+    quality = evaluate_holdout_temporal(min_user_id=0, workers=workers, data=from_dataset(dataset), cf_backend=backend)
+    result["quality"] = {metric: quality[metric] for metric in METRICS}
+    return result
+
+def print_table(results: list):
+    rows = [
+        ("entrenamiento", lambda r: format_time(r["train_s"])),
+        ("tamaño modelo", lambda r: format_bytes(r["model_bytes"])),
+        ("cf por request", lambda r: format_time(r["cf_request_s"])),
+    ] + [(metric, lambda r, m=metric: f"{r['quality'][m]:.4f}") for metric in METRICS]
+
+    print(f"\n{'':>16} | " + " | ".join(f"{r['backend']:>12}" for r in results))
+    for name, cell in rows:
+        print(f"{name:>16} | " + " | ".join(f"{cell(r):>12}" for r in results))
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparación de los backends CF (item_item vs als) sobre datos sintéticos")
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=2000)
+    parser.add_argument("--purchases", type=int, nargs=2, default=[10, 40], metavar=("MIN", "MAX"),
+                        help="rango de compras por usuario")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--sample", type=int, default=200, help="usuarios medidos por request")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=None, help="procesos de la evaluación (por defecto, uno por CPU)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    dataset = generate_dataset(n_items=args.items, n_users=args.users, purchases_per_user=tuple(args.purchases),
+                               cold_users=0, seed=args.seed)
+    print(f"Dataset: {dataset.describe()}")
+
+    results = [benchmark_backend(b, dataset, args.sample, args.repeats, args.workers) for b in args.backends]
+    print_table(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "dataset": dataset.describe(), "results": results}, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import logging
+import subprocess
+from datetime import datetime
+from collections import Counter
+import httpx
+from src.database import get_data_as_dataframe
+
+# Prueba de carga de la API con N clientes concurrentes y una mezcla de operaciones.
+#
+# Operaciones (el peso de cada una se elige con --mix):
+#  - hybrid:   GET /user/{id}/recommend de un usuario con compras (modelo híbrido)
+#  - cold:     GET /user/{id}/recommend de un usuario sin compras (cold start)
+#  - purchase: POST /user/{id}/transaction de un usuario e ítem al azar
+#  - create:   POST /user con 3 géneros favoritos al azar (el usuario nuevo pasa a ser 'cold')
+#
+# Cada cliente hace una request tras otra hasta que vence el tiempo (carga de lazo cerrado).
+# Se reporta throughput, p50/p95/p99/p99.9 y tasa de errores por operación y en total, y se
+# escribe un JSON para comparar entre versiones (--baseline compara contra uno anterior).
+#
+# Sin --url la app corre en el mismo proceso (transporte ASGI, con su ciclo de vida);
+# con --url se prueba un servidor ya levantado. Los ids de usuarios, ítems y géneros se leen de la BD.
+#
+# Uso: python -m src.tests.load_test --concurrency 50 --duration 30 --mix hybrid=70,cold=15,purchase=10,create=5 --output load.json
+
+OPERATIONS = ("hybrid", "cold", "purchase", "create")
+DEFAULT_MIX = "hybrid=70,cold=15,purchase=10,create=5"
+PERCENTILES = (50, 95, 99, 99.9)
+
+def parse_mix(text: str):
+    """
+    'hybrid=70,cold=15' -> {'hybrid': 70.0, 'cold': 15.0}
+    """
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"operación desconocida '{name}' (válidas: {', '.join(OPERATIONS)})")
+        mix[name] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("la suma de los pesos debe ser positiva")
+    return mix
+
+def percentile(ordered: list, p: float):
+    """
+    Percentil por rango más cercano sobre una lista ya ordenada.
+    """
+    if not ordered:
+        return None
+    rank = max(1, int(-(-p * len(ordered) // 100)))  # ceil(p/100 * n)
+    return ordered[min(rank, len(ordered)) - 1]
+
+def load_ids():
+    users = get_data_as_dataframe("""
+        SELECT u.user_id, COUNT(c.compra_id) as compras
+        FROM Usuarios u LEFT JOIN Compras c ON c.user_id = u.user_id
+        GROUP BY u.user_id
+    """)
+    items = get_data_as_dataframe("SELECT item_id FROM Items")
+    genres = get_data_as_dataframe("SELECT genero_id FROM Generos")
+    if users is None or items is None or genres is None:
+        raise RuntimeError("No se pudieron leer usuarios, ítems y géneros de la BD.")
+
+    return {
+        "hybrid": users.loc[users["compras"] > 0, "user_id"].astype(int).tolist(),
+        "cold": users.loc[users["compras"] == 0, "user_id"].astype(int).tolist(),
+        "items": items["item_id"].astype(int).tolist(),
+        "genres": genres["genero_id"].astype(int).tolist(),
+    }
+
+class LoadTest:
+    """
+    Clientes concurrentes que eligen una operación según los pesos y registran
+    (operación, latencia, código de estado) de cada request.
+    """
+
+    def __init__(self, client: httpx.AsyncClient, ids: dict, mix: dict, n: int):
+        self.client = client
+        self.ids = ids
+        self.n = n
+        # Sólo operaciones con datos para ejecutarlas (ej: sin usuarios sin compras no hay 'cold')
+        self.operations = [op for op in mix if mix[op] > 0 and self._has_data(op)]
+        self.weights = [mix[op] for op in self.operations]
+        self.samples = {op: [] for op in self.operations}
+        self.statuses = {op: Counter() for op in self.operations}
+
+    def _has_data(self, op: str):
+        if op == "create":
+            return True
+        if op == "purchase":
+            return bool(self.ids["items"]) and bool(self.ids["hybrid"] or self.ids["cold"])
+        return bool(self.ids[op])
+
+    def _request(self, op: str, rng: random.Random):
+        if op in ("hybrid", "cold"):
+            uid = rng.choice(self.ids[op])
+            return self.client.get(f"/user/{uid}/recommend", params={"n": self.n})
+        if op == "purchase":
+            uid = rng.choice(self.ids["hybrid"] or self.ids["cold"])
+            return self.client.post(f"/user/{uid}/transaction", params={"item_id": rng.choice(self.ids["items"])})
+        genres = rng.sample(self.ids["genres"], min(3, len(self.ids["genres"])))
+        body = {"username": f"loadtest_{uuid.uuid4().hex[:12]}", "attributes": {"generos_id": genres}}
+        return self.client.post("/user", json=body)
+
+    async def _client(self, seed: int, deadline: float, record: bool):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            op = rng.choices(self.operations, self.weights)[0]
+            start = time.perf_counter()
+            try:
+                response = await self._request(op, rng)
+                status = response.status_code
+            except httpx.TimeoutException:
+                status = "timeout"
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed_ms = (time.perf_counter() - start) * 1000
+
+            if op == "create" and status == 200:
+                self.ids["cold"].append(int(response.json()["id"]))
+            if record:
+                self.samples[op].append(elapsed_ms)
+                self.statuses[op][str(status)] += 1
+
+    async def run(self, concurrency: int, duration: float, seed: int, record: bool = True):
+        deadline = time.perf_counter() + duration
+        started = time.perf_counter()
+        await asyncio.gather(*(self._client(seed * 100_000 + i, deadline, record) for i in range(concurrency)))
+        return time.perf_counter() - started
+
+def summarize(latencies: list, statuses: Counter, elapsed: float):
+    ordered = sorted(latencies)
+    requests = len(ordered)
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "error_rate": errors / requests if requests else 0.0,
+        "throughput_rps": requests / elapsed if elapsed > 0 else 0.0,
+        "status_counts": dict(sorted(statuses.items())),
+        "latency_ms": {
+            **{f"p{p:g}": percentile(ordered, p) for p in PERCENTILES},
+            "mean": sum(ordered) / requests if requests else None,
+            "max": ordered[-1] if ordered else None,
+        },
+    }
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+def print_report(results: dict):
+    config = results["config"]
+    print(f"\n=== CARGA: {config['concurrency']} clientes, {config['duration_s']:.0f}s, n={config['n']} "
+          f"({config['target']}) ===")
+    print(f"{'operación':>10} | {'req/s':>8} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'p99.9':>8} | {'requests':>8} | errores")
+    rows = list(results["operations"].items()) + [("TOTAL", results["total"])]
+    for name, r in rows:
+        lat = r["latency_ms"]
+        fmt = lambda v: f"{v:8.2f}" if v is not None else f"{'-':>8}"
+        print(f"{name:>10} | {r['throughput_rps']:8.1f} | {fmt(lat['p50'])} | {fmt(lat['p95'])} | {fmt(lat['p99'])} | "
+              f"{fmt(lat['p99.9'])} | {r['requests']:8d} | {r['errors']} ({r['error_rate']:.2%})")
+
+def print_comparison(results: dict, baseline: dict):
+    """
+    Diferencia porcentual de throughput y percentiles contra un resultado anterior.
+    """
+    print(f"\n--- Comparación contra {baseline.get('git_revision') or 'baseline'} ({baseline.get('started_at')}) ---")
+    print(f"{'operación':>10} | {'req/s':>8} | {'p50':>8} | {'p95':>8} | {'p99':>8} | {'errores':>8}")
+    current = dict(results["operations"], TOTAL=results["total"])
+    previous = dict(baseline.get("operations", {}), TOTAL=baseline.get("total", {}))
+
+    def delta(new, old):
+        if new is None or not old:
+            return f"{'-':>8}"
+        return f"{(new - old) / old:+8.1%}"
+
+    for name, r in current.items():
+        old = previous.get(name)
+        if not old:
+            continue
+        print(f"{name:>10} | {delta(r['throughput_rps'], old['throughput_rps'])} | "
+              f"{delta(r['latency_ms']['p50'], old['latency_ms']['p50'])} | "
+              f"{delta(r['latency_ms']['p95'], old['latency_ms']['p95'])} | "
+              f"{delta(r['latency_ms']['p99'], old['latency_ms']['p99'])} | "
+              f"{r['error_rate'] - old['error_rate']:+8.2%}")
+
+async def run_load_test(args):
+    ids = load_ids()
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits)
+        lifespan = None
+    else:
+        from src.app import app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=timeout)
+        lifespan = app.router.lifespan_context(app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            test = LoadTest(client, ids, args.mix, args.n)
+            if args.warmup > 0:
+                await test.run(args.concurrency, args.warmup, args.seed + 1, record=False)
+            started_at = datetime.now().isoformat(timespec="seconds")
+            elapsed = await test.run(args.concurrency, args.duration, args.seed)
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    all_latencies = [ms for samples in test.samples.values() for ms in samples]
+    all_statuses = sum(test.statuses.values(), Counter())
+    return {
+        "started_at": started_at,
+        "git_revision": git_revision(),
+        "config": {
+            "target": args.url or "in-process",
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "n": args.n,
+            "mix": {op: args.mix[op] for op in test.operations},
+            "seed": args.seed,
+            "users": {"hybrid": len(ids["hybrid"]), "cold": len(ids["cold"])},
+        },
+        "elapsed_s": elapsed,
+        "operations": {op: summarize(test.samples[op], test.statuses[op], elapsed) for op in test.operations},
+        "total": summarize(all_latencies, all_statuses, elapsed),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga concurrente de la API con reporte de percentiles")
+    parser.add_argument("--url", default=None, help="servidor a probar (ej: http://127.0.0.1:8000); por defecto, la app en proceso")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--n", type=int, default=5, help="recomendaciones por request")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"pesos por operación (por defecto {DEFAULT_MIX})")
+    parser.add_argument("--timeout", type=float, default=10.0, help="timeout por request en segundos")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="archivo JSON donde guardar los resultados")
+    parser.add_argument("--baseline", default=None, help="JSON de una corrida anterior para comparar")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    results = asyncio.run(run_load_test(args))
+    print_report(results)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+    # Código de salida distinto de cero si hubo errores, para usarlo en CI
+    sys.exit(1 if results["total"]["errors"] else 0)
+
+if __name__ == "__main__":
+    main()
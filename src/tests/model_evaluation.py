@@ -1,202 +1,371 @@
-import math
-from datetime import datetime
-import pandas as pd
+import os
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 
-from src.database import get_data_as_dataframe, execute_non_query
+from src.database import get_data_as_dataframe
 from src.services.recommender import RecommenderService
+from src.services.factorization import fit_factors
+from src.services.content import ContentIndex, item_attributes
+from src.services.scoring import (
+    hybrid_weights, rank_hybrid_batch, align_hybrid_model, align_factors, align_content, batch_chunk_size,
+    item_item_scores, factor_scores, genre_profile_scores, content_neighbor_scores,
+)
+
+# Evaluación offline con Hold-Out Temporal, toda en memoria (no modifica la BD).
+#
+# 1. Se leen una sola vez Compras, ItemGeneros y PreferenciasUsuario (o se generan datos sintéticos).
+# 2. Por usuario, el 20% de sus compras más recientes es test y el resto train.
+# 3. El modelo (similitud Item-Item o factores ALS, según --cf-backend, + rankings de popularidad)
+#    se entrena SÓLO con train, con el mismo fit_similarity / fit_factors que usa el servicio.
+#    El CBF usa los géneros o, con --cbf-backend attributes, el índice de vecinos de contenido.
+# 4. Los usuarios se puntúan en bloques matriciales (rank_hybrid_batch, la misma lógica que
+#    /recommend/batch) repartidos en un pool de procesos. Se recomiendan tantos ítems como compras
+#    de test tiene cada usuario (o --k fijo).
+#
+# Métricas: Jaccard, Hit Rate, Precisión de Género, Cobertura de Catálogo, Recall@k y NDCG@k.
+# Uso: python -m src.tests.model_evaluation [--workers 4] [--synthetic-users 100000 --synthetic-items 2000] [--cf-backend als] [--cbf-backend attributes]
+
+class EvaluationData:
+    """
+    Compras (con una clave de orden temporal), pares Item-Género, preferencias y tamaño del catálogo.
+    'items' son las filas de Items (item_id, artista, anio, pais, idioma), para el índice de contenido.
+    """
+
+    def __init__(self, user_ids, item_ids, order_key, genre_item_ids, genre_ids, pref_user_ids, pref_genre_ids, catalog_size,
+                 items=None):
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.item_ids = np.asarray(item_ids, dtype=np.int64)
+        self.order_key = np.asarray(order_key)
+        self.genre_item_ids = np.asarray(genre_item_ids, dtype=np.int64)
+        self.genre_ids = np.asarray(genre_ids, dtype=np.int64)
+        self.pref_user_ids = np.asarray(pref_user_ids, dtype=np.int64)
+        self.pref_genre_ids = np.asarray(pref_genre_ids, dtype=np.int64)
+        self.catalog_size = int(catalog_size)
+        self.items = items
+
+def load_from_db():
+    df_compras = get_data_as_dataframe("SELECT compra_id, user_id, item_id, timestamp FROM Compras")
+    df_genres = get_data_as_dataframe("SELECT item_id, genero_id FROM ItemGeneros")
+    df_prefs = get_data_as_dataframe("SELECT user_id, genero_id FROM PreferenciasUsuario")
+    df_items = get_data_as_dataframe("SELECT item_id, artista, anio, pais, idioma FROM Items")
+    if df_compras is None or df_genres is None or df_prefs is None or df_items is None:
+        raise RuntimeError("No se pudieron leer los datos de la BD.")
+
+    # Orden temporal: timestamp y, a igual timestamp, compra_id
+    ts = df_compras["timestamp"].to_numpy().astype("datetime64[us]").astype(np.int64)
+    order_key = np.lexsort((df_compras["compra_id"].to_numpy(), ts)).argsort()
+    return EvaluationData(
+        df_compras["user_id"].to_numpy(), df_compras["item_id"].to_numpy(), order_key,
+        df_genres["item_id"].to_numpy(), df_genres["genero_id"].to_numpy(),
+        df_prefs["user_id"].to_numpy(), df_prefs["genero_id"].to_numpy(), len(df_items), items=df_items,
+    )
 
+def load_synthetic(n_users: int, n_items: int, seed: int):
+    from src.tests.synthetic_data import generate_dataset
+
+    return from_dataset(generate_dataset(n_items=n_items, n_users=n_users, cold_users=0, seed=seed))
+
+def from_dataset(dataset):
+    """
+    EvaluationData a partir de un SyntheticDataset.
+    """
+    pref_users = np.repeat(dataset.user_ids, [len(p) for p in dataset.preferences])
+    pref_genres = np.fromiter((g for prefs in dataset.preferences for g in prefs), dtype=np.int64, count=len(pref_users))
+    # Las compras sintéticas ya vienen en orden de llegada: compra_id es el tiempo
+    return EvaluationData(
+        dataset.purchase_user_ids, dataset.purchase_item_ids, dataset.compra_ids,
+        dataset.genre_item_ids, dataset.genre_genre_ids, pref_users, pref_genres, len(dataset.item_ids),
+        items=pd.DataFrame(list(dataset.details_map().values())),
+    )
 
-def jaccard_index(set_a: set, set_b: set) -> float:
-    if not set_a and not set_b:
-        return 1.0
-    if not set_a or not set_b:
-        return 0.0
-    inter = len(set_a.intersection(set_b))
-    union = len(set_a.union(set_b))
-    return inter / union if union > 0 else 0.0
-
+def split_holdout(data: EvaluationData, proportion_test: float, min_history: int, min_user_id: int):
+    """
+    Hold-Out Temporal vectorizado: para cada usuario con al menos 'min_history' compras,
+    las ceil(total * proportion_test) más recientes (mínimo 1) van a test.
+    Devuelve (usuarios evaluados, máscara de train, máscara de test) sobre las compras.
+    """
+    users, user_codes, totals = np.unique(data.user_ids, return_inverse=True, return_counts=True)
+    evaluated = (totals >= min_history) & (users > min_user_id)
+
+    # Posición de cada compra dentro de su usuario, de la más reciente a la más vieja
+    order = np.lexsort((-data.order_key, user_codes))
+    starts = np.concatenate([[0], np.cumsum(totals)[:-1]])
+    recency = np.empty(len(order), dtype=np.int64)
+    recency[order] = np.arange(len(order)) - np.repeat(starts, totals)
+
+    test_n = np.maximum(1, np.ceil(totals * proportion_test).astype(np.int64))
+    in_evaluated = evaluated[user_codes]
+    test = in_evaluated & (recency < test_n[user_codes])
+    # Los usuarios no evaluados aportan todas sus compras al entrenamiento
+    train = ~test
+    return users[evaluated], train, test
+
+class EvaluationModel:
+    """
+    Modelo entrenado con train, alineado como en /recommend/batch, más lo necesario para puntuar.
+    El CF es la similitud Item-Item o, con el backend 'als', los factores de ítems y usuarios;
+    el CBF, los géneros o (backend 'attributes') la matriz de contenido y sus vecinos.
+    """
+
+    def __init__(self, item_ids, similarity, features, genre_ids, top_sellers, boost, cf_limit,
+                 item_factors=None, factor_user_ids=None, user_factors=None):
+        self.item_ids = item_ids
+        self.similarity = similarity
+        self.item_factors = item_factors
+        self.factor_user_ids = factor_user_ids
+        self.user_factors = user_factors
+        self.features = features
+        self.genre_ids = genre_ids
+        self.top_sellers = top_sellers  # columnas ordenadas por ventas en train (Fallback)
+        self.boost = boost
+        self.cf_limit = cf_limit
+        self.content_matrix = None
+        self.content_neighbors = None
+
+def build_model(service: RecommenderService, data: EvaluationData, train):
+    if service.CF_BACKEND == "als":
+        factor_users, user_factors, _, fit_items, fitted_factors = fit_factors(
+            data.user_ids[train], data.item_ids[train], **service.ALS_PARAMS
+        )
+        sim_a = sim_b = np.array([], dtype=np.int64)
+        scores = np.array([], dtype=np.float64)
+    else:
+        fit_items, _, rows, cols, scores = service.fit_similarity(data.user_ids[train], data.item_ids[train])
+        sim_a, sim_b = fit_items[rows], fit_items[cols]
+
+    # Matriz Item-Género del catálogo (como ItemFeatureCache)
+    feature_item_ids, item_codes = np.unique(data.genre_item_ids, return_inverse=True)
+    genre_ids, genre_codes = np.unique(data.genre_ids, return_inverse=True)
+    matrix = np.zeros((len(feature_item_ids), len(genre_ids)), dtype=np.float32)
+    matrix[item_codes, genre_codes] = 1.0
+
+    # Índice de contenido del catálogo (no depende de las compras)
+    content = None
+    extra_item_ids = fit_items
+    if service.CBF_BACKEND == "attributes":
+        content = ContentIndex()
+        content_item_ids, attributes = item_attributes(data.items)
+        content.build(content_item_ids, data.genre_item_ids, data.genre_ids, attributes)
+        extra_item_ids = np.union1d(fit_items, content.item_ids)
+
+    item_ids, similarity, features = align_hybrid_model(
+        sim_a, sim_b, scores, feature_item_ids, matrix, cf_item_ids=extra_item_ids
+    )
 
-def evaluate_holdout_temporal(proportion_test: float = 0.2, min_history: int = 5, catalog_size: int = 100):
-    service = RecommenderService()
+    # Más vendidos en train (desempate por item_id), para el Fallback
+    sales = np.bincount(np.searchsorted(item_ids, data.item_ids[train]), minlength=len(item_ids))
+    top_sellers = np.lexsort((item_ids, -sales))
+
+    model = EvaluationModel(item_ids, similarity, features, genre_ids, top_sellers,
+                            service.BOOST_VALUE, service.CF_LIMIT)
+    if service.CF_BACKEND == "als":
+        model.item_factors = align_factors(item_ids, fit_items, fitted_factors)
+        model.factor_user_ids, model.user_factors = factor_users, user_factors
+    if content is not None:
+        model.content_matrix, model.content_neighbors = align_content(
+            item_ids, content.item_ids, content.matrix, content.neighbor_matrix
+        )
+    return model
+
+def _user_matrix(user_ids, item_ids, users, model_item_ids, mask):
+    """
+    CSR (usuarios evaluados x ítems del modelo) con la cantidad de compras de cada ítem.
+    """
+    keep = mask & np.isin(user_ids, users) & np.isin(item_ids, model_item_ids)
+    return sp.csr_matrix(
+        (np.ones(int(keep.sum())), (np.searchsorted(users, user_ids[keep]), np.searchsorted(model_item_ids, item_ids[keep]))),
+        shape=(len(users), len(model_item_ids))
+    )
 
-    # 1) Preparar lista de usuarios sintéticos (IDs > 17) con al menos `min_history` compras
-    sql_users = (
-        """
-        SELECT u.user_id, COUNT(c.compra_id) as total
-        FROM Usuarios u
-        JOIN Compras c ON u.user_id = c.user_id
-        WHERE u.user_id > 17
-        GROUP BY u.user_id
-        HAVING COUNT(c.compra_id) >= :min_hist
-        """
+# Estado de cada proceso del pool (se recibe una vez, al iniciarlo)
+_worker = {}
+
+def _init_worker(model, train_matrix, train_counts, test_matrix, preferences, k_per_user, user_vectors):
+    _worker.update(model=model, train=train_matrix, counts=train_counts, test=test_matrix,
+                   preferences=preferences, k=k_per_user, user_vectors=user_vectors)
+
+def _evaluate_chunk(bounds):
+    """
+    Puntúa los usuarios [start, end) y calcula sus métricas.
+    Devuelve (métricas por usuario, ítems recomendados únicos).
+    """
+    start, end = bounds
+    model = _worker["model"]
+    k_per_user = _worker["k"][start:end]
+    purchases = _worker["train"][start:end]
+    test = _worker["test"][start:end]
+    preferences = _worker["preferences"][start:end]
+
+    if model.item_factors is not None:
+        cf_scores, cf_valid = factor_scores(_worker["user_vectors"][start:end], model.item_factors)
+    else:
+        cf_scores, cf_valid = item_item_scores(purchases, model.similarity)
+
+    bought = purchases.toarray() > 0
+    if model.content_matrix is not None:
+        cbf_scores, cbf_valid = content_neighbor_scores(bought, model.content_matrix, model.content_neighbors)
+    else:
+        cbf_scores, cbf_valid = genre_profile_scores(bought, model.features)
+
+    w_cf, w_cbf = hybrid_weights(_worker["counts"][start:end])
+    ranked = rank_hybrid_batch(
+        purchases, cf_scores, cf_valid, cbf_scores, cbf_valid, model.features, preferences,
+        w_cf, w_cbf, model.boost, int(k_per_user.max()), cf_limit=model.cf_limit
     )
-    df_users = get_data_as_dataframe(sql_users, params={"min_hist": min_history})
-    if df_users is None or df_users.empty:
+
+    preferred_items = (preferences.astype(np.float32) @ model.features.T) > 0
+    discounts = 1.0 / np.log2(np.arange(2, int(k_per_user.max()) + 2))
+
+    metrics = np.full((end - start, 5), np.nan)  # jaccard, hit, precisión de género, recall, ndcg
+    recommended = []
+    for row, (cols, _) in enumerate(ranked):
+        k = int(k_per_user[row])
+        cols = cols[:k] if len(cols) > 0 else model.top_sellers[:k]
+        test_cols = test.indices[test.indptr[row]:test.indptr[row + 1]]
+
+        relevant = np.isin(cols, test_cols)
+        hits = int(relevant.sum())
+        union = len(np.union1d(cols, test_cols))
+        metrics[row, 0] = hits / union if union else 1.0
+        metrics[row, 1] = 1.0 if hits else 0.0
+        if len(cols) > 0 and preferences[row].any():
+            metrics[row, 2] = preferred_items[row, cols].mean()
+        metrics[row, 3] = hits / len(test_cols) if len(test_cols) else 0.0
+        ideal = discounts[:min(len(test_cols), k)].sum()
+        metrics[row, 4] = (discounts[:len(cols)] * relevant).sum() / ideal if ideal > 0 else 0.0
+        recommended.append(cols)
+
+    unique_recommended = np.unique(np.concatenate(recommended)) if recommended else np.array([], dtype=np.int64)
+    return metrics, unique_recommended
+
+def evaluate_holdout_temporal(proportion_test: float = 0.2, min_history: int = 5, min_user_id: int = 17,
+                              k: int = None, workers: int = None, chunk_size: int = None, data: EvaluationData = None,
+                              cf_backend: str = None, cbf_backend: str = None):
+    """
+    Ejecuta la evaluación completa y devuelve un dict con las métricas promedio.
+    Sin 'k', a cada usuario se le recomiendan tantos ítems como compras de test tiene.
+    'cf_backend' ('item_item' o 'als') y 'cbf_backend' ('genres' o 'attributes') reemplazan a los de la configuración.
+    """
+    timings = {}
+    start = time.perf_counter()
+    data = data if data is not None else load_from_db()
+    timings["load_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    users, train, test = split_holdout(data, proportion_test, min_history, min_user_id)
+    if len(users) == 0:
         print("No se encontraron usuarios con el historial mínimo requerido.")
-        return
-
-    user_ids = df_users["user_id"].tolist()
-
-    # 2) Verificar si MatrizSimilitud está poblada; si no, entrenar una vez
-    df_ms = get_data_as_dataframe("SELECT COUNT(*) as total FROM MatrizSimilitud")
-    ms_count = int(df_ms.iloc[0]["total"]) if df_ms is not None and not df_ms.empty else 0
-    if ms_count == 0:
-        print("MatrizSimilitud vacía. Entrenando modelo antes de la evaluación...")
-        service.train_model()
-
-    # Acumuladores de métricas
-    jaccard_scores = []
-    hit_rates = []
-    precision_genre_scores = []
-    users_with_genre_prefs = 0
-    recommended_items_global = set()
-
-    for uid in user_ids:
-        print(f"Evaluando usuario {uid}...")
-
-        # Obtener historial ordenado por fecha (más reciente primero)
-        sql_history = (
-            "SELECT compra_id, item_id, timestamp FROM Compras WHERE user_id = :uid "
-            "ORDER BY timestamp DESC"
-        )
-        df_hist = get_data_as_dataframe(sql_history, params={"uid": uid})
-        if df_hist is None or df_hist.empty:
-            print(f" - Usuario {uid} no tiene historial (extraño). Saltando.")
-            continue
-
-        total_purchases = len(df_hist)
-        test_n = max(1, math.ceil(total_purchases * proportion_test))
-
-        # Test set: 20% más reciente
-        df_test = df_hist.head(test_n).copy()
-        df_train = df_hist.tail(total_purchases - test_n).copy()
-
-        # Guardar datos del test para reinstertion
-        to_restore = df_test.copy()
-
-        # IDs de las compras a eliminar (por compra_id)
-        compra_ids = to_restore['compra_id'].astype(int).tolist()
-
-        if not compra_ids:
-            print(f" - Usuario {uid} no tiene compras para test. Saltando.")
-            continue
-
-        # DELETE seguro: eliminamos solo las filas de este usuario con esos compra_id
-        ids_str = ",".join(map(str, compra_ids))
-        sql_delete = f"DELETE FROM Compras WHERE compra_id IN ({ids_str}) AND user_id = :uid"
-
-        try:
-            # Ejecutar borrado temporal
-            deleted = execute_non_query(sql_delete, params={"uid": uid})
-            print(f" - Compras eliminadas temporalmente: {deleted}")
-
-            # k dinámico = tamaño del test set
-            k_dynamic = len(to_restore)
-
-            # Llamar al recomendador con top_k = k_dynamic
-            recs = service.get_recommendations(uid, top_k=k_dynamic)
-
-            # Extraer item_ids recomendados 
-            rec_item_ids = []
-            for r in recs:
-                if isinstance(r, dict):
-                    if 'id' in r:
-                        rec_item_ids.append(int(r['id']))
-                    elif 'item_id' in r:
-                        rec_item_ids.append(int(r['item_id']))
-                elif isinstance(r, int):
-                    rec_item_ids.append(r)
-
-            rec_set = set(rec_item_ids)
-            test_set = set(to_restore['item_id'].astype(int).tolist())
-
-            # Métricas
-            jacc = jaccard_index(rec_set, test_set)
-            hit = 1 if len(rec_set.intersection(test_set)) > 0 else 0
-
-            # Precision de Género
-            # Obtener géneros explícitos del usuario
-            sql_prefs = "SELECT genero_id FROM PreferenciasUsuario WHERE user_id = :uid"
-            df_prefs = get_data_as_dataframe(sql_prefs, params={"uid": uid})
-            user_pref_genres = set(df_prefs['genero_id'].tolist()) if df_prefs is not None and not df_prefs.empty else set()
-
-            precision_genre = None
-            if rec_item_ids and user_pref_genres:
-                # Obtener géneros de los items recomendados
-                ids_rec_str = ",".join(map(str, rec_item_ids))
-                sql_item_genres = f"SELECT item_id, genero_id FROM ItemGeneros WHERE item_id IN ({ids_rec_str})"
-                df_item_genres = get_data_as_dataframe(sql_item_genres)
-
-                # Mapear item -> set(genres)
-                item_to_genres = {}
-                if df_item_genres is not None and not df_item_genres.empty:
-                    for _, row in df_item_genres.iterrows():
-                        iid = int(row['item_id'])
-                        gid = int(row['genero_id'])
-                        item_to_genres.setdefault(iid, set()).add(gid)
-
-                # Calcular cuántos ítems recomendados coinciden con al menos un género preferido
-                matches = 0
-                for iid in rec_item_ids:
-                    genres = item_to_genres.get(iid, set())
-                    if not genres.isdisjoint(user_pref_genres):
-                        matches += 1
-
-                precision_genre = matches / len(rec_item_ids) if rec_item_ids else 0.0
-                users_with_genre_prefs += 1
-            else:
-                # Si no tiene prefs explícitas o no hubo recomendaciones, definimos precision como None
-                precision_genre = None
-
-            # Añadir ítems recomendados al set global para Catalog Coverage
-            recommended_items_global.update(rec_set)
-
-            # Guardar métricas
-            jaccard_scores.append(jacc)
-            hit_rates.append(hit)
-            precision_genre_scores.append(precision_genre)
-
-        finally:
-            # Restaurar las compras borradas: insertamos usando user_id, item_id y timestamp original
-            if not to_restore.empty:
-                # Reinsertar en bloque
-                inserted = 0
-                for _, row in to_restore.iterrows():
-                    try:
-                        ts = row['timestamp']
-                        # Asegurar tipo datetime
-                        if isinstance(ts, pd.Timestamp):
-                            ts = ts.to_pydatetime()
-
-                        sql_ins = (
-                            "INSERT INTO Compras (user_id, item_id, timestamp) "
-                            "VALUES (:uid, :iid, :ts)"
-                        )
-                        execute_non_query(sql_ins, params={"uid": uid, "iid": int(row['item_id']), "ts": ts})
-                        inserted += 1
-                    except Exception as e:
-                        print(f"   [ERROR] Falló reinsertar compra para user {uid}: {e}")
-                print(f" - Compras restauradas: {inserted}")
-
-    # Post-proceso de métricas
-    avg_jaccard = float(np.mean(jaccard_scores)) if jaccard_scores else 0.0
-    avg_hit = float(np.mean(hit_rates)) if hit_rates else 0.0
-
-    # Promedio de precision de género ignorando valores None
-    valid_precisions = [p for p in precision_genre_scores if p is not None]
-    avg_precision_genre = float(np.mean(valid_precisions)) if valid_precisions else 0.0
-
-    catalog_coverage = (len(recommended_items_global) / float(catalog_size)) * 100.0
-
-    print("\n=== Evaluación Hold-Out Temporal Proporcional (80/20) ===")
-    print(f"Usuarios evaluados: {len(jaccard_scores)}")
-    print(f"Avg. Jaccard Index: {avg_jaccard:.4f}")
-    print(f"Avg. Hit Rate: {avg_hit:.4f}")
-    print(f"Avg. Precision (Genre) [sobre usuarios con prefs]: {avg_precision_genre:.4f}")
-    print(f"Catalog Coverage: {catalog_coverage:.2f}% ({len(recommended_items_global)} items únicos recomendados)")
+        return None
 
+    service = RecommenderService()
+    service.CF_BACKEND = cf_backend or service.CF_BACKEND
+    service.CBF_BACKEND = cbf_backend or service.CBF_BACKEND
+    model = build_model(service, data, train)
+    timings["train_s"] = time.perf_counter() - start
+
+    # Matrices por usuario evaluado, alineadas con el índice de ítems del modelo
+    start = time.perf_counter()
+    train_matrix = _user_matrix(data.user_ids, data.item_ids, users, model.item_ids, train)
+    train_counts = np.bincount(np.searchsorted(users, data.user_ids[train & np.isin(data.user_ids, users)]), minlength=len(users))
+    test_matrix = _user_matrix(data.user_ids, data.item_ids, users, model.item_ids, test)
+    test_matrix.data[:] = 1
+    test_counts = np.bincount(np.searchsorted(users, data.user_ids[test]), minlength=len(users))
+    k_per_user = np.full(len(users), k) if k else test_counts
+
+    preferences = np.zeros((len(users), len(model.genre_ids)), dtype=bool)
+    known = np.isin(data.pref_user_ids, users) & np.isin(data.pref_genre_ids, model.genre_ids)
+    preferences[np.searchsorted(users, data.pref_user_ids[known]), np.searchsorted(model.genre_ids, data.pref_genre_ids[known])] = True
+
+    # Bloques matriciales (usuarios x ítems densos): más chicos cuanto más grande el catálogo
+    chunk_size = chunk_size or batch_chunk_size(len(model.item_ids))
+    chunks = [(s, min(s + chunk_size, len(users))) for s in range(0, len(users), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    # Factores de los usuarios evaluados (todos tienen compras en train, así que están en el modelo)
+    user_vectors = None
+    if model.user_factors is not None:
+        user_vectors = model.user_factors[np.searchsorted(model.factor_user_ids, users)]
+    init_args = (model, train_matrix, train_counts, test_matrix, preferences, k_per_user, user_vectors)
+
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+            results = list(pool.map(_evaluate_chunk, chunks))
+    else:
+        _init_worker(*init_args)
+        results = [_evaluate_chunk(bounds) for bounds in chunks]
+    timings["score_s"] = time.perf_counter() - start
+
+    metrics = np.vstack([r[0] for r in results])
+    recommended = np.unique(np.concatenate([r[1] for r in results]))
+    precision_users = int(np.isfinite(metrics[:, 2]).sum())
+
+    summary = {
+        "users": int(len(users)),
+        "purchases_train": int(train.sum()),
+        "purchases_test": int(test.sum()),
+        "k": k or "dinámico (compras de test)",
+        "cf_backend": service.CF_BACKEND,
+        "cbf_backend": service.CBF_BACKEND,
+        "jaccard": float(metrics[:, 0].mean()),
+        "hit_rate": float(metrics[:, 1].mean()),
+        "precision_genre": float(np.nanmean(metrics[:, 2])) if precision_users else 0.0,
+        "precision_genre_users": precision_users,
+        "recall_at_k": float(metrics[:, 3].mean()),
+        "ndcg_at_k": float(metrics[:, 4].mean()),
+        "catalog_coverage": len(recommended) / data.catalog_size * 100.0 if data.catalog_size else 0.0,
+        "recommended_items": int(len(recommended)),
+        "workers": workers,
+        "timings": timings,
+    }
+
+    print(f"\n=== Evaluación Hold-Out Temporal Proporcional ({100 - proportion_test * 100:.0f}/{proportion_test * 100:.0f}) | CF {service.CF_BACKEND}, CBF {service.CBF_BACKEND} ===")
+    print(f"Usuarios evaluados: {summary['users']} (compras train {summary['purchases_train']}, test {summary['purchases_test']})")
+    print(f"Avg. Jaccard Index: {summary['jaccard']:.4f}")
+    print(f"Avg. Hit Rate: {summary['hit_rate']:.4f}")
+    print(f"Avg. Precision (Genre) [sobre usuarios con prefs]: {summary['precision_genre']:.4f}")
+    print(f"Avg. Recall@k: {summary['recall_at_k']:.4f}")
+    print(f"Avg. NDCG@k: {summary['ndcg_at_k']:.4f}")
+    print(f"Catalog Coverage: {summary['catalog_coverage']:.2f}% ({summary['recommended_items']} items únicos recomendados)")
+    print(f"Tiempos: carga {timings['load_s']:.2f}s | entrenamiento {timings['train_s']:.2f}s | "
+          f"puntuación {timings['score_s']:.2f}s ({workers} procesos)")
+    return summary
 
 if __name__ == "__main__":
-    # Ejecutar evaluación
-    evaluate_holdout_temporal(proportion_test=0.2, min_history=5, catalog_size=100)
+    logging.disable(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Evaluación offline Hold-Out Temporal (en memoria, sin modificar la BD)")
+    parser.add_argument("--test-proportion", type=float, default=0.2)
+    parser.add_argument("--min-history", type=int, default=5)
+    parser.add_argument("--min-user-id", type=int, default=17, help="se evalúan usuarios con id mayor (los del seeder)")
+    parser.add_argument("--k", type=int, default=None, help="recomendaciones por usuario (por defecto, sus compras de test)")
+    parser.add_argument("--workers", type=int, default=None, help="procesos del pool (por defecto, uno por CPU)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="usuarios por bloque matricial")
+    parser.add_argument("--synthetic-users", type=int, default=None, help="evaluar sobre datos sintéticos en vez de la BD")
+    parser.add_argument("--synthetic-items", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cf-backend", choices=["item_item", "als"], default=None, help="backend CF (por defecto, CF_BACKEND)")
+    parser.add_argument("--cbf-backend", choices=["genres", "attributes"], default=None, help="backend CBF (por defecto, CBF_BACKEND)")
+    parser.add_argument("--output", default=None, help="archivo JSON donde guardar las métricas")
+    args = parser.parse_args()
+
+    data = None
+    min_user_id = args.min_user_id
+    if args.synthetic_users:
+        data = load_synthetic(args.synthetic_users, args.synthetic_items, args.seed)
+        min_user_id = 0
+
+    summary = evaluate_holdout_temporal(
+        proportion_test=args.test_proportion, min_history=args.min_history, min_user_id=min_user_id,
+        k=args.k, workers=args.workers, chunk_size=args.chunk_size, data=data, cf_backend=args.cf_backend,
+        cbf_backend=args.cbf_backend,
+    )
+
+    if summary is not None and args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
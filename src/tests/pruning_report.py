@@ -0,0 +1,124 @@
+import os
+import time
+import tempfile
+import statistics
+import numpy as np
+
+from src.config import SNAPSHOT_DIR
+from src.database import get_data_as_dataframe, fetch_arrays
+from src.services.recommender import RecommenderService
+from src.services.similarity import SimilarityModel
+from src.services.snapshots import FileLock, ModelSnapshotStore
+from src.services.training import TRAINER_LOCK_FILE
+
+
+def medir_tabla():
+    sql = """
+        SELECT COUNT(*) as filas, pg_total_relation_size('MatrizSimilitud') as bytes
+        FROM MatrizSimilitud
+    """
+    df = get_data_as_dataframe(sql)
+    return int(df.iloc[0]["filas"]), int(df.iloc[0]["bytes"])
+
+
+def servicio_sql(directory: str):
+    """
+    Servicio Item-Item con snapshots en 'directory' (no toca los de la API) y la consulta CF
+    siempre contra MatrizSimilitud, que es lo que se mide (no el modelo mapeado en memoria).
+    """
+    service = RecommenderService()
+    service.CF_BACKEND = "item_item"
+    service.snapshots = ModelSnapshotStore(directory, keep=1)
+    service.similarity_model = SimilarityModel(service.snapshots, poll_interval=10**9)
+    return service
+
+
+def medir_consulta_cf(service: RecommenderService, user_ids: list, repeticiones: int = 5):
+    tiempos = []
+    candidatos = {}
+    for uid in user_ids:
+        context = service.get_user_context(uid)
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            item_ids, _ = service._get_collaborative_filtering_candidates(context)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        candidatos[uid] = set(item_ids.tolist())
+    return tiempos, candidatos
+
+
+def reporte_poda(valores_k: list, min_score: float = 0.0, n_usuarios: int = 30):
+    """
+    Entrena el modelo con distintos tamaños de vecindario y compara tamaño de MatrizSimilitud,
+    latencia de la consulta CF y solapamiento de candidatos contra el modelo sin poda.
+    Mientras corre tiene el lock de entrenamiento (ningún worker de la API re-entrena) y al terminar
+    deja MatrizSimilitud como estaba.
+    """
+    lock = FileLock(os.path.join(SNAPSHOT_DIR, TRAINER_LOCK_FILE))
+    handle = lock.acquire(blocking=False)
+    if handle is None:
+        print("Hay un proceso de la API entrenando el modelo: detenerlo antes de medir.")
+        return
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            _reporte_poda(servicio_sql(directory), valores_k, min_score, n_usuarios)
+    finally:
+        FileLock.release(handle)
+
+
+def _reporte_poda(service: RecommenderService, valores_k: list, min_score: float, n_usuarios: int):
+
+    sql_users = """
+        SELECT user_id FROM Compras
+        GROUP BY user_id
+        ORDER BY COUNT(*) DESC
+        LIMIT :lim
+    """
+    df_users = get_data_as_dataframe(sql_users, params={"lim": n_usuarios})
+    if df_users is None or df_users.empty:
+        print("No hay usuarios con compras para medir.")
+        return
+    user_ids = df_users["user_id"].tolist()
+
+    original = fetch_arrays(
+        "SELECT item_id_a, item_id_b, score FROM MatrizSimilitud", dtypes=[np.int64, np.int64, np.float64]
+    )
+    if original is None:
+        print("No se pudo leer MatrizSimilitud.")
+        return
+    resultados = []
+    base_candidatos = None
+
+    try:
+        for k in [0] + [k for k in valores_k if k > 0]:
+            service.SIM_TOP_K = k
+            service.SIM_MIN_SCORE = min_score if k > 0 else 0.0
+            service.train_model()
+            service.similarity_model.clear()
+
+            filas, tamanio = medir_tabla()
+            tiempos, candidatos = medir_consulta_cf(service, user_ids)
+            if base_candidatos is None:
+                base_candidatos = candidatos
+
+            solapamiento = statistics.mean(
+                len(candidatos[uid] & base_candidatos[uid]) / len(base_candidatos[uid]) if base_candidatos[uid] else 1.0
+                for uid in user_ids
+            )
+            resultados.append((k, filas, tamanio, statistics.mean(tiempos), statistics.quantiles(tiempos, n=20)[-1], solapamiento))
+    finally:
+        service._persist_similarity(*original)
+
+    base_filas, base_tamanio, base_lat = resultados[0][1], resultados[0][2], resultados[0][3]
+
+    print(f"\n=== Poda Top-K de MatrizSimilitud (min_score={min_score}) ===")
+    print(f"{'K':>6} | {'Filas':>9} | {'Tamaño (KB)':>11} | {'Ahorro':>7} | {'CF prom (ms)':>12} | {'CF p95 (ms)':>11} | {'Mejora':>7} | {'Solapamiento':>12}")
+    for k, filas, tamanio, lat, p95, solap in resultados:
+        etiqueta = "todos" if k == 0 else str(k)
+        ahorro = 100.0 * (1 - tamanio / base_tamanio) if base_tamanio else 0.0
+        mejora = 100.0 * (1 - lat / base_lat) if base_lat else 0.0
+        print(f"{etiqueta:>6} | {filas:>9} | {tamanio / 1024:>11.1f} | {ahorro:>6.1f}% | {lat:>12.2f} | {p95:>11.2f} | {mejora:>6.1f}% | {solap:>11.1%}")
+    print(f"\nReferencia sin poda: {base_filas} filas.")
+
+
+if __name__ == "__main__":
+    reporte_poda(valores_k=[10, 20, 50], min_score=0.0, n_usuarios=30)
@@ -0,0 +1,231 @@
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+import logging
+import pandas as pd
+from src.services.catalog import ItemFeatureCache
+from src.services.popularity import PopularityIndex
+from src.services.similarity import ItemCooccurrenceIndex, SimilarityModel
+from src.services.content import ContentIndex, item_attributes
+from src.services.snapshots import ModelSnapshotStore
+from src.services.recommender import RecommenderService
+from src.services.scoring import hybrid_weights
+from src.tests.synthetic_data import generate_dataset
+
+# Micro-benchmarks por etapa del RecommenderService sobre datos sintéticos (sin BD).
+#
+# Para cada escala (múltiplo del tamaño del seeder: 100 ítems, 200 usuarios) se genera un catálogo
+# y un historial de compras con los arquetipos del seeder y se mide tiempo y pico de memoria
+# (tracemalloc, medido aparte del tiempo) de:
+#
+#  Entrenamiento (una vez por escala):
+#   - features:   matriz Item-Género (ItemFeatures)
+#   - fit:        matriz User-Item + similitud Item-Item + poda (fit_similarity)
+#   - publish:    índice de co-ocurrencias + rankings de popularidad
+#   - snapshot:   escritura del snapshot y mapeo del modelo CF
+#   - load:       lectura del snapshot y carga de las co-ocurrencias (arranque del proceso que entrena)
+#   - content:    índice de vecinos de contenido (sólo con --cbf-backend attributes)
+#  Por request (mediana sobre los usuarios de la muestra):
+#   - cf, cbf, combine, enrich (con los detalles ya cargados), cold_start
+#   - request:    recomendación híbrida completa (cf + cbf + combine + enrich)
+#
+# Lo que queda afuera es el acceso a la BD (lectura de Compras, MatrizSimilitud, detalles de Items).
+# Uso: python -m src.tests.stage_benchmark --scales 1 10 50 --output etapas.json
+
+BASE_ITEMS = 100
+BASE_USERS = 200
+TRAIN_STAGES = ("features", "fit", "publish", "content", "snapshot", "load")
+REQUEST_STAGES = ("cf", "cbf", "combine", "enrich", "cold_start", "request")
+
+def peak_memory(fn):
+    """
+    Pico de memoria (bytes) reservada durante fn(), según tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        return tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def per_call(fn, args_list: list, repeats: int):
+    """
+    Mediana del tiempo por llamada (segundos) de 'repeats' pasadas sobre todos los argumentos.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for args in args_list:
+            fn(*args)
+        timings.append((time.perf_counter() - start) / len(args_list))
+    return statistics.median(timings)
+
+def fresh_service(directory: str):
+    """
+    Servicio con componentes propios (no los compartidos del proceso) y snapshots en 'directory'.
+    """
+    service = RecommenderService()
+    service.cooc_index = ItemCooccurrenceIndex()
+    service.popularity = PopularityIndex()
+    service.item_features = ItemFeatureCache(ttl_seconds=10**9)
+    service.content_index = ContentIndex()
+    service.snapshots = ModelSnapshotStore(directory, keep=1)
+    service.similarity_model = SimilarityModel(service.snapshots, poll_interval=10**9)
+    return service
+
+def benchmark_scale(dataset, k: int, sample: int, repeats: int, cbf_backend: str = "genres"):
+    results = {"dataset": dataset.describe(), "time_s": {}, "peak_bytes": {}}
+    times, peaks = results["time_s"], results["peak_bytes"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        service = fresh_service(directory)
+        service.CBF_BACKEND = cbf_backend
+
+        # --- Entrenamiento ---
+        def features():
+            service.item_features.seed(dataset.item_features(), None)
+        def fit():
+            return service.fit_similarity(dataset.purchase_user_ids, dataset.purchase_item_ids)
+        def publish(model):
+            service.cooc_index.rebuild(model[0], model[1])
+            service.popularity.build(dataset.sales(), dataset.genre_item_ids.tolist(), dataset.genre_genre_ids.tolist())
+        def content():
+            item_ids, attributes = item_attributes(pd.DataFrame(list(dataset.details_map().values())))
+            service.content_index.build(item_ids, dataset.genre_item_ids, dataset.genre_genre_ids, attributes)
+        def snapshot(model):
+            service._save_snapshot(*model, dataset.compra_ids)
+        def load():
+            service.cooc_index.load_arrays(service.snapshots.load_latest().arrays)
+
+        peaks["features"] = peak_memory(features)
+        _, times["features"] = timed(features)
+        peaks["fit"] = peak_memory(fit)
+        model, times["fit"] = timed(fit)
+        peaks["publish"] = peak_memory(lambda: publish(model))
+        _, times["publish"] = timed(lambda: publish(model))
+        if cbf_backend == "attributes":
+            peaks["content"] = peak_memory(content)
+            _, times["content"] = timed(content)
+            results["content_neighbors"] = int(service.content_index.neighbor_matrix.nnz)
+        peaks["snapshot"] = peak_memory(lambda: snapshot(model))
+        _, times["snapshot"] = timed(lambda: snapshot(model))
+        peaks["load"] = peak_memory(load)
+        _, times["load"] = timed(load)
+        results["similarity_pairs"] = int(len(model[2]))
+        assert service.similarity_model.available(), "el modelo CF no quedó mapeado"
+
+        # --- Por request ---
+        contexts = dataset.contexts(sample)
+        cold = dataset.cold_contexts(sample)
+        details = dataset.details_map()
+
+        inputs = []
+        for context in contexts:
+            w_cf, w_cbf = (float(w) for w in hybrid_weights(context.purchase_count))
+            cf = service._get_collaborative_filtering_candidates(context)
+            # Como en _rank_hybrid: sólo lo que puede entrar al Top K más los candidatos CF
+            cbf = service._get_content_based_candidates(context, k, cf[0])
+            ranked = service._combine_and_rank(context, cf, cbf, w_cf, w_cbf, k)
+            item_details = {r["item_id"]: details[r["item_id"]] for r in ranked}
+            inputs.append((context, cf, cbf, w_cf, w_cbf, ranked, item_details))
+
+        def request(context):
+            raw = service._rank_hybrid(context, k)
+            return service._enrich_results(raw, {r["item_id"]: details[r["item_id"]] for r in raw})
+
+        stages = {
+            "cf": (service._get_collaborative_filtering_candidates, [(c,) for c in contexts]),
+            "cbf": (lambda c, cf: service._get_content_based_candidates(c, k, cf[0]), [row[:2] for row in inputs]),
+            "combine": (lambda c, cf, cbf, w1, w2: service._combine_and_rank(c, cf, cbf, w1, w2, k),
+                        [row[:5] for row in inputs]),
+            "enrich": (service._enrich_results, [row[5:] for row in inputs]),
+            "cold_start": (lambda c: service._get_cold_start_items(c, k), [(c,) for c in cold]),
+            "request": (request, [(c,) for c in contexts]),
+        }
+        for name, (fn, args_list) in stages.items():
+            if not args_list:
+                continue
+            times[name] = per_call(fn, args_list, repeats)
+            # Pico del peor caso entre algunos usuarios de la muestra
+            peaks[name] = max(peak_memory(lambda: fn(*args)) for args in args_list[:10])
+
+    return results
+
+def format_time(seconds: float):
+    if seconds is None:
+        return "-"
+    if seconds >= 1:
+        return f"{seconds:.2f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds * 1e6:.0f} µs"
+
+def format_bytes(value: int):
+    if value is None:
+        return "-"
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+    return f"{value:.1f} GiB"
+
+def print_table(all_results: list):
+    headers = [f"{r['dataset']['items']}i/{r['dataset']['users']}u/{r['dataset']['purchases']}c" for r in all_results]
+    width = max(18, *(len(h) for h in headers))
+    print(f"\n{'etapa':>11} | " + " | ".join(f"{h:>{width}}" for h in headers))
+    print(f"{'':>11} | " + " | ".join(f"{'tiempo / pico mem':>{width}}" for _ in headers))
+    for stage in TRAIN_STAGES + REQUEST_STAGES:
+        cells = []
+        for r in all_results:
+            cell = f"{format_time(r['time_s'].get(stage))} / {format_bytes(r['peak_bytes'].get(stage))}"
+            cells.append(f"{cell:>{width}}")
+        print(f"{stage:>11} | " + " | ".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo y memoria por etapa del recomendador sobre datos sintéticos")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 50],
+                        help=f"múltiplos del tamaño del seeder ({BASE_ITEMS} ítems, {BASE_USERS} usuarios)")
+    parser.add_argument("--purchases", type=int, nargs=2, default=[10, 40], metavar=("MIN", "MAX"),
+                        help="rango de compras por usuario")
+    parser.add_argument("--genre-skew", type=float, default=1.0, help="0 = géneros parejos; más alto = más concentrados")
+    parser.add_argument("--cbf-backend", choices=["genres", "attributes"], default="genres",
+                        help="backend Content-Based medido (attributes suma la etapa 'content')")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--sample", type=int, default=200, help="usuarios medidos por etapa de request")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="archivo JSON donde guardar los resultados")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    all_results = []
+    for scale in args.scales:
+        dataset = generate_dataset(
+            n_items=max(10, int(BASE_ITEMS * scale)), n_users=max(10, int(BASE_USERS * scale)),
+            purchases_per_user=tuple(args.purchases), genre_skew=args.genre_skew, seed=args.seed,
+        )
+        print(f"Escala x{scale:g}: {dataset.describe()}")
+        result = benchmark_scale(dataset, args.k, args.sample, args.repeats, args.cbf_backend)
+        result["scale"] = scale
+        all_results.append(result)
+
+    print_table(all_results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": all_results}, f, indent=2)
+        print(f"\nResultados guardados en {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import numpy as np
+from src.services.catalog import ItemFeatures
+from src.services.user_context import UserContext
+
+# Datos sintéticos con la misma forma que los de database_scripts/seeder.sql, pero a cualquier escala.
+#
+# - 30 géneros; cada ítem tiene de 1 a 3. Con 'genre_skew' > 0 unos géneros concentran más ítems
+#   (peso 1 / rango^skew); con 0 se reparten parejo.
+# - Usuarios con los 5 arquetipos del seeder (proporción y fidelidad): cada compra es, con
+#   probabilidad = fidelidad, un ítem de los géneros del arquetipo y si no, cualquiera del catálogo.
+#   3 géneros favoritos del arquetipo (el explorador, 3 cualesquiera). Sin compras repetidas.
+# - Además, usuarios sin compras (sólo preferencias) para el Cold Start.
+
+N_GENRES = 30
+
+# (nombre, géneros, fidelidad, proporción de usuarios), como en seeder.sql
+ARCHETYPES = (
+    ("rockero", (1, 2, 3, 4, 5, 6, 7, 8, 9, 10), 0.80, 0.30),
+    ("pop", (12, 13, 14, 15, 30, 18), 0.70, 0.25),
+    ("urbano", (16, 17, 18, 19, 30), 0.80, 0.20),
+    ("nicho", (20, 21, 22, 23, 24, 25, 26, 27, 28, 29), 0.90, 0.15),
+    ("explorador", None, 0.0, 0.10),
+)
+
+COUNTRIES = ("Argentina", "Estados Unidos", "Reino Unido", "México", "España", "Brasil", "Jamaica")
+LANGUAGES = ("Español", "Inglés", "Portugués", "Instrumental")
+
+class SyntheticDataset:
+    """
+    Catálogo, usuarios y compras generados. Los arrays siguen el formato de las tablas:
+    pares (item_id, genero_id) de ItemGeneros y (compra_id, user_id, item_id) de Compras.
+    """
+
+    def __init__(self, item_ids, genre_pairs, user_ids, archetypes, preferences, purchases, cold_user_ids, cold_preferences):
+        self.item_ids = item_ids
+        self.genre_ids = np.arange(1, N_GENRES + 1, dtype=np.int64)
+        self.genre_item_ids, self.genre_genre_ids = genre_pairs
+        self.user_ids = user_ids
+        self.archetypes = archetypes
+        self.preferences = preferences
+        self.purchase_user_ids, self.purchase_item_ids = purchases
+        self.compra_ids = np.arange(1, len(self.purchase_user_ids) + 1, dtype=np.int64)
+        self.cold_user_ids = cold_user_ids
+        self.cold_preferences = cold_preferences
+
+    def describe(self):
+        return {
+            "items": int(len(self.item_ids)),
+            "users": int(len(self.user_ids)),
+            "cold_users": int(len(self.cold_user_ids)),
+            "purchases": int(len(self.compra_ids)),
+            "item_genres": int(len(self.genre_item_ids)),
+        }
+
+    def item_features(self):
+        """
+        Matriz Item-Género, como la arma ItemFeatureCache desde la BD.
+        """
+        matrix = np.zeros((len(self.item_ids), N_GENRES), dtype=np.float64)
+        matrix[np.searchsorted(self.item_ids, self.genre_item_ids), self.genre_genre_ids - 1] = 1.0
+        return ItemFeatures(self.item_ids, self.genre_ids, matrix)
+
+    def sales(self):
+        """
+        { item_id: ventas } de todo el catálogo (como la consulta de PopularityIndex.rebuild).
+        """
+        counts = np.bincount(np.searchsorted(self.item_ids, self.purchase_item_ids), minlength=len(self.item_ids))
+        return dict(zip(self.item_ids.tolist(), counts.tolist()))
+
+    def details_map(self):
+        """
+        Filas de Items por item_id, con las columnas que usa el enriquecimiento.
+        """
+        return {
+            iid: {
+                "item_id": iid,
+                "titulo": f"Álbum {iid}",
+                "artista": f"Artista {iid % 997}",
+                "anio": 1960 + iid % 65,
+                "pais": COUNTRIES[iid % len(COUNTRIES)],
+                "idioma": LANGUAGES[iid % len(LANGUAGES)],
+            }
+            for iid in self.item_ids.tolist()
+        }
+
+    def contexts(self, limit: int = None):
+        """
+        UserContext de los usuarios con compras (los primeros 'limit').
+        """
+        order = np.argsort(self.purchase_user_ids, kind="stable")
+        users, starts = np.unique(self.purchase_user_ids[order], return_index=True)
+        items_by_user = np.split(self.purchase_item_ids[order], starts[1:])
+        prefs = dict(zip(self.user_ids.tolist(), self.preferences))
+        count = len(users) if limit is None else min(limit, len(users))
+        return [
+            UserContext(user_id=int(uid), preferences=prefs[int(uid)], purchases=items_by_user[idx].tolist())
+            for idx, uid in enumerate(users[:count])
+        ]
+
+    def cold_contexts(self, limit: int = None):
+        count = len(self.cold_user_ids) if limit is None else min(limit, len(self.cold_user_ids))
+        return [
+            UserContext(user_id=int(uid), preferences=self.cold_preferences[idx])
+            for idx, uid in enumerate(self.cold_user_ids[:count].tolist())
+        ]
+
+def _genre_weights(genre_skew: float, rng):
+    ranks = rng.permutation(N_GENRES) + 1
+    weights = 1.0 / ranks.astype(np.float64) ** genre_skew
+    return weights / weights.sum()
+
+def _pick_preferences(genres, count: int, rng):
+    genres = np.asarray(genres)
+    picks = np.argsort(rng.random((count, len(genres))), axis=1)[:, :3]
+    return genres[picks].tolist()
+
+def generate_dataset(n_items: int, n_users: int, purchases_per_user=(10, 40), genre_skew: float = 1.0,
+                     cold_users: int = None, seed: int = 42):
+    """
+    Genera un SyntheticDataset. 'purchases_per_user' es el rango (inclusive) de compras por usuario
+    (como el seeder, entre 10 y 40); 'cold_users' por defecto es el 10% de 'n_users'.
+    """
+    rng = np.random.default_rng(seed)
+    cold_users = n_users // 10 if cold_users is None else cold_users
+
+    # Catálogo: 1 a 3 géneros por ítem, sorteados con el sesgo de géneros
+    item_ids = np.arange(1, n_items + 1, dtype=np.int64)
+    weights = _genre_weights(genre_skew, rng)
+    genres_per_item = rng.choice([1, 2, 3], size=n_items, p=[0.5, 0.35, 0.15])
+    pair_items = np.repeat(item_ids, genres_per_item)
+    pair_genres = rng.choice(N_GENRES, size=len(pair_items), p=weights) + 1
+    pairs = np.unique(np.stack([pair_items, pair_genres], axis=1), axis=0)
+    genre_item_ids, genre_genre_ids = pairs[:, 0], pairs[:, 1]
+
+    # Usuarios por arquetipo, compras y preferencias
+    user_ids = np.arange(1, n_users + 1, dtype=np.int64)
+    shares = np.array([a[3] for a in ARCHETYPES])
+    per_archetype = np.floor(shares * n_users).astype(int)
+    per_archetype[0] += n_users - per_archetype.sum()
+
+    archetypes = np.repeat(np.arange(len(ARCHETYPES)), per_archetype)
+    preferences = []
+    purchase_users = []
+    purchase_items = []
+    low, high = purchases_per_user
+    offset = 0
+    for idx, (_, genres, fidelity, _) in enumerate(ARCHETYPES):
+        users = user_ids[offset:offset + per_archetype[idx]]
+        offset += len(users)
+        if len(users) == 0:
+            continue
+
+        preferences += _pick_preferences(genres or range(1, N_GENRES + 1), len(users), rng)
+
+        counts = rng.integers(low, high + 1, size=len(users))
+        buyers = np.repeat(users, counts)
+        items = rng.choice(item_ids, size=len(buyers))
+
+        # Compras "fieles": un par al azar de ItemGeneros con un género del arquetipo
+        target_pairs = np.flatnonzero(np.isin(genre_genre_ids, genres)) if genres else np.array([], dtype=np.int64)
+        if len(target_pairs) > 0:
+            loyal = rng.random(len(buyers)) < fidelity
+            items[loyal] = genre_item_ids[rng.choice(target_pairs, size=int(loyal.sum()))]
+
+        purchase_users.append(buyers)
+        purchase_items.append(items)
+
+    purchases = np.stack([np.concatenate(purchase_users), np.concatenate(purchase_items)], axis=1)
+    # Sin compras repetidas del mismo ítem por usuario; el orden de llegada se mezcla
+    _, first = np.unique(purchases, axis=0, return_index=True)
+    purchases = purchases[np.sort(first)]
+    purchases = purchases[rng.permutation(len(purchases))]
+
+    cold_user_ids = np.arange(n_users + 1, n_users + cold_users + 1, dtype=np.int64)
+    cold_preferences = _pick_preferences(range(1, N_GENRES + 1), cold_users, rng) if cold_users else []
+
+    return SyntheticDataset(
+        item_ids, (genre_item_ids, genre_genre_ids), user_ids, archetypes, preferences,
+        (purchases[:, 0], purchases[:, 1]), cold_user_ids, cold_preferences,
+    )
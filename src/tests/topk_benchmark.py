@@ -0,0 +1,151 @@
+import time
+import argparse
+import tempfile
+import statistics
+import logging
+import numpy as np
+from src.services.catalog import ItemFeatures, ItemFeatureCache
+from src.services.similarity import SimilarityModel
+from src.services.snapshots import ModelSnapshotStore
+from src.services.user_context import UserContext
+from src.services.recommender import RecommenderService
+from src.services.scoring import hybrid_weights
+
+# Costo por request del ranking híbrido a medida que crece el catálogo (sin BD).
+#
+# Con catálogos sintéticos de distinto tamaño se mide cada etapa del camino de una recomendación:
+#  - cf:      candidatos Item-Item desde el modelo mapeado (CSR en un snapshot temporal)
+#  - cbf:     perfil del usuario vs firmas de géneros y Top K de los candidatos CBF (acotado por k)
+#  - cbf completo: los candidatos CBF de todo el catálogo (como antes), para comparar
+#  - ranking: combinación + booster + Top K con argpartition (lo que usa el servicio)
+#  - completo: la misma combinación sobre todos los candidatos CBF, ordenándolos (como antes)
+#
+# Uso: python -m src.tests.topk_benchmark --sizes 100 1000 10000 100000 --k 5
+
+N_GENRES = 20
+NEIGHBOURS = 50   # vecinos guardados por ítem (como SIMILARITY_TOP_K)
+PURCHASES = 20    # compras por usuario sintético
+PREFERENCES = 3   # géneros favoritos por usuario sintético
+
+def synthetic_features(n_items: int, rng):
+    """
+    Catálogo de 'n_items' ítems con 1 a 3 géneros cada uno.
+    """
+    matrix = np.zeros((n_items, N_GENRES), dtype=np.float64)
+    genres_per_item = rng.integers(1, 4, n_items)
+    for count in (1, 2, 3):
+        rows = np.flatnonzero(genres_per_item >= count)
+        matrix[rows, rng.integers(0, N_GENRES, len(rows))] = 1.0
+    return ItemFeatures(np.arange(1, n_items + 1, dtype=np.int64), np.arange(1, N_GENRES + 1, dtype=np.int64), matrix)
+
+def synthetic_similarity(n_items: int, rng):
+    """
+    Similitud Item-Item podada en CSR: NEIGHBOURS vecinos al azar por ítem.
+    """
+    width = min(NEIGHBOURS, n_items - 1)
+    indptr = np.arange(n_items + 1, dtype=np.int64) * width
+    indices = np.empty(n_items * width, dtype=np.int32)
+    for row in range(n_items):
+        neighbours = rng.choice(n_items - 1, width, replace=False)
+        neighbours[neighbours >= row] += 1 # sin el propio ítem
+        indices[row * width:(row + 1) * width] = np.sort(neighbours)
+    scores = rng.random(n_items * width).astype(np.float32)
+    return indptr, indices, scores
+
+def synthetic_users(n_items: int, n_users: int, rng):
+    return [
+        UserContext(
+            user_id=uid,
+            preferences=rng.choice(np.arange(1, N_GENRES + 1), PREFERENCES, replace=False).tolist(),
+            purchases=rng.integers(1, n_items + 1, min(PURCHASES, n_items // 2)).tolist(),
+        )
+        for uid in range(n_users)
+    ]
+
+def build_service(n_items: int, directory: str, rng):
+    features = synthetic_features(n_items, rng)
+    indptr, indices, scores = synthetic_similarity(n_items, rng)
+
+    store = ModelSnapshotStore(directory, keep=1)
+    store.save({
+        "item_ids": features.item_ids.astype(np.int32),
+        "similarity_indptr": indptr,
+        "similarity_indices": indices,
+        "similarity_scores": scores,
+    }, {"watermark": 0})
+
+    service = RecommenderService()
+    service.item_features = ItemFeatureCache(ttl_seconds=10**9)
+    service.item_features.seed(features, None)
+    service.similarity_model = SimilarityModel(store, poll_interval=10**9)
+    service.similarity_model.refresh()
+    return service
+
+def measure(fn, contexts: list, repeats: int):
+    """
+    Mediana (µs) de 'repeats' pasadas sobre todos los usuarios.
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for context in contexts:
+            fn(context)
+        timings.append((time.perf_counter() - start) / len(contexts) * 1e6)
+    return statistics.median(timings)
+
+def benchmark_size(n_items: int, n_users: int, k: int, repeats: int, rng):
+    with tempfile.TemporaryDirectory() as directory:
+        service = build_service(n_items, directory, rng)
+        contexts = synthetic_users(n_items, n_users, rng)
+
+        # Candidatos precalculados para aislar el costo de cada etapa
+        stages = {}
+        for context in contexts:
+            w_cf, w_cbf = (float(w) for w in hybrid_weights(context.purchase_count))
+            cf = service._get_collaborative_filtering_candidates(context)
+            cbf = service._get_content_based_candidates(context, k, cf[0])
+            cbf_full = service._get_content_based_candidates(context)
+            stages[context.user_id] = (cf, cbf, cbf_full, w_cf, w_cbf)
+
+            # Ambos caminos (Top K sobre los candidatos CBF recortados y orden completo) deben devolver lo mismo
+            top = service._combine_and_rank(context, cf, cbf, w_cf, w_cbf, k)
+            full = service._combine_and_rank(context, cf, cbf_full, w_cf, w_cbf)[:k]
+            assert top == full, f"Top K distinto para el usuario {context.user_id}"
+
+        def ranking(context):
+            cf, cbf, _, w_cf, w_cbf = stages[context.user_id]
+            return service._combine_and_rank(context, cf, cbf, w_cf, w_cbf, k)
+
+        def full_sort(context):
+            cf, _, cbf_full, w_cf, w_cbf = stages[context.user_id]
+            return service._combine_and_rank(context, cf, cbf_full, w_cf, w_cbf)[:k]
+
+        return {
+            "cf": measure(service._get_collaborative_filtering_candidates, contexts, repeats),
+            "cbf": measure(lambda context: service._get_content_based_candidates(context, k, stages[context.user_id][0][0]), contexts, repeats),
+            "cbf completo": measure(service._get_content_based_candidates, contexts, repeats),
+            "ranking": measure(ranking, contexts, repeats),
+            "completo": measure(full_sort, contexts, repeats),
+            "total": measure(lambda context: service._rank_hybrid(context, k), contexts, repeats),
+        }
+
+def main(sizes: list, n_users: int, k: int, repeats: int, seed: int):
+    rng = np.random.default_rng(seed)
+    print(f"\n=== COSTO POR REQUEST (µs, mediana) | {n_users} usuarios, k={k} ===")
+    print(f"{'ítems':>8} | {'cf':>8} | {'cbf':>8} | {'cbf completo':>12} | {'ranking':>8} | {'completo':>9} | {'total':>8}")
+    for n_items in sizes:
+        r = benchmark_size(n_items, n_users, k, repeats, rng)
+        print(f"{n_items:>8} | {r['cf']:8.1f} | {r['cbf']:8.1f} | {r['cbf completo']:12.1f} | {r['ranking']:8.1f} | {r['completo']:9.1f} | {r['total']:8.1f}")
+
+if __name__ == "__main__":
+    logging.disable(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Costo del ranking híbrido según el tamaño del catálogo")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    main(args.sizes, args.users, args.k, args.repeats, args.seed)